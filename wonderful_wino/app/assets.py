@@ -0,0 +1,378 @@
+import gzip
+import hashlib
+import logging
+import os
+import re
+import threading
+from flask import current_app, request
+from . import config
+
+try:
+    import brotli
+except ImportError:  # Optional; assets are still precompressed with gzip
+    brotli = None
+
+# Set up a logger specific to this module
+logger = logging.getLogger(__name__)
+
+# Startup build of the web UI.
+#
+# Unbuilt, the page needs index.html, style.css, nine ES modules and nine HTML
+# components fetched one by one. The build turns that into three responses:
+#
+#   index.html            components inlined into their data-component elements
+#   assets/app.<hash>.js  the ES modules from js/main.js bundled into one module
+#   assets/style.<hash>.css
+#
+# The JS and CSS are minified (comments and indentation removed) and kept in
+# memory with gzip and brotli variants compressed once at maximum level. Hashed
+# files are served with immutable cache headers, so a browser fetches them once
+# per release; index.html is revalidated with its ETag.
+#
+# Bundling relies on the modules sharing one scope: imports are dropped, the
+# "export" keywords removed, and `import * as x` gets a namespace object with
+# getters (so state.js's live bindings keep working). Modules are concatenated
+# in ES evaluation order. Anything it can't handle (aliased or default imports,
+# clashing top-level names) fails the build and the unbuilt files are served.
+# The build reruns when a source file changes.
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+class BuildError(Exception):
+    pass
+
+class _Asset:
+    def __init__(self, data: bytes, mimetype: str):
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(data).hexdigest()[:16]
+        self.variants = {"identity": data, "gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(data, quality=11)
+
+_lock = threading.Lock()
+_built = None          # {"index.html": _Asset, "assets/app.<hash>.js": _Asset, ...}
+_source_mtimes = None  # {path: mtime} of the files the build read
+_attempted = False
+
+# --- Minifiers ---
+
+_JS_REGEX_PREFIX = set("(,=:[!&|?{};+-*%<>~^")
+_JS_REGEX_KEYWORDS = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void",
+                      "throw", "instanceof", "yield", "await"}
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char in "_$" or ord(char) > 127
+
+class _JsMinifier:
+    """Removes comments and redundant whitespace; strings, templates and regex literals are copied as-is."""
+
+    def __init__(self, source: str):
+        self.src = source
+        self.pos = 0
+        self.out = []
+
+    def _last_char(self) -> str:
+        for chunk in reversed(self.out):
+            if chunk.strip():
+                return chunk.rstrip()[-1]
+        return ""
+
+    def _last_word(self) -> str:
+        text = "".join(self.out[-12:]).rstrip()
+        match = re.search(r"[A-Za-z_$][\w$]*$", text)
+        return match.group(0) if match else ""
+
+    def _copy_quoted(self, quote: str):
+        start = self.pos
+        self.pos += 1
+        while self.pos < len(self.src):
+            char = self.src[self.pos]
+            if char == "\\":
+                self.pos += 2
+                continue
+            self.pos += 1
+            if char == quote:
+                self.out.append(self.src[start:self.pos])
+                return
+            if char == "\n":
+                break
+        raise BuildError(f"unterminated string at offset {start}")
+
+    def _copy_template(self):
+        start = self.pos
+        self.pos += 1
+        chunk_start = start
+        while self.pos < len(self.src):
+            char = self.src[self.pos]
+            if char == "\\":
+                self.pos += 2
+            elif char == "`":
+                self.pos += 1
+                self.out.append(self.src[chunk_start:self.pos])
+                return
+            elif self.src.startswith("${", self.pos):
+                self.pos += 2
+                self.out.append(self.src[chunk_start:self.pos])
+                self._code(until_brace=True)
+                chunk_start = self.pos
+                self.pos += 1  # the closing brace is copied with the next chunk
+            else:
+                self.pos += 1
+        raise BuildError(f"unterminated template literal at offset {start}")
+
+    def _copy_regex(self):
+        start = self.pos
+        self.pos += 1
+        in_class = False
+        while self.pos < len(self.src):
+            char = self.src[self.pos]
+            if char == "\\":
+                self.pos += 2
+                continue
+            self.pos += 1
+            if char == "[":
+                in_class = True
+            elif char == "]":
+                in_class = False
+            elif char == "/" and not in_class:
+                while self.pos < len(self.src) and _is_word_char(self.src[self.pos]):
+                    self.pos += 1
+                self.out.append(self.src[start:self.pos])
+                return
+            elif char == "\n":
+                break
+        raise BuildError(f"unterminated regex literal at offset {start}")
+
+    def _whitespace(self):
+        start = self.pos
+        while self.pos < len(self.src) and self.src[self.pos].isspace():
+            self.pos += 1
+        self._separator("\n" in self.src[start:self.pos])
+
+    def _separator(self, newline: bool):
+        previous = self._last_char()
+        following = self.src[self.pos] if self.pos < len(self.src) else ""
+        if not previous or not following:
+            return
+        if newline:
+            # Line breaks are kept so automatic semicolon insertion behaves the same.
+            if self.out and self.out[-1] != "\n":
+                self.out.append("\n")
+        elif (_is_word_char(previous) and _is_word_char(following)) or (previous in "+-" and following in "+-"):
+            self.out.append(" ")
+
+    def _code(self, until_brace: bool = False):
+        depth = 0
+        src = self.src
+        while self.pos < len(src):
+            char = src[self.pos]
+            if char.isspace():
+                self._whitespace()
+            elif src.startswith("//", self.pos):
+                end = src.find("\n", self.pos)
+                self.pos = len(src) if end == -1 else end
+            elif src.startswith("/*", self.pos):
+                end = src.find("*/", self.pos + 2)
+                if end == -1:
+                    raise BuildError(f"unterminated comment at offset {self.pos}")
+                newline = "\n" in src[self.pos:end]
+                self.pos = end + 2
+                if self.pos < len(src) and not src[self.pos].isspace():
+                    self._separator(newline)
+            elif char in "'\"":
+                self._copy_quoted(char)
+            elif char == "`":
+                self._copy_template()
+            elif char == "/" and (self._last_char() in _JS_REGEX_PREFIX or self._last_word() in _JS_REGEX_KEYWORDS):
+                self._copy_regex()
+            else:
+                if char == "{":
+                    depth += 1
+                elif char == "}":
+                    if until_brace and depth == 0:
+                        return
+                    depth -= 1
+                self.out.append(char)
+                self.pos += 1
+        if until_brace:
+            raise BuildError("unterminated template expression")
+
+    def run(self) -> str:
+        self._code()
+        return "".join(self.out).strip() + "\n"
+
+def minify_js(source: str) -> str:
+    return _JsMinifier(source).run()
+
+def minify_css(source: str) -> str:
+    """Removes comments and collapses whitespace, keeping strings intact."""
+    tokens = [token for token in re.findall(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*[\s\S]*?\*/|\s+|[^"\'/\s]+|/', source)
+              if not token.startswith("/*")]
+    out = []
+    for i, token in enumerate(tokens):
+        if token.isspace():
+            following = tokens[i + 1] if i + 1 < len(tokens) else ""
+            if not out or not following or out[-1][-1] in "{};," or following[0] in "{};,":
+                continue
+            token = " "
+        out.append(token)
+    return "".join(out).replace(";}", "}").strip() + "\n"
+
+# --- JS bundler ---
+
+_IMPORT_RE = re.compile(r"^import\s+([\s\S]*?)\s+from\s+['\"]([^'\"]+)['\"];?[ \t]*$", re.MULTILINE)
+_EXPORT_DECLARATION_RE = re.compile(r"^export\s+((?:async\s+)?function\*?|const|let|var|class)\s+([A-Za-z_$][\w$]*)", re.MULTILINE)
+_TOP_LEVEL_RE = re.compile(r"^(?:export\s+)?(?:(?:async\s+)?function\*?|const|let|var|class)\s+([A-Za-z_$][\w$]*)", re.MULTILINE)
+
+def _read(path: str, sources: dict) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    sources[path] = os.path.getmtime(path)
+    return text
+
+def _parse_module(path: str, sources: dict) -> dict:
+    text = _read(path, sources)
+    imports, namespaces = [], {}
+    for clause, specifier in _IMPORT_RE.findall(text):
+        if not specifier.startswith("."):
+            raise BuildError(f"{path}: only relative imports can be bundled ({specifier})")
+        dependency = os.path.normpath(os.path.join(os.path.dirname(path), specifier))
+        imports.append(dependency)
+        clause = re.sub(r"//[^\n]*|/\*[\s\S]*?\*/", "", clause).strip()
+        namespace = re.fullmatch(r"\*\s+as\s+([A-Za-z_$][\w$]*)", clause)
+        if namespace:
+            namespaces[namespace.group(1)] = dependency
+        elif not re.fullmatch(r"\{[\w$\s,]*\}", clause):
+            raise BuildError(f"{path}: unsupported import form: import {clause}")
+    body = _IMPORT_RE.sub("", text)
+    if re.search(r"^export\s+(?!(?:async\s+)?function|const|let|var|class)", body, re.MULTILINE):
+        raise BuildError(f"{path}: only exported declarations can be bundled")
+    return {
+        "imports": imports,
+        "namespaces": namespaces,
+        "exports": [name for _, name in _EXPORT_DECLARATION_RE.findall(body)],
+        "declared": _TOP_LEVEL_RE.findall(body),
+        "body": re.sub(r"^export\s+", "", body, flags=re.MULTILINE),
+    }
+
+def bundle_js(entry: str, sources: dict) -> str:
+    """Concatenates entry and its imports in ES module evaluation order (depth-first, post-order)."""
+    modules, order = {}, []
+
+    def visit(path):
+        if path in modules:
+            return
+        modules[path] = _parse_module(path, sources)
+        for dependency in modules[path]["imports"]:
+            visit(dependency)
+        order.append(path)
+    visit(os.path.normpath(entry))
+
+    owners = {}
+    for path in order:
+        for name in modules[path]["declared"]:
+            if name in owners:
+                raise BuildError(f"top-level name '{name}' is declared in both {owners[name]} and {path}")
+            owners[name] = path
+    namespaces = {}
+    for path in order:
+        for name, target in modules[path]["namespaces"].items():
+            if namespaces.setdefault(name, target) != target or name in owners:
+                raise BuildError(f"namespace import '{name}' in {path} clashes with another name")
+
+    parts = []
+    for path in order:
+        parts.append(modules[path]["body"])
+        for name, target in namespaces.items():
+            if target == path:
+                getters = ", ".join(f"get {export}() {{ return {export}; }}" for export in modules[path]["exports"])
+                parts.append(f"const {name} = Object.freeze({{ {getters} }});\n")
+    return "\n".join(parts)
+
+# --- Build ---
+
+_COMPONENT_RE = re.compile(r'(<(\w+)\b[^>]*?)\s+data-component="([^"]*)"([^>]*>)\s*(</\2>)')
+_STYLESHEET_RE = re.compile(r'<link rel="stylesheet" href="(?!https?:)([^"]+\.css)">')
+_MODULE_SCRIPT_RE = re.compile(r'<script type="module" src="(?!https?:)([^"]+\.js)"></script>')
+
+def _hashed_name(path: str, data: bytes) -> str:
+    stem, extension = os.path.splitext(os.path.basename(path))
+    return f"assets/{stem}.{hashlib.sha256(data).hexdigest()[:10]}{extension}"
+
+def _build(sources: dict) -> dict:
+    files = {}
+    index = _read(os.path.join(FRONTEND_DIR, "index.html"), sources)
+
+    def inline_components(match):
+        urls = match.group(3).split()
+        html = "".join(_read(os.path.join(FRONTEND_DIR, url), sources) for url in urls)
+        return f"{match.group(1)}{match.group(4)}\n{html}\n{match.group(5)}"
+
+    def bundle_stylesheet(match):
+        css = minify_css(_read(os.path.join(FRONTEND_DIR, match.group(1)), sources)).encode()
+        name = _hashed_name(match.group(1), css)
+        files[name] = _Asset(css, "text/css")
+        return f'<link rel="stylesheet" href="{name}">'
+
+    def bundle_script(match):
+        js = minify_js(bundle_js(os.path.join(FRONTEND_DIR, match.group(1)), sources)).encode()
+        name = _hashed_name("app.js", js)
+        files[name] = _Asset(js, "application/javascript")
+        return f'<script type="module" src="{name}"></script>'
+
+    index = _COMPONENT_RE.sub(inline_components, index)
+    index = _STYLESHEET_RE.sub(bundle_stylesheet, index)
+    index = _MODULE_SCRIPT_RE.sub(bundle_script, index)
+    files["index.html"] = _Asset(index.encode(), "text/html")
+    return files
+
+def _sources_changed() -> bool:
+    try:
+        return any(os.path.getmtime(path) != mtime for path, mtime in _source_mtimes.items())
+    except OSError:
+        return True
+
+def build() -> bool:
+    """(Re)builds the bundled UI. On failure the unbuilt frontend files are served instead."""
+    global _built, _source_mtimes, _attempted
+    with _lock:
+        _attempted = True
+        # Filled in as files are read, so a failed build is retried once one of them changes.
+        sources = {}
+        try:
+            files = _build(sources)
+        except (BuildError, OSError, UnicodeDecodeError) as e:
+            logger.warning(f"Frontend asset build failed; serving unbuilt files: {e}")
+            _built, _source_mtimes = None, sources
+            return False
+        _built, _source_mtimes = files, sources
+    sizes = ", ".join(f"{name} {len(asset.variants['identity']) // 1024} KB" for name, asset in files.items())
+    logger.info(f"Built frontend assets from {len(sources)} files: {sizes}.")
+    return True
+
+def _current_build():
+    if not config.ASSET_PIPELINE:
+        return None
+    if not _attempted or (_source_mtimes is not None and _sources_changed()):
+        build()
+    return _built
+
+def response_for(name: str):
+    """Returns a response for a built file ('index.html' or 'assets/...'), or None to fall back to the frontend directory."""
+    files = _current_build()
+    asset = files.get(name) if files else None
+    if asset is None:
+        return None
+    if request.if_none_match.contains_weak(asset.etag):
+        response = current_app.response_class(status=304)
+    else:
+        encodings = [e for e in asset.variants if e != "identity"] if config.RESPONSE_COMPRESSION else []
+        encoding = request.accept_encodings.best_match(encodings) or "identity"
+        response = current_app.response_class(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+    response.set_etag(asset.etag, weak=True)
+    response.headers["Cache-Control"] = "no-cache" if name == "index.html" else IMMUTABLE_CACHE_CONTROL
+    return response
@@ -0,0 +1,148 @@
+import json
+import logging
+import queue
+import threading
+import time
+from . import config, consumption_stats, db, ha_service, outbox
+
+# Set up a logger specific to this module
+logger = logging.getLogger(__name__)
+
+# MQTT command topics, so HA automations can consume/acquire a bottle without
+# going through ingress and the /api/consume-wine text matching.
+#
+#   wonderful_wino/cmd/consume   {"wine_id": 12, "rating": 4.2, "request_id": "abc"}
+#   wonderful_wino/cmd/acquire   {"vivino_url": "https://...", "quantity": 2}
+#
+# The MQTT network thread only parses the payload and queues it; the database
+# work runs on a dedicated worker thread. The outcome is published (not retained) on
+# wonderful_wino/response/<command>, echoing request_id if one was given.
+
+COMMAND_TOPIC_PREFIX = "wonderful_wino/cmd/"
+RESPONSE_TOPIC_PREFIX = "wonderful_wino/response/"
+COMMAND_QUEUE_SIZE = 100
+
+# A single worker keeps commands in arrival order.
+_queue = queue.Queue(maxsize=COMMAND_QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+
+def _resolve_wine(payload: dict):
+    """Looks the wine up by 'wine_id' or 'vivino_url' (alias 'url')."""
+    wine_id = payload.get('wine_id', payload.get('id'))
+    if wine_id is not None:
+        try:
+            return db.get_wine_by_id(int(wine_id))
+        except (TypeError, ValueError):
+            return None
+    vivino_url = payload.get('vivino_url') or payload.get('url')
+    if vivino_url:
+        return db.get_wine_by_url(vivino_url)
+    return None
+
+def _consume(wine: dict, payload: dict):
+    rating = payload.get('rating')
+    if rating is not None:
+        try:
+            rating = float(rating)
+        except (TypeError, ValueError):
+            return ("error", "Rating must be a number.", None)
+    return db.atomically_consume_wine(wine['vivino_url'], rating)
+
+def _acquire(wine: dict, payload: dict):
+    quantity = payload.get('quantity', 1)
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+        return ("error", "Quantity must be a positive integer.", None)
+    return db.atomically_acquire_wine(wine['vivino_url'], quantity)
+
+COMMANDS = {
+    'consume': _consume,
+    'acquire': _acquire,
+}
+
+def execute_command(command: str, payload: dict) -> dict:
+    """Runs one command and returns the response document."""
+    handler = COMMANDS.get(command)
+    if handler is None:
+        return {"status": "error", "message": f"Unknown command '{command}'."}
+    if not isinstance(payload, dict):
+        return {"status": "error", "message": "Payload must be a JSON object."}
+
+    wine = _resolve_wine(payload)
+    if not wine:
+        return {"status": "error", "message": "No matching wine found. Send 'wine_id' or 'vivino_url'."}
+
+    status, message, updated_wine = handler(wine, payload)
+    response = {"wine_id": wine['id'], "vivino_url": wine['vivino_url'], "name": wine.get('name'), "vintage": wine.get('vintage')}
+    if status == "success":
+        outbox.notify()
+        if command == 'consume':
+            consumption_stats.record_consumption(payload.get('rating'))
+        ha_service.request_sensor_refresh()
+        response.update(status="success", quantity=message)
+    elif message == "Quantity already zero":
+        response.update(status="warning", message=message, quantity=0)
+    else:
+        response.update(status="error", message=message)
+    return response
+
+def _publish_response(command: str, response: dict):
+    topic = f"{RESPONSE_TOPIC_PREFIX}{command}"
+    if not ha_service.publish_mqtt_message(topic, json.dumps(response), qos=1):
+        logger.warning(f"Could not publish MQTT command response on {topic}: not connected.")
+
+def _handle_command(command: str, payload, received_at: float):
+    try:
+        response = execute_command(command, payload)
+    except Exception as e:
+        logger.error(f"MQTT command '{command}' failed: {e}", exc_info=True)
+        response = {"status": "error", "message": "An internal error occurred."}
+    if isinstance(payload, dict) and 'request_id' in payload:
+        response['request_id'] = payload['request_id']
+    response['command'] = command
+    response['elapsed_ms'] = round((time.monotonic() - received_at) * 1000, 1)
+    logger.info(f"MQTT command '{command}' -> {response['status']} in {response['elapsed_ms']} ms.")
+    _publish_response(command, response)
+
+def _run_worker():
+    while True:
+        command, payload, received_at = _queue.get()
+        try:
+            _handle_command(command, payload, received_at)
+        finally:
+            _queue.task_done()
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name="mqtt-commands", daemon=True)
+            _worker.start()
+
+def on_command_message(client, userdata, message):
+    """MQTT callback: parses the command and queues it for the worker (never blocks the network loop)."""
+    received_at = time.monotonic()
+    command = message.topic[len(COMMAND_TOPIC_PREFIX):]
+    try:
+        payload = json.loads(message.payload.decode('utf-8')) if message.payload else {}
+    except (UnicodeDecodeError, ValueError):
+        _publish_response(command, {"command": command, "status": "error", "message": "Payload is not valid JSON."})
+        return
+    _ensure_worker()
+    try:
+        _queue.put_nowait((command, payload, received_at))
+    except queue.Full:
+        logger.warning(f"MQTT command queue full; rejecting '{command}'.")
+        response = {"command": command, "status": "error", "message": "Busy, try again."}
+        if isinstance(payload, dict) and 'request_id' in payload:
+            response['request_id'] = payload['request_id']
+        _publish_response(command, response)
+
+def register():
+    """Subscribes to the command topics on the shared MQTT client (if enabled). Call before ha_service.initialize_mqtt()."""
+    if not config.MQTT_COMMANDS:
+        logger.info("MQTT command topics are disabled.")
+        return
+    _ensure_worker()
+    ha_service.add_mqtt_subscription(f"{COMMAND_TOPIC_PREFIX}+", on_command_message)
+    logger.info(f"MQTT command topics enabled: {COMMAND_TOPIC_PREFIX}{{{','.join(COMMANDS)}}}.")
@@ -0,0 +1,112 @@
+import gzip
+import logging
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from . import config
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # Optional; Flask's json module is used instead
+    orjson = None
+
+# Set up a logger specific to this module
+logger = logging.getLogger(__name__)
+
+# Smaller responses for the web UI, which usually reaches the add-on through HA
+# ingress on a phone.
+#
+# Compression: JSON, HTML, CSS and JS responses of at least
+# RESPONSE_COMPRESSION_MIN_BYTES are compressed with brotli (if installed) or
+# gzip, whichever the client's Accept-Encoding prefers. Event streams, 304s and
+# partial responses are left alone. The inventory JSON is highly repetitive
+# (same keys, countries and varietals on every row) and shrinks about 9x with gzip.
+# Compressed responses get a weak ETag, which stays valid for conditional GETs
+# whatever the encoding.
+#
+# Fast JSON: with orjson installed and FAST_JSON on, jsonify() encodes with
+# orjson, several times faster than the json module on a large inventory.
+# Datetimes and anything else orjson doesn't know still go through Flask's
+# default() so the output matches.
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json", "text/html", "text/css", "text/plain",
+    "application/javascript", "text/javascript", "image/svg+xml",
+}
+
+def _available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=config.RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=config.RESPONSE_GZIP_LEVEL, mtime=0)
+
+def _compress_response(response):
+    # Generators (event streams) are streamed; static files are too, but as a passthrough file wrapper.
+    if (response.status_code != 200 or (response.is_streamed and not response.direct_passthrough)
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(_available_encodings())
+    if not encoding:
+        return response
+    length = response.content_length
+    if length is not None and length < config.RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < config.RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify()/request.get_json() via orjson, falling back to the json module for values orjson rejects."""
+
+    _options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def _dump_bytes(self, obj) -> bytes:
+        return orjson.dumps(obj, default=self.default, option=self._options)
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        try:
+            return self._dump_bytes(obj).decode()
+        except TypeError:  # e.g. integers beyond 64 bits
+            return super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = self._dump_bytes(obj) + b"\n"
+        except TypeError:
+            return super().response(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+def init_app(app):
+    """Installs the fast JSON provider and the compression hook as configured."""
+    if config.FAST_JSON:
+        if orjson is not None:
+            app.json = OrjsonProvider(app)
+            logger.info("Using orjson for JSON responses.")
+        else:
+            logger.info("FAST_JSON is on but orjson is not installed; using Flask's JSON encoder.")
+    if config.RESPONSE_COMPRESSION:
+        app.after_request(_compress_response)
+        logger.info(f"Response compression enabled ({', '.join(_available_encodings())}).")
@@ -9,12 +9,65 @@ def str_to_bool(val):
         return False
     return str(val).strip().lower() in ("true", "1", "yes", "y", "on")
 
+def str_to_list(val):
+    """Converts a comma-separated environment variable to a list of stripped, non-empty strings."""
+    if not val or str(val).strip().lower() == "null":
+        return []
+    return [item.strip() for item in str(val).split(",") if item.strip()]
+
 # --- Configuration (read from environment variables) ---
 HOME_ASSISTANT_URL = os.environ.get("HOME_ASSISTANT_URL")
 HA_LONG_LIVED_TOKEN = os.environ.get("HA_LONG_LIVED_TOKEN")
 TODO_LIST_ENTITY_ID = os.environ.get("TODO_LIST_ENTITY_ID")
 DB_PATH = os.environ.get("DB_PATH", "/share/wwino/wine_inventory.db")
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Parsed grapes.yaml/regions.yaml, rebuilt whenever the YAML changes.
+REFERENCE_CACHE_DIR = os.environ.get("REFERENCE_CACHE_DIR", os.path.join(os.path.dirname(DB_PATH), "cache"))
+
+# --- Home Assistant HTTP Client ---
+HA_HTTP_POOL_SIZE = int(os.environ.get("HA_HTTP_POOL_SIZE", 8))
+HA_HTTP_RETRIES = int(os.environ.get("HA_HTTP_RETRIES", 3))
+HA_HTTP_BACKOFF = float(os.environ.get("HA_HTTP_BACKOFF", 0.3))
+# Send service calls and events over a persistent HA WebSocket connection (REST remains the fallback).
+HA_USE_WEBSOCKET = str_to_bool(os.environ.get("HA_USE_WEBSOCKET", "false"))
+
+# --- Web Server ---
+# "waitress" (production) or "flask" (development server, for debugging only).
+WEB_SERVER = os.environ.get("WEB_SERVER", "waitress").strip().lower()
+WEB_PORT = int(os.environ.get("WEB_PORT", 5000))  # Ingress expects 5000; override for local benchmarks only
+WEB_THREADS = max(1, int(os.environ.get("WEB_THREADS", 8)))
+WEB_CONNECTION_LIMIT = int(os.environ.get("WEB_CONNECTION_LIMIT", 100))
+# Seconds an idle keep-alive connection stays open.
+WEB_CHANNEL_TIMEOUT = int(os.environ.get("WEB_CHANNEL_TIMEOUT", 120))
+# Seconds in-flight requests get to finish after SIGTERM.
+WEB_SHUTDOWN_TIMEOUT = float(os.environ.get("WEB_SHUTDOWN_TIMEOUT", 8))
+# Open /api/events streams allowed at once (0 disables); each holds a server thread, so they get their own on top of WEB_THREADS.
+EVENT_STREAM_MAX_CLIENTS = max(0, int(os.environ.get("EVENT_STREAM_MAX_CLIENTS", 4)))
+# gzip/brotli for JSON and static assets, negotiated via Accept-Encoding (brotli only if installed).
+RESPONSE_COMPRESSION = str_to_bool(os.environ.get("RESPONSE_COMPRESSION", "true"))
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", 1024))
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", 6))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", 5))
+# Encode JSON responses with orjson when it is installed.
+FAST_JSON = str_to_bool(os.environ.get("FAST_JSON", "true"))
+# Serve the web UI as a startup-built bundle (inlined components, minified JS/CSS, hashed names).
+ASSET_PIPELINE = str_to_bool(os.environ.get("ASSET_PIPELINE", "true"))
+
+# --- NEW: Bulk HA operations (full sync, restore) ---
+HA_BULK_CONCURRENCY = int(os.environ.get("HA_BULK_CONCURRENCY", 4))
+HA_BULK_RATE_LIMIT = float(os.environ.get("HA_BULK_RATE_LIMIT", 20))  # HA requests per second, 0 = unlimited
+
+# --- NEW: Durable HA outbox delivery (seconds) ---
+HA_OUTBOX_BACKOFF = float(os.environ.get("HA_OUTBOX_BACKOFF", 2))
+HA_OUTBOX_MAX_BACKOFF = float(os.environ.get("HA_OUTBOX_MAX_BACKOFF", 300))
+HA_OUTBOX_POLL_INTERVAL = float(os.environ.get("HA_OUTBOX_POLL_INTERVAL", 30))
+
+# --- NEW: Sensor refresh debounce window (seconds) ---
+SENSOR_REFRESH_DEBOUNCE = float(os.environ.get("SENSOR_REFRESH_DEBOUNCE", 0.5))
+# Full sensor republish interval in minutes (0 disables); between heartbeats only changed sensors are sent.
+SENSOR_HEARTBEAT_MINUTES = float(os.environ.get("SENSOR_HEARTBEAT_MINUTES", 60))
+# Also publish a bottle-count sensor per country (created/removed as countries come and go).
+SENSOR_PER_COUNTRY = str_to_bool(os.environ.get("SENSOR_PER_COUNTRY", "false"))
 
 # --- NEW MQTT Configuration ---
 USE_MQTT_DISCOVERY = str_to_bool(os.environ.get("USE_MQTT_DISCOVERY", "false"))
@@ -22,6 +75,29 @@ MQTT_HOST = os.environ.get("MQTT_HOST")
 MQTT_PORT = int(os.environ.get("MQTT_PORT", 1883))
 MQTT_USER = os.environ.get("MQTT_USER")
 MQTT_PASSWORD = os.environ.get("MQTT_PASSWORD")
+# Publish all sensor values as one retained JSON document; each entity reads its value via a value_template.
+MQTT_JSON_STATE = str_to_bool(os.environ.get("MQTT_JSON_STATE", "false"))
+# Accept consume/acquire commands on wonderful_wino/cmd/<command> (only when MQTT discovery is enabled).
+MQTT_COMMANDS = str_to_bool(os.environ.get("MQTT_COMMANDS", "true"))
+
+# --- Page Snapshot Store ---
+# Raw Vivino pages are kept (compressed) so improved parsers can be re-run without re-scraping.
+SAVE_PAGE_SNAPSHOTS = str_to_bool(os.environ.get("SAVE_PAGE_SNAPSHOTS", "false"))
+SNAPSHOT_DB_PATH = os.environ.get("SNAPSHOT_DB_PATH", os.path.join(os.path.dirname(DB_PATH), "page_snapshots.db"))
+SNAPSHOT_MAX_MB = int(os.environ.get("SNAPSHOT_MAX_MB", 50))
+
+# --- Scraper Network Filtering ---
+# Headless Chrome only needs the document and first-party scripts; everything else is blocked.
+SCRAPER_BLOCK_RESOURCES = str_to_bool(os.environ.get("SCRAPER_BLOCK_RESOURCES", "true"))
+# Extra URL patterns to block, and default patterns to let through (e.g. "*.css").
+SCRAPER_BLOCKED_URL_PATTERNS = str_to_list(os.environ.get("SCRAPER_BLOCKED_URL_PATTERNS"))
+SCRAPER_ALLOWED_URL_PATTERNS = str_to_list(os.environ.get("SCRAPER_ALLOWED_URL_PATTERNS"))
+# "js" reads the page state straight from the browser (serializing the page only when fields are still
+# unknown, for the HTML fallbacks); "html" always serializes and parses the page.
+SCRAPER_EXTRACTION_MODE = os.environ.get("SCRAPER_EXTRACTION_MODE", "js").strip().lower()
+# When a vintage page fails, vintages within this many years (plus the non-vintage page) are probed in parallel.
+SCRAPER_NEARBY_VINTAGE_RANGE = int(os.environ.get("SCRAPER_NEARBY_VINTAGE_RANGE", 1))
+SCRAPER_NEARBY_PROBE_CONCURRENCY = max(1, int(os.environ.get("SCRAPER_NEARBY_PROBE_CONCURRENCY", 3)))
 
 
 # --- Create Database Directory ---
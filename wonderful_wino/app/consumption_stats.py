@@ -0,0 +1,130 @@
+import collections
+import datetime
+import logging
+import threading
+import time
+from . import db
+
+# Set up a logger specific to this module
+logger = logging.getLogger(__name__)
+
+# Rolling consumption sensors: bottles consumed and average personal rating over
+# the last 7, 30 and 365 days.
+#
+# Each window keeps a deque of (consumed_at, rating) in time order plus running
+# totals. A consume appends to every window; reading (or the daily tick) evicts
+# entries that have aged out from the left. Neither touches the database, so a
+# sensor refresh costs O(expired entries) instead of a range scan over the history.
+# The windows are rebuilt from consumption_history (one query) on first use and
+# whenever past entries change: a log date edit, a restore or a reinitialize.
+
+WINDOW_DAYS = (7, 30, 365)
+
+class _Window:
+    def __init__(self, days: int):
+        self.seconds = days * 86400
+        self.entries = collections.deque()
+        self.count = 0
+        self.rating_sum = 0.0
+        self.rating_count = 0
+
+    def add(self, consumed_at: float, rating):
+        self.entries.append((consumed_at, rating))
+        self.count += 1
+        if rating is not None:
+            self.rating_sum += rating
+            self.rating_count += 1
+
+    def evict(self, now: float):
+        cutoff = now - self.seconds
+        while self.entries and self.entries[0][0] < cutoff:
+            _, rating = self.entries.popleft()
+            self.count -= 1
+            if rating is not None:
+                self.rating_sum -= rating
+                self.rating_count -= 1
+
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
+
+_lock = threading.Lock()
+_windows = None
+_tick_thread = None
+
+def _coerce_rating(rating):
+    try:
+        return float(rating) if rating is not None and rating != '' else None
+    except (TypeError, ValueError):
+        return None
+
+def _build_windows(records, now: float):
+    windows = {days: _Window(days) for days in WINDOW_DAYS}
+    for consumed_at, rating in records:
+        for window in windows.values():
+            if consumed_at >= now - window.seconds:
+                window.add(consumed_at, _coerce_rating(rating))
+    return windows
+
+def rebuild():
+    """Reloads the windows from consumption_history. Call after past log entries change."""
+    global _windows
+    records = db.get_recent_consumptions(max(WINDOW_DAYS))
+    if records is None:
+        # Keep the current windows; a later rebuild or restart will catch up.
+        return False
+    with _lock:
+        _windows = _build_windows(records, time.time())
+    logger.info(f"Rebuilt rolling consumption windows from {len(records)} records.")
+    return True
+
+def _ensure_loaded():
+    if _windows is None:
+        rebuild()
+
+def record_consumption(rating=None, consumed_at: float = None):
+    """Adds one consumed bottle (call after atomically_consume_wine succeeds)."""
+    if _windows is None:
+        # The first load reads the committed record, so there is nothing to add.
+        rebuild()
+        return
+    consumed_at = time.time() if consumed_at is None else consumed_at
+    rating = _coerce_rating(rating)
+    with _lock:
+        for window in _windows.values():
+            window.add(consumed_at, rating)
+
+def get_window_stats(now: float = None) -> dict:
+    """Returns {days: {'consumed': n, 'avg_rating': x or None}} for each window."""
+    _ensure_loaded()
+    now = time.time() if now is None else now
+    with _lock:
+        if _windows is None:
+            return {}
+        stats = {}
+        for days, window in _windows.items():
+            window.evict(now)
+            stats[days] = {'consumed': window.count, 'avg_rating': window.average_rating()}
+        return stats
+
+def _seconds_until_midnight() -> float:
+    now = datetime.datetime.now()
+    tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+    return max((tomorrow - now).total_seconds(), 1.0)
+
+def _tick_loop(on_tick):
+    while True:
+        time.sleep(_seconds_until_midnight() + 1)
+        try:
+            on_tick()
+        except Exception as e:
+            logger.error(f"Daily consumption window tick failed: {e}", exc_info=True)
+
+def start_daily_tick(on_tick):
+    """Calls on_tick() just after every local midnight so aged-out bottles leave the windows even when nothing else changes."""
+    global _tick_thread
+    if _tick_thread is not None and _tick_thread.is_alive():
+        return
+    _tick_thread = threading.Thread(target=_tick_loop, args=(on_tick,), name="consumption-tick", daemon=True)
+    _tick_thread.start()
@@ -1,10 +1,15 @@
 import sqlite3
 import logging
+import json
 from .config import DB_PATH
+from . import events
 import os
 
 logger = logging.getLogger(__name__)
 
+# Tables whose changes bump data_version (and so invalidate HTTP ETags).
+VERSIONED_TABLES = ('wines', 'consumption_history', 'settings')
+
 def get_db_connection():
     """Establishes and returns a database connection with Row factory."""
     conn = sqlite3.connect(DB_PATH)
@@ -40,7 +45,8 @@ def init_db():
                 needs_review BOOLEAN DEFAULT FALSE,
                 image_focal_point TEXT DEFAULT '50%',
                 image_zoom REAL DEFAULT 1,
-                image_tilt REAL DEFAULT 0
+                image_tilt REAL DEFAULT 0,
+                ha_todo_uid TEXT
             )
         ''')
         cursor.execute('''
@@ -61,6 +67,40 @@ def init_db():
             )
         ''')
         
+        # --- NEW: Durable outbox of pending Home Assistant updates ---
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ha_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                wine_key TEXT NOT NULL,
+                payload TEXT,
+                revision INTEGER DEFAULT 0 NOT NULL,
+                attempts INTEGER DEFAULT 0 NOT NULL,
+                next_attempt_at REAL DEFAULT 0 NOT NULL,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ha_outbox_kind_key ON ha_outbox (kind, wine_key)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ha_outbox_key_id ON ha_outbox (wine_key, id)")
+
+        # --- NEW: Change counter for HTTP ETags, bumped by triggers on every write ---
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS data_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+        # Table and operation names are fixed literals.
+        for table in VERSIONED_TABLES:
+            for operation in ('INSERT', 'UPDATE', 'DELETE'):
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_{operation.lower()}_bumps_version
+                    AFTER {operation} ON {table}
+                    BEGIN UPDATE data_version SET version = version + 1 WHERE id = 1; END
+                ''')
+        
         # Check if new columns exist in wines table and add them if they don't
         cursor.execute("PRAGMA table_info(wines)")
         wines_columns = [column['name'] for column in cursor.fetchall()]
@@ -82,6 +122,12 @@ def init_db():
         if 'region_full' not in wines_columns:
             cursor.execute("ALTER TABLE wines ADD COLUMN region_full TEXT")
             logger.info("Added 'region_full' column to wines table.")
+        if 'ha_todo_uid' not in wines_columns:
+            cursor.execute("ALTER TABLE wines ADD COLUMN ha_todo_uid TEXT")
+            logger.info("Added 'ha_todo_uid' column to wines table.")
+        if 'user_edited_fields' not in wines_columns:
+            cursor.execute("ALTER TABLE wines ADD COLUMN user_edited_fields TEXT")
+            logger.info("Added 'user_edited_fields' column to wines table.")
 
         # Check if new columns exist in consumption_history table and add them if they don't
         cursor.execute("PRAGMA table_info(consumption_history)")
@@ -124,6 +170,35 @@ def update_consumption_date(log_id, new_consumed_at):
         if conn:
             conn.close()
 
+def get_data_version():
+    """Returns the data_version counter (see VERSIONED_TABLES), or None on a database error."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        row = conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+        return row['version'] if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Database error reading data version: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+def _bump_data_version(at_least: int = 0):
+    """Moves data_version past its current value and `at_least` (for changes the triggers don't see)."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        conn.execute("UPDATE data_version SET version = MAX(version, ?) + 1 WHERE id = 1", (at_least,))
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Database error bumping data version: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+
 def reinitialize_database():
     """Drops all existing tables and then recreates them by calling init_db()."""
     conn = None
@@ -134,9 +209,12 @@ def reinitialize_database():
         cursor.execute("DROP TABLE IF EXISTS consumption_history")
         cursor.execute("DROP TABLE IF EXISTS wines")
         cursor.execute("DROP TABLE IF EXISTS settings")
+        cursor.execute("DROP TABLE IF EXISTS ha_outbox")
         conn.commit()
         init_db()
+        _bump_data_version()
         logger.info("Database tables re-created.")
+        events.publish_resync("reinitialized")
     except sqlite3.Error as e:
         logger.error(f"Database error during reinitialization: {e}")
         if conn:
@@ -157,6 +235,8 @@ def update_image_focal_point(vivino_url: str, focal_point: str):
         )
         conn.commit()
         logger.info(f"Updated focal point for {vivino_url} to {focal_point}")
+        if cursor.rowcount > 0:
+            events.publish_wine(get_wine_by_url(vivino_url))
         return cursor.rowcount > 0
     except sqlite3.Error as e:
         logger.error(f"Database error updating focal point: {e}")
@@ -199,20 +279,272 @@ def get_consumption_history(wine_id: int):
         if conn:
             conn.close()
 
+def get_recent_consumptions(days: int):
+    """
+    Returns [(consumed_at as unix seconds, personal_rating)] for bottles consumed in
+    the last `days` days, oldest first, or None on a database error.
+    julianday() accepts both the default CURRENT_TIMESTAMP form and the ISO strings
+    written by the log date editor.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT (julianday(consumed_at) - 2440587.5) * 86400.0 AS consumed_at, personal_rating
+            FROM consumption_history
+            WHERE log_type = 'consumed' AND julianday(consumed_at) >= julianday('now', ?)
+            ORDER BY julianday(consumed_at)
+        """, (f"-{int(days)} days",))
+        return [(row['consumed_at'], row['personal_rating']) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Database error getting recent consumptions: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+# Columns refreshed from scraped/manual data when an existing wine is re-added.
+WINE_REFRESH_FIELDS = (
+    'name', 'vintage', 'varietal', 'region', 'region_full', 'country',
+    'vivino_rating', 'image_url', 'alcohol_percent', 'wine_type'
+)
+
+def _values_differ(old, new):
+    """
+    Compares a stored column value with an incoming one.
+    SQLite hands back ints for booleans and the frontend may send numbers as
+    strings, so numeric values are compared by value rather than by type.
+    """
+    if old is None or new is None:
+        return old is not new
+    if isinstance(old, (int, float)) and not isinstance(new, (int, float)):
+        try:
+            return float(old) != float(new)
+        except (TypeError, ValueError):
+            return True
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return float(old) != float(new)
+    return old != new
+
+def diff_wine_fields(existing_row: dict, desired: dict):
+    """
+    Returns a {column: (old, new)} dict of the columns in `desired` whose
+    value differs from `existing_row`. Columns that match are left out.
+    """
+    return {
+        column: (existing_row.get(column), value)
+        for column, value in desired.items()
+        if _values_differ(existing_row.get(column), value)
+    }
+
+def _update_changed_columns(cursor, wine_id, changes: dict):
+    """
+    Writes only the changed columns of a wine row.
+    NOTE: Column names come from the fixed field tuples in this module,
+    never from user input; the values are bound as parameters.
+    """
+    if not changes:
+        return
+    assignments = ", ".join(f"{column} = ?" for column in changes)
+    params = [new for _old, new in changes.values()]
+    params.append(wine_id)
+    cursor.execute(f"UPDATE wines SET {assignments} WHERE id = ?", tuple(params))
+
+# --- NEW: HA outbox ---
+# HA side effects are recorded in ha_outbox inside the same transaction as the
+# wine mutation that causes them, and delivered later by outbox.py. A wine has
+# at most one pending 'todo_sync' entry: its payload keeps the row as it was
+# before the first undelivered change (i.e. what HA currently shows), and later
+# changes only bump its revision. The current row is read at delivery time.
+OUTBOX_TODO_SYNC = 'todo_sync'
+OUTBOX_CONSUMED_EVENT = 'consumed_event'
+
+def _fetch_wine_row(cursor, vivino_url):
+    cursor.execute("SELECT * FROM wines WHERE vivino_url = ?", (vivino_url,))
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+def _enqueue_todo_sync(cursor, vivino_url, previous_row):
+    """Queues a To-Do re-sync for a wine, collapsing into an entry already pending for it."""
+    cursor.execute(
+        "UPDATE ha_outbox SET revision = revision + 1 WHERE kind = ? AND wine_key = ?",
+        (OUTBOX_TODO_SYNC, vivino_url)
+    )
+    if cursor.rowcount == 0:
+        cursor.execute(
+            "INSERT INTO ha_outbox (kind, wine_key, payload) VALUES (?, ?, ?)",
+            (OUTBOX_TODO_SYNC, vivino_url, json.dumps({'previous': previous_row}))
+        )
+
+def _enqueue_consumed_event(cursor, wine_row):
+    cursor.execute(
+        "INSERT INTO ha_outbox (kind, wine_key, payload) VALUES (?, ?, ?)",
+        (OUTBOX_CONSUMED_EVENT, wine_row['vivino_url'], json.dumps(wine_row))
+    )
+
+def set_ha_todo_uids(uid_by_url: dict):
+    """Stores (or clears, with None) the HA To-Do item UID for each wine URL. Not an HA-visible change, so nothing is queued."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.executemany(
+            "UPDATE wines SET ha_todo_uid = ? WHERE vivino_url = ?",
+            [(uid, url) for url, uid in uid_by_url.items()]
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Database error storing HA To-Do UIDs: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+
+def get_due_outbox_entries(now: float, limit: int = 50):
+    """
+    Returns up to `limit` outbox entries whose next attempt is due, oldest first.
+    An entry waiting behind an older entry for the same wine that is not due yet
+    (i.e. backing off) is left out, so per-wine order holds across passes.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT * FROM ha_outbox WHERE next_attempt_at <= ? AND NOT EXISTS (
+                SELECT 1 FROM ha_outbox AS older
+                WHERE older.wine_key = ha_outbox.wine_key AND older.id < ha_outbox.id AND older.next_attempt_at > ?
+            ) ORDER BY id LIMIT ?
+            """,
+            (now, now, limit)
+        )
+        entries = []
+        for row in cursor.fetchall():
+            entry = dict(row)
+            entry['payload'] = json.loads(entry['payload']) if entry['payload'] else None
+            entries.append(entry)
+        return entries
+    except sqlite3.Error as e:
+        logger.error(f"Database error reading HA outbox: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+def complete_outbox_entry(entry_id: int, revision: int, delivered_row=None):
+    """
+    Removes a delivered entry. If the wine changed again while it was being
+    delivered (its revision moved on), the entry is kept for another pass and its
+    baseline becomes `delivered_row`, the state that was just pushed to HA.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM ha_outbox WHERE id = ? AND revision = ?", (entry_id, revision))
+        if cursor.rowcount == 0:
+            cursor.execute(
+                "UPDATE ha_outbox SET payload = ?, attempts = 0, next_attempt_at = 0, last_error = NULL WHERE id = ?",
+                (json.dumps({'previous': delivered_row}), entry_id)
+            )
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Database error completing HA outbox entry {entry_id}: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+
+def reschedule_outbox_entry(entry_id: int, next_attempt_at: float, error: str):
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE ha_outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+            (next_attempt_at, error, entry_id)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Database error rescheduling HA outbox entry {entry_id}: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+
+def clear_ha_outbox(kind: str = None):
+    """Drops pending outbox entries (all of them, or only those of `kind`), e.g. before a full re-sync."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        if kind:
+            cursor.execute("DELETE FROM ha_outbox WHERE kind = ?", (kind,))
+        else:
+            cursor.execute("DELETE FROM ha_outbox")
+        conn.commit()
+        if cursor.rowcount:
+            logger.info(f"Cleared {cursor.rowcount} pending HA outbox entries.")
+    except sqlite3.Error as e:
+        logger.error(f"Database error clearing HA outbox: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+
+def get_outbox_stats():
+    """
+    Returns pending entry counts per kind, the retrying count and the next due time
+    (of the oldest entry per wine, since later ones wait for it).
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT kind, COUNT(*) AS n FROM ha_outbox GROUP BY kind")
+        pending = {row['kind']: row['n'] for row in cursor.fetchall()}
+        cursor.execute("SELECT SUM(attempts > 0) AS retrying FROM ha_outbox")
+        retrying = cursor.fetchone()['retrying'] or 0
+        cursor.execute(
+            "SELECT MIN(next_attempt_at) AS next_at FROM ha_outbox WHERE id IN (SELECT MIN(id) FROM ha_outbox GROUP BY wine_key)"
+        )
+        return {"pending": pending, "retrying": retrying, "next_attempt_at": cursor.fetchone()['next_at']}
+    except sqlite3.Error as e:
+        logger.error(f"Database error reading HA outbox stats: {e}")
+        return {}
+    finally:
+        if conn:
+            conn.close()
+
 def add_or_update_wine(wine_data: dict, quantity: int, cost_tier: int):
+    """
+    Inserts a new wine or adds bottles to an existing one.
+
+    For an existing wine only the columns whose values actually changed are
+    written. Returns a (success, changes) tuple where `changes` maps each
+    written column to its (old, new) value; for a new wine every inserted
+    column is reported with an old value of None.
+    """
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT id, quantity FROM wines WHERE vivino_url = ?", (wine_data['vivino_url'],))
+        cursor.execute("SELECT * FROM wines WHERE vivino_url = ?", (wine_data['vivino_url'],))
         existing_wine = cursor.fetchone()
 
         needs_review_flag = wine_data.get('needs_review', False) or \
                             wine_data.get('name', '').startswith(('Review Wine', 'Vivino Wine ID'))
 
         if existing_wine:
-            wine_id, current_quantity = existing_wine
-            new_quantity = current_quantity + quantity
+            existing_row = dict(existing_wine)
+            wine_id = existing_row['id']
+            new_quantity = existing_row['quantity'] + quantity
             try:
                 cursor.execute('''
                     INSERT INTO consumption_history (wine_id, log_type, cost_tier)
@@ -222,47 +554,74 @@ def add_or_update_wine(wine_data: dict, quantity: int, cost_tier: int):
             except sqlite3.Error as e:
                 # Log the error but don't stop the whole transaction
                 logger.error(f"Failed to insert 'acquired' log for existing wine: {e}")
+
+            desired = {'quantity': new_quantity}
+            if not needs_review_flag:
+                desired.update({field: wine_data.get(field) for field in WINE_REFRESH_FIELDS})
+                desired['cost_tier'] = cost_tier
+                desired['needs_review'] = False
+            changes = diff_wine_fields(existing_row, desired)
+            _update_changed_columns(cursor, wine_id, changes)
+            _enqueue_todo_sync(cursor, existing_row['vivino_url'], existing_row)
+
             if needs_review_flag:
-                cursor.execute('UPDATE wines SET quantity = ? WHERE id = ?', (new_quantity, wine_id))
                 logger.info(f"Updated quantity only for '{wine_data['name']}' to {new_quantity} as it needs review.")
             else:
-                cursor.execute('''
-                    UPDATE wines SET
-                        quantity = ?, name = ?, vintage = ?, varietal = ?, region = ?, region_full = ?,
-                        country = ?, vivino_rating = ?, image_url = ?, cost_tier = ?,
-                        alcohol_percent = ?, wine_type = ?, needs_review = ?
-                    WHERE id = ?
-                ''', (
-                    new_quantity, wine_data.get('name'), wine_data.get('vintage'), wine_data.get('varietal'),
-                    wine_data.get('region'), wine_data.get('region_full'), wine_data.get('country'), wine_data.get('vivino_rating'),
-                    wine_data.get('image_url'), cost_tier, wine_data.get('alcohol_percent'),
-                    wine_data.get('wine_type'), False, wine_id
-                ))
-                logger.info(f"Updated and refreshed data for '{wine_data.get('name')}' with new quantity {new_quantity}.")
+                logger.info(f"Refreshed '{wine_data.get('name')}' with new quantity {new_quantity}; changed columns: {sorted(changes)}.")
         else:
-            cursor.execute('''
-                INSERT INTO wines (
-                    vivino_url, name, vintage, varietal, region, region_full, country, vivino_rating,
-                    image_url, quantity, cost_tier, personal_rating, tasting_notes,
-                    alcohol_percent, wine_type, needs_review
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                wine_data.get('vivino_url'), wine_data.get('name'), wine_data.get('vintage'), wine_data.get('varietal'),
-                wine_data.get('region'), wine_data.get('region_full'), wine_data.get('country'), wine_data.get('vivino_rating'),
-                wine_data.get('image_url'), quantity, cost_tier, None, None,
-                wine_data.get('alcohol_percent'), wine_data.get('wine_type'), needs_review_flag
-            ))
+            inserted = {field: wine_data.get(field) for field in WINE_REFRESH_FIELDS}
+            inserted.update({
+                'vivino_url': wine_data.get('vivino_url'), 'quantity': quantity, 'cost_tier': cost_tier,
+                'personal_rating': None, 'tasting_notes': None, 'needs_review': needs_review_flag
+            })
+            columns = list(inserted)
+            cursor.execute(
+                f"INSERT INTO wines ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                tuple(inserted[column] for column in columns)
+            )
             new_wine_id = cursor.lastrowid
             cursor.execute('''
                 INSERT INTO consumption_history (wine_id, log_type, cost_tier)
                 VALUES (?, 'acquired', ?)
             ''', (new_wine_id, cost_tier))
+            changes = {column: (None, value) for column, value in inserted.items() if value is not None}
+            _enqueue_todo_sync(cursor, inserted['vivino_url'], None)
             logger.info(f"New wine '{wine_data.get('name')}' inserted with quantity {quantity} and logged 'acquired' event.")
 
         conn.commit()
-        return True
+        events.publish_wine(get_wine_by_url(wine_data['vivino_url']))
+        return True, changes
     except sqlite3.Error as e:
         logger.error(f"Database error inserting/updating wine data: {e}")
+        if conn:
+            conn.rollback()
+        return False, {}
+    finally:
+        if conn:
+            conn.close()
+
+def update_wine_fields(vivino_url: str, changes: dict):
+    """
+    Applies a {column: (old, new)} change set (as produced by diff_wine_fields)
+    to a wine. Only columns listed in WINE_REFRESH_FIELDS are accepted.
+    """
+    conn = None
+    try:
+        allowed = {column: change for column, change in changes.items() if column in WINE_REFRESH_FIELDS}
+        if not allowed:
+            return False
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        row = _fetch_wine_row(cursor, vivino_url)
+        if not row:
+            return False
+        _update_changed_columns(cursor, row['id'], allowed)
+        _enqueue_todo_sync(cursor, vivino_url, row)
+        conn.commit()
+        events.publish_wine(get_wine_by_url(vivino_url))
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Database error updating wine fields: {e}")
         if conn:
             conn.rollback()
         return False
@@ -306,19 +665,54 @@ def get_wine_by_url(vivino_url: str):
         if conn:
             conn.close()
 
+def get_wine_by_id(wine_id: int):
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM wines WHERE id = ?", (wine_id,))
+        wine = cursor.fetchone()
+        return dict(wine) if wine else None
+    except sqlite3.Error as e:
+        logger.error(f"Database error getting wine by id: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+def get_user_edited_fields(wine_row: dict) -> set:
+    """Returns the scraped columns the user has changed by hand through /edit-wine."""
+    try:
+        return set(json.loads(wine_row.get('user_edited_fields') or '[]'))
+    except (TypeError, ValueError):
+        return set()
+
 def update_wine_details(vivino_url, name, vintage, quantity, varietal, region, country, cost_tier, personal_rating, tasting_notes, alcohol_percent, wine_type):
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        previous_row = _fetch_wine_row(cursor, vivino_url)
+        if not previous_row:
+            return False
+        # Remember which scraped columns the user corrected so an offline reparse leaves them alone.
+        edited = get_user_edited_fields(previous_row) | set(diff_wine_fields(previous_row, {
+            'name': name, 'vintage': vintage, 'varietal': varietal, 'region': region, 'country': country,
+            'alcohol_percent': alcohol_percent, 'wine_type': wine_type
+        }))
+        if 'region' in edited:
+            edited.add('region_full')
         cursor.execute('''
             UPDATE wines SET name = ?, vintage = ?, varietal = ?, region = ?, country = ?,
             quantity = ?, cost_tier = ?, personal_rating = ?, tasting_notes = ?,
-            alcohol_percent = ?, wine_type = ?, needs_review = FALSE
+            alcohol_percent = ?, wine_type = ?, needs_review = FALSE, user_edited_fields = ?
             WHERE vivino_url = ?
-        ''', (name, vintage, varietal, region, country, quantity, cost_tier, personal_rating, tasting_notes, alcohol_percent, wine_type, vivino_url))
+        ''', (name, vintage, varietal, region, country, quantity, cost_tier, personal_rating, tasting_notes, alcohol_percent, wine_type,
+              json.dumps(sorted(edited)) if edited else None, vivino_url))
+        _enqueue_todo_sync(cursor, vivino_url, previous_row)
         conn.commit()
-        return cursor.rowcount > 0
+        events.publish_wine(get_wine_by_url(vivino_url))
+        return True
     except sqlite3.Error as e:
         logger.error(f"Database error updating wine details: {e}")
         if conn:
@@ -333,9 +727,14 @@ def update_wine_quantity(vivino_url, new_quantity):
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        previous_row = _fetch_wine_row(cursor, vivino_url)
+        if not previous_row:
+            return False
         cursor.execute("UPDATE wines SET quantity = ? WHERE vivino_url = ?", (new_quantity, vivino_url))
+        _enqueue_todo_sync(cursor, vivino_url, previous_row)
         conn.commit()
-        return cursor.rowcount > 0
+        events.publish_quantity(vivino_url, new_quantity)
+        return True
     except sqlite3.Error as e:
         logger.error(f"Database error updating wine quantity: {e}")
         if conn:
@@ -350,9 +749,14 @@ def update_personal_rating(vivino_url, rating):
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        previous_row = _fetch_wine_row(cursor, vivino_url)
+        if not previous_row:
+            return False
         cursor.execute("UPDATE wines SET personal_rating = ? WHERE vivino_url = ?", (rating, vivino_url))
+        _enqueue_todo_sync(cursor, vivino_url, previous_row)
         conn.commit()
-        return cursor.rowcount > 0
+        events.publish_wine(get_wine_by_url(vivino_url))
+        return True
     except sqlite3.Error as e:
         logger.error(f"Database error updating personal rating: {e}")
         if conn:
@@ -390,6 +794,8 @@ def update_wine_notes_and_image(vivino_url, notes, image_url, image_zoom, image_
             params.append(vivino_url)
             cursor.execute(query, tuple(params))
             conn.commit()
+            if cursor.rowcount > 0:
+                events.publish_wine(get_wine_by_url(vivino_url))
             return cursor.rowcount > 0
         return True
     except sqlite3.Error as e:
@@ -406,9 +812,14 @@ def delete_wine_by_url(vivino_url):
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        previous_row = _fetch_wine_row(cursor, vivino_url)
+        if not previous_row:
+            return False
         cursor.execute("DELETE FROM wines WHERE vivino_url = ?", (vivino_url,))
+        _enqueue_todo_sync(cursor, vivino_url, previous_row)
         conn.commit()
-        return cursor.rowcount > 0
+        events.publish_wine_deleted(vivino_url)
+        return True
     except sqlite3.Error as e:
         logger.error(f"Database error deleting wine: {e}")
         if conn:
@@ -460,8 +871,13 @@ def atomically_consume_wine(vivino_url, personal_rating):
         cost_tier = wine_dict.get('cost_tier')
         add_consumption_record(cursor, wine_id, personal_rating, cost_tier)
 
-        # Step 5: Commit the transaction
+        # Step 5: Queue the HA updates in the same transaction
+        _enqueue_todo_sync(cursor, vivino_url, wine_dict)
+        _enqueue_consumed_event(cursor, dict(wine_dict, quantity=new_quantity, personal_rating=rating_to_set))
+
+        # Step 6: Commit the transaction
         conn.commit()
+        events.publish_quantity(vivino_url, new_quantity, rating_to_set)
 
         updated_wine = get_wine_by_url(vivino_url)
         return ("success", new_quantity, updated_wine)
@@ -475,6 +891,44 @@ def atomically_consume_wine(vivino_url, personal_rating):
         if conn:
             conn.close()
 
+def atomically_acquire_wine(vivino_url, quantity: int = 1):
+    """
+    Atomically adds bottles to an existing wine and logs an 'acquired' record.
+    Returns (status, new_quantity or error message, updated_wine) like atomically_consume_wine.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        conn.isolation_level = 'EXCLUSIVE'
+        cursor = conn.cursor()
+        cursor.execute("BEGIN EXCLUSIVE TRANSACTION")
+
+        wine_dict = _fetch_wine_row(cursor, vivino_url)
+        if not wine_dict:
+            conn.rollback()
+            return ("error", "Wine not found", None)
+
+        new_quantity = (wine_dict.get('quantity') or 0) + quantity
+        cursor.execute("UPDATE wines SET quantity = ? WHERE vivino_url = ?", (new_quantity, vivino_url))
+        cursor.execute(
+            "INSERT INTO consumption_history (wine_id, log_type, cost_tier) VALUES (?, 'acquired', ?)",
+            (wine_dict['id'], wine_dict.get('cost_tier'))
+        )
+        _enqueue_todo_sync(cursor, vivino_url, wine_dict)
+        conn.commit()
+        events.publish_quantity(vivino_url, new_quantity)
+
+        return ("success", new_quantity, dict(wine_dict, quantity=new_quantity))
+
+    except sqlite3.Error as e:
+        logger.error(f"Database error during atomic acquire: {e}", exc_info=True)
+        if conn:
+            conn.rollback()
+        return ("error", "Database error", None)
+    finally:
+        if conn:
+            conn.close()
+
 
 def get_settings():
     conn = None
@@ -540,11 +994,17 @@ def restore_database():
         backup_path = os.path.join(backup_dir, "wonderful_wino_backup.db")
         if not os.path.exists(backup_path):
             return False, "Backup file not found."
+        # The backup carries its own (older) data_version; keep the counter moving forward.
+        version_before = get_data_version() or 0
         source_conn = sqlite3.connect(backup_path)
         dest_conn = get_db_connection()
         with dest_conn:
             source_conn.backup(dest_conn)
         source_conn.close()
+        # Backups from older versions may lack newer tables/columns (including data_version).
+        init_db()
+        _bump_data_version(version_before)
+        events.publish_resync("restored")
         return True, "Database restored successfully."
     except sqlite3.Error as e:
         logger.error(f"Database restore failed: {e}")
@@ -591,64 +1051,44 @@ def get_all_historical_wines():
             conn.close()
 
 # --- NEW FUNCTION FOR HA SENSORS ---
-def get_inventory_statistics():
+def get_inventory_statistics(include_countries: bool = False):
     """
-    Calculates inventory statistics using a single, safe SQL query.
-    This is 100% CodeQL-safe as the query is a fixed literal.
+    Returns statistics for the wines on hand: cellar totals plus bottle and wine
+    counts grouped by wine type (and by country if requested), e.g.
+    {'total_bottles': 12, 'unique_wines': 5, 'needs_review': 1,
+     'by_type': {'Red': {'bottles': 8, 'wines': 3}, ...}, 'by_country': {...}}.
+    Returns None on a database error so callers don't publish bogus zeros.
+    Both queries are fixed literals.
     """
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        query = """
-            SELECT
-                SUM(CASE WHEN quantity > 0 THEN quantity ELSE 0 END) as total_bottles,
-                SUM(CASE WHEN wine_type = 'Red' AND quantity > 0 THEN quantity ELSE 0 END) as red_bottles,
-                SUM(CASE WHEN wine_type = 'White' AND quantity > 0 THEN quantity ELSE 0 END) as white_bottles,
-                SUM(CASE WHEN wine_type = 'Sparkling' AND quantity > 0 THEN quantity ELSE 0 END) as sparkling_bottles,
-                SUM(CASE WHEN wine_type = 'Rosé' AND quantity > 0 THEN quantity ELSE 0 END) as rose_bottles,
-                SUM(CASE WHEN wine_type = 'Dessert' AND quantity > 0 THEN quantity ELSE 0 END) as dessert_bottles,
-                
-                COUNT(CASE WHEN quantity > 0 THEN 1 END) as unique_wines,
-                COUNT(CASE WHEN wine_type = 'Red' AND quantity > 0 THEN 1 END) as unique_red_wines,
-                COUNT(CASE WHEN wine_type = 'White' AND quantity > 0 THEN 1 END) as unique_white_wines,
-                COUNT(CASE WHEN wine_type = 'Sparkling' AND quantity > 0 THEN 1 END) as unique_sparkling_wines,
-                COUNT(CASE WHEN wine_type = 'Rosé' AND quantity > 0 THEN 1 END) as unique_rose_wines,
-                COUNT(CASE WHEN wine_type = 'Dessert' AND quantity > 0 THEN 1 END) as unique_dessert_wines,
-
-                COUNT(CASE WHEN needs_review = TRUE AND quantity > 0 THEN 1 END) as needs_review
-            FROM wines
-        """
-        cursor.execute(query)
-        stats = cursor.fetchone()
-        
-        if stats:
-            # Convert row object to dict and handle None (from SUM on no rows)
-            stats_dict = dict(stats)
-            for key in stats_dict:
-                if stats_dict[key] is None:
-                    stats_dict[key] = 0
-            return stats_dict
-        else:
-            # Return a zeroed-out dict if the table is empty
-            return {
-                'total_bottles': 0, 'red_bottles': 0, 'white_bottles': 0,
-                'sparkling_bottles': 0, 'rose_bottles': 0, 'dessert_bottles': 0,
-                'unique_wines': 0, 'unique_red_wines': 0, 'unique_white_wines': 0,
-                'unique_sparkling_wines': 0, 'unique_rose_wines': 0, 'unique_dessert_wines': 0,
-                'needs_review': 0
-            }
-            
+        cursor.execute("""
+            SELECT wine_type, SUM(quantity) AS bottles, COUNT(*) AS wines,
+                   SUM(CASE WHEN needs_review = TRUE THEN 1 ELSE 0 END) AS needs_review
+            FROM wines WHERE quantity > 0 GROUP BY wine_type
+        """)
+        stats = {'total_bottles': 0, 'unique_wines': 0, 'needs_review': 0, 'by_type': {}, 'by_country': {}}
+        for row in cursor.fetchall():
+            stats['total_bottles'] += row['bottles'] or 0
+            stats['unique_wines'] += row['wines'] or 0
+            stats['needs_review'] += row['needs_review'] or 0
+            if row['wine_type']:
+                stats['by_type'][row['wine_type']] = {'bottles': row['bottles'] or 0, 'wines': row['wines'] or 0}
+
+        if include_countries:
+            cursor.execute("""
+                SELECT country, SUM(quantity) AS bottles, COUNT(*) AS wines
+                FROM wines WHERE quantity > 0 AND country IS NOT NULL AND country != '' GROUP BY country
+            """)
+            for row in cursor.fetchall():
+                stats['by_country'][row['country']] = {'bottles': row['bottles'] or 0, 'wines': row['wines'] or 0}
+        return stats
+
     except sqlite3.Error as e:
         logger.error(f"Database error getting inventory statistics: {e}")
-        # Return a default structure on error
-        return {
-            'total_bottles': 0, 'red_bottles': 0, 'white_bottles': 0,
-            'sparkling_bottles': 0, 'rose_bottles': 0, 'dessert_bottles': 0,
-            'unique_wines': 0, 'unique_red_wines': 0, 'unique_white_wines': 0,
-            'unique_sparkling_wines': 0, 'unique_rose_wines': 0, 'unique_dessert_wines': 0,
-            'needs_review': 0
-        }
+        return None
     finally:
         if conn:
             conn.close()
\ No newline at end of file
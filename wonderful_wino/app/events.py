@@ -0,0 +1,177 @@
+import collections
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+from . import config, formatting
+
+# Set up a logger specific to this module
+logger = logging.getLogger(__name__)
+
+# Change events for the web UI, streamed as server-sent events on /api/events.
+#
+# db.py publishes an event after each commit that changes the inventory, so
+# changes made from HA automations, MQTT commands or another tab show up
+# without a reload:
+#
+#   wine_upserted     {"wine": {...row as served by /inventory...}}
+#   quantity_changed  {"vivino_url", "quantity"[, "personal_rating"]}
+#   wine_deleted      {"vivino_url"}
+#   job_finished      {"id", "kind", "status", "message", "failed"}
+#   resync            {"reason"}   (restore/reinitialize, or events were missed)
+#
+# Every event has an increasing id. The last EVENT_BUFFER_SIZE events are kept,
+# so a reconnecting EventSource (which sends Last-Event-ID) gets what it missed.
+# If the gap is too old, or a slow client's queue overflows, it gets a resync instead.
+# Ids start at the process start time in ms, so an id from before a restart is
+# older than anything this process has sent and the client resyncs.
+
+EVENT_BUFFER_SIZE = 256
+SUBSCRIBER_QUEUE_SIZE = 200
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+_lock = threading.Lock()
+_first_id = int(time.time() * 1000)
+_ids = itertools.count(_first_id)
+_buffer = collections.deque(maxlen=EVENT_BUFFER_SIZE)
+_subscribers = set()
+_closing = threading.Event()
+
+class Subscriber:
+    """One open /api/events stream."""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+        self.closed = False
+        self.opened_at = time.monotonic()
+
+    def close(self):
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+def _format(event) -> str:
+    event_id, event_type, data = event
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+
+def publish(event_type: str, data: dict):
+    """Sends an event to every open stream and keeps it for replay."""
+    with _lock:
+        event = (next(_ids), event_type, json.dumps(data, separators=(',', ':'), default=str))
+        _buffer.append(event)
+        subscribers = list(_subscribers)
+    for subscriber in subscribers:
+        subscriber.offer(event)
+
+def _replay_since(subscriber, last_event_id):
+    """Queues buffered events after last_event_id, or a resync if some are no longer buffered."""
+    try:
+        last_event_id = int(last_event_id)
+    except (TypeError, ValueError):
+        return
+    latest = _buffer[-1][0] if _buffer else _first_id - 1
+    oldest_kept = _buffer[0][0] if _buffer else _first_id
+    missed = [event for event in _buffer if event[0] > last_event_id]
+    # Older than this process, older than the buffer, or newer than anything sent.
+    if last_event_id < oldest_kept - 1 or last_event_id > latest or len(missed) > SUBSCRIBER_QUEUE_SIZE:
+        subscriber.offer((latest, "resync", json.dumps({"reason": "missed_events"})))
+        return
+    for event in missed:
+        subscriber.offer(event)
+
+def subscribe(last_event_id=None):
+    """
+    Registers a stream. Returns None if streams are disabled (EVENT_STREAM_MAX_CLIENTS = 0).
+    At the limit the oldest stream is closed to make room: a closed tab is only noticed at
+    the next heartbeat, and a live one reconnects and catches up via Last-Event-ID.
+    """
+    with _lock:
+        if config.EVENT_STREAM_MAX_CLIENTS <= 0:
+            return None
+        while len(_subscribers) >= config.EVENT_STREAM_MAX_CLIENTS:
+            oldest = min(_subscribers, key=lambda s: s.opened_at)
+            _subscribers.discard(oldest)
+            oldest.close()
+        subscriber = Subscriber()
+        if last_event_id:
+            _replay_since(subscriber, last_event_id)
+        _subscribers.add(subscriber)
+        return subscriber
+
+def unsubscribe(subscriber):
+    with _lock:
+        _subscribers.discard(subscriber)
+
+def stream(subscriber):
+    """Yields the SSE body for a subscriber until the client goes away or the add-on shuts down."""
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        while not _closing.is_set() and not subscriber.closed:
+            try:
+                event = subscriber.queue.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                # Keeps proxies from timing out the connection and detects closed clients.
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                break
+            if subscriber.overflowed:
+                # Drop the backlog; the client refetches everything once.
+                subscriber.overflowed = False
+                while True:
+                    try:
+                        subscriber.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                with _lock:
+                    latest = _buffer[-1][0] if _buffer else _first_id - 1
+                yield _format((latest, "resync", json.dumps({"reason": "overflow"})))
+                continue
+            yield _format(event)
+    finally:
+        unsubscribe(subscriber)
+
+def get_stats() -> dict:
+    with _lock:
+        return {"subscribers": len(_subscribers), "last_event_id": _buffer[-1][0] if _buffer else 0}
+
+def shutdown():
+    """Ends every open stream so the web server can stop without waiting for them."""
+    _closing.set()
+    with _lock:
+        subscribers = list(_subscribers)
+    for subscriber in subscribers:
+        subscriber.close()
+
+# --- Inventory change helpers (called by db.py after commit) ---
+
+def publish_wine(wine: dict):
+    if wine:
+        publish("wine_upserted", {"wine": dict(wine, b4b_score=formatting.calculate_b4b_score(wine))})
+
+def publish_quantity(vivino_url: str, quantity: int, personal_rating=None):
+    data = {"vivino_url": vivino_url, "quantity": quantity}
+    if personal_rating is not None:
+        data["personal_rating"] = personal_rating
+    publish("quantity_changed", data)
+
+def publish_wine_deleted(vivino_url: str):
+    publish("wine_deleted", {"vivino_url": vivino_url})
+
+def publish_job(job: dict):
+    publish("job_finished", {key: job.get(key) for key in ("id", "kind", "status", "message", "failed")})
+
+def publish_resync(reason: str):
+    publish("resync", {"reason": reason})
@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from . import config
+from . import ha_ws
+
+# Set up a logger specific to this module
+logger = logging.getLogger(__name__)
+
+# WebSocket error codes that correspond to a client-side (4xx) REST failure.
+WS_CLIENT_ERROR_CODES = ("not_found", "invalid_format", "service_validation_error", "unknown_command")
+
+class WSResponse:
+    """
+    Minimal stand-in for requests.Response for calls answered over the HA WebSocket,
+    so callers handle both transports with the same status_code/raise_for_status/json code.
+    """
+
+    def __init__(self, status_code: int, body=None, reason: str = ""):
+        self.status_code = status_code
+        self._body = body
+        self.reason = reason
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} {self.reason} (websocket)", response=self)
+
+def _ws_call(connection, path: str, payload, params, timeout: float):
+    """
+    Sends a REST-style service/event call over the WebSocket connection.
+    Returns a WSResponse, or None if `path` has no WebSocket equivalent (e.g. state writes).
+    """
+    parts = path.strip('/').split('/')
+    try:
+        if len(parts) == 4 and parts[:2] == ["api", "services"]:
+            return_response = bool(params and "return_response" in params)
+            result = connection.call_service(parts[2], parts[3], payload, return_response=return_response, timeout=timeout)
+            # Shape the body like the REST reply so callers can read "service_response".
+            return WSResponse(200, {"service_response": (result or {}).get("response")} if return_response else [])
+        if len(parts) == 3 and parts[:2] == ["api", "events"]:
+            connection.fire_event(parts[2], payload, timeout=timeout)
+            return WSResponse(200, {"message": f"Event {parts[2]} fired."})
+    except ha_ws.HAWebSocketError as e:
+        return WSResponse(400 if e.code in WS_CLIENT_ERROR_CODES else 500, {"message": e.message}, e.code)
+    except ha_ws.HAWebSocketTimeout as e:
+        # Sent but unanswered: HA may have applied it, so surface it like a REST read timeout.
+        raise requests.exceptions.ReadTimeout(f"HA WebSocket call timed out: {e}") from e
+    except Exception as e:
+        # Dropped before a reply: surface it like a network error so callers retry.
+        raise requests.exceptions.ConnectionError(f"HA WebSocket call failed: {e}") from e
+    return None
+
+class HAClient:
+    """
+    Keep-alive HTTP client for the Home Assistant REST API.
+
+    One requests.Session with a sized connection pool is shared by every call,
+    so a full sync reuses the same connection to the supervisor proxy instead
+    of opening one per request. Connection errors and gateway errors
+    (502/503/504, i.e. HA restarting behind the proxy) are retried with
+    exponential backoff. Plain 500s are not retried because service calls such
+    as todo/add_item are not idempotent.
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, base_url: str, token: str, pool_size: int = 8, retries: int = 3, backoff: float = 0.3):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        })
+        retry = Retry(
+            total=retries, connect=retries, read=0, status=retries,
+            backoff_factor=backoff, status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=None, raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _record(self, endpoint: str, elapsed: float, error: bool):
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            elapsed_ms = elapsed * 1000
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def request(self, method: str, path: str, payload=None, timeout: float = 5, params=None):
+        """
+        Sends a request to `path` (e.g. "/api/services/todo/add_item") and returns the
+        response. Raises requests.exceptions.RequestException on network failure;
+        HTTP error statuses are returned (and counted as errors) for the caller to handle.
+        Service calls and events go over the HA WebSocket instead when it is connected.
+        """
+        started_at = time.monotonic()
+        error = True
+        endpoint = f"{method} {path}"
+        try:
+            connection = ha_ws.get_connection() if method == "POST" else None
+            resp = _ws_call(connection, path, payload, params, timeout) if connection else None
+            if resp is not None:
+                endpoint = f"WS {path}"
+            else:
+                resp = self.session.request(method, f"{self.base_url}{path}", json=payload, params=params, timeout=timeout)
+            error = resp.status_code >= 400
+            return resp
+        finally:
+            self._record(endpoint, time.monotonic() - started_at, error)
+
+    def post(self, path: str, payload=None, timeout: float = 5, params=None):
+        return self.request("POST", path, payload, timeout, params)
+
+    def get(self, path: str, timeout: float = 5, params=None):
+        return self.request("GET", path, None, timeout, params)
+
+    def delete(self, path: str, timeout: float = 5):
+        return self.request("DELETE", path, None, timeout)
+
+    def get_stats(self):
+        """Returns per-endpoint call/error counters and latency (average and max, in ms)."""
+        with self._stats_lock:
+            return {
+                endpoint: {
+                    "calls": s["calls"], "errors": s["errors"],
+                    "avg_ms": round(s["total_ms"] / s["calls"], 1) if s["calls"] else 0.0,
+                    "max_ms": round(s["max_ms"], 1)
+                }
+                for endpoint, s in self._stats.items()
+            }
+
+    def close(self):
+        self.session.close()
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Returns the shared HAClient, creating it on first use.
+    Returns None if the HA URL or token is not configured.
+    """
+    global _client
+    if not config.HOME_ASSISTANT_URL or not config.HA_LONG_LIVED_TOKEN:
+        return None
+    with _client_lock:
+        if _client is None:
+            _client = HAClient(
+                config.HOME_ASSISTANT_URL, config.HA_LONG_LIVED_TOKEN,
+                pool_size=config.HA_HTTP_POOL_SIZE, retries=config.HA_HTTP_RETRIES,
+                backoff=config.HA_HTTP_BACKOFF
+            )
+            logger.debug(f"Created HA HTTP client for {config.HOME_ASSISTANT_URL} (pool={config.HA_HTTP_POOL_SIZE}).")
+        return _client
+
+def get_stats():
+    """Returns the shared client's per-endpoint metrics (empty if no client exists yet)."""
+    return _client.get_stats() if _client else {}
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client:
+            _client.close()
+            _client = None
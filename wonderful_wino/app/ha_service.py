@@ -1,20 +1,42 @@
 import requests
 import logging
 import json
+import hashlib
 import os 
-import paho.mqtt.client as mqtt
-import time # <--- NEW IMPORT
+import re
+import unicodedata
+import time
+import threading
 from . import config
 from . import formatting
 from . import db
+from . import ha_client
+from . import jobs
+from . import consumption_stats
 
 # Set up a logger specific to this module
 logger = logging.getLogger(__name__)
 
 # --- NEW MQTT Globals ---
+mqtt = None  # paho.mqtt.client, imported by initialize_mqtt() only when MQTT discovery is on
 mqtt_client = None
 is_mqtt_connected = False
 MQTT_AVAILABILITY_TOPIC = "wonderful_wino/status"
+# HA publishes "online" here when it (re)starts; retained states must be re-sent then.
+MQTT_HA_BIRTH_TOPIC = "homeassistant/status"
+# Single retained JSON document holding every sensor value (MQTT_JSON_STATE mode).
+MQTT_JSON_STATE_TOPIC = "wonderful_wino/sensors/state"
+# Extra (topic_filter, callback) subscriptions registered by other modules, e.g. commands.py.
+_mqtt_subscriptions = []
+MQTT_DISCOVERY_PREFIX = "homeassistant/sensor/wonderful_wino"
+# Hash of the last discovery configs published; retained configs are only re-sent when it changes.
+_discovery_hash = None
+# Discovery state: the last sensor set built, the configs last published ({topic: payload}) and
+# retained configs seen on the broker before our first publish (candidates for retirement).
+_discovery_lock = threading.RLock()
+_current_sensors = {}
+_published_discovery = {}
+_retained_discovery_topics = set()
 MQTT_DEVICE_CONFIG = {
     "identifiers": ["wonderful_wino_addon"],
     "name": "Wonderful Wino",
@@ -33,16 +55,30 @@ def on_connect(client, userdata, flags, rc, properties=None):
         client.publish(MQTT_AVAILABILITY_TOPIC, "online", retain=True)
         # Publish discovery config for all sensors
         _publish_mqtt_discovery_config()
-        # Trigger an immediate sensor update to populate states
-        trigger_sensor_update()
+        client.subscribe(MQTT_HA_BIRTH_TOPIC)
+        # Our retained configs are replayed here, so sensors left over from earlier runs can be retired.
+        client.subscribe(f"{MQTT_DISCOVERY_PREFIX}/+/config")
+        for topic_filter, _callback in _mqtt_subscriptions:
+            client.subscribe(topic_filter, qos=1)
+        # The broker may have lost our retained states; republish everything (off the MQTT network thread)
+        request_full_sensor_publish()
     else:
         logger.error(f"Failed to connect to MQTT broker, return code {rc}")
         is_mqtt_connected = False
 
+def on_ha_birth_message(client, userdata, message):
+    """Republishes all sensor states when HA announces it has (re)started (discovery only if it changed)."""
+    if message.payload.decode('utf-8', errors='ignore').strip().lower() == "online":
+        logger.info("Home Assistant came online. Republishing MQTT sensor states.")
+        _publish_mqtt_discovery_config()
+        request_full_sensor_publish()
+
 def on_disconnect(client, userdata, rc, properties=None):
     """Callback for when the client disconnects."""
-    global is_mqtt_connected
+    global is_mqtt_connected, _discovery_hash
     is_mqtt_connected = False
+    # The broker may come back without our retained configs (e.g. no persistence), so re-send them on reconnect.
+    _discovery_hash = None
     logger.warning(f"Disconnected from MQTT broker. Return code: {rc}")
 
 # --- THIS IS THE FIX ---
@@ -70,13 +106,18 @@ def initialize_mqtt():
         logger.error("MQTT is enabled but MQTT_HOST is not set. Cannot initialize.")
         return
         
-    global mqtt_client
+    global mqtt_client, mqtt
     try:
+        import paho.mqtt.client as mqtt
         # Use MQTTv5
         mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="wonderful_wino_addon")
         mqtt_client.on_connect = on_connect
         mqtt_client.on_disconnect = on_disconnect
         mqtt_client.on_publish = on_publish
+        mqtt_client.message_callback_add(MQTT_HA_BIRTH_TOPIC, on_ha_birth_message)
+        mqtt_client.message_callback_add(f"{MQTT_DISCOVERY_PREFIX}/+/config", on_discovery_config_message)
+        for topic_filter, callback in _mqtt_subscriptions:
+            mqtt_client.message_callback_add(topic_filter, callback)
 
         # Set username and password if provided
         if config.MQTT_USER:
@@ -92,6 +133,16 @@ def initialize_mqtt():
     except Exception as e:
         logger.error(f"Error initializing MQTT client: {e}", exc_info=True)
 
+def add_mqtt_subscription(topic_filter: str, callback):
+    """Registers a topic to subscribe to (on every connect) and its message callback. Call before initialize_mqtt()."""
+    _mqtt_subscriptions.append((topic_filter, callback))
+
+def publish_mqtt_message(topic: str, payload: str, qos: int = 0, retain: bool = False) -> bool:
+    """Publishes an arbitrary message on the shared MQTT client. Returns False if not connected."""
+    if not is_mqtt_connected or not mqtt_client:
+        return False
+    return mqtt_client.publish(topic, payload, qos=qos, retain=retain).rc == mqtt.MQTT_ERR_SUCCESS
+
 def stop_mqtt():
     """Stops the MQTT client loop and disconnects."""
     global mqtt_client
@@ -106,141 +157,328 @@ def stop_mqtt():
         except Exception as e:
             logger.error(f"Error during MQTT shutdown: {e}", exc_info=True)
 
-def _publish_mqtt_discovery_config():
-    """Publishes the MQTT discovery configuration for all sensors."""
+def _sensor_state_topic(entity_name: str) -> str:
+    return f"wonderful_wino/sensor/{entity_name}/state"
+
+def _discovery_topic(entity_name: str) -> str:
+    return f"{MQTT_DISCOVERY_PREFIX}/{entity_name}/config"
+
+def _build_discovery_configs(sensors: dict) -> dict:
+    """Returns {discovery_topic: payload} for every sensor in `sensors` in the current MQTT mode."""
+    configs = {}
+    for sensor_key, sensor_info in sensors.items():
+        entity_name = sensor_info['name']
+
+        config_payload = {
+            "name": sensor_info['friendly_name'],
+            
+            # --- NEW FIX ---
+            # Explicitly set the object_id to match the sensor's 'name'.
+            # This ensures the entity_id becomes "sensor.wwino_red_bottles"
+            # and prevents HA from auto-generating one from the friendly name.
+            "object_id": entity_name,
+
+            # --- NEW FIX 2 ---
+            # Set the unique_id to be the same. This is the simplest
+            # and cleanest unique ID.
+            "unique_id": entity_name,
+            
+            "state_topic": _sensor_state_topic(entity_name),
+            "unit_of_measurement": sensor_info['unit'],
+            "icon": sensor_info['icon'],
+            "device": MQTT_DEVICE_CONFIG,
+            "availability_topic": MQTT_AVAILABILITY_TOPIC,
+            "payload_available": "online",
+            "payload_not_available": "offline"
+        }
+        if config.MQTT_JSON_STATE:
+            # Every entity reads its own field from the shared JSON document.
+            config_payload["state_topic"] = MQTT_JSON_STATE_TOPIC
+            config_payload["value_template"] = f"{{{{ value_json.{sensor_key} }}}}"
+
+        configs[_discovery_topic(entity_name)] = json.dumps(config_payload, sort_keys=True)
+    return configs
+
+def _retire_discovery_topic(discovery_topic: str):
+    """Removes a sensor from HA by clearing its retained discovery config (and per-sensor state)."""
+    entity_name = discovery_topic.split('/')[-2]
+    mqtt_client.publish(discovery_topic, "", retain=True)
+    mqtt_client.publish(_sensor_state_topic(entity_name), "", retain=True)
+    logger.info(f"Retired MQTT sensor: {entity_name}")
+
+def on_discovery_config_message(client, userdata, message):
+    """Sees our retained discovery configs (replayed on subscribe) and retires any sensor we no longer publish."""
+    if not message.payload:
+        return
+    with _discovery_lock:
+        if not _published_discovery:
+            # Nothing published yet this run; decide at the first discovery publish.
+            _retained_discovery_topics.add(message.topic)
+        elif message.topic not in _published_discovery:
+            _retire_discovery_topic(message.topic)
+
+def _publish_mqtt_discovery_config(sensors: dict = None):
+    """
+    Publishes the MQTT discovery configuration for all sensors (the last built set if `sensors` is None).
+    The configs are retained, so they are only re-sent when their content hash changes; sensors that
+    disappeared since the last publish have their configs cleared, which removes them from HA.
+    """
+    global _discovery_hash, _published_discovery
     if not is_mqtt_connected or not mqtt_client:
         logger.warning("Cannot publish MQTT discovery config: not connected.")
         return
-        
-    logger.info("Publishing MQTT discovery configuration for all sensors...")
+
     try:
-        for sensor_key, sensor_info in SENSOR_DEFINITIONS.items():
-            entity_name = sensor_info['name']
-            discovery_topic = f"homeassistant/sensor/wonderful_wino/{entity_name}/config"
-            state_topic = f"wonderful_wino/sensor/{entity_name}/state"
-            
-            config_payload = {
-                "name": sensor_info['friendly_name'],
-                
-                # --- NEW FIX ---
-                # Explicitly set the object_id to match the 'name' from SENSOR_DEFINITIONS.
-                # This ensures the entity_id becomes "sensor.wwino_red_bottles"
-                # and prevents HA from auto-generating one from the friendly name.
-                "object_id": entity_name,
-
-                # --- NEW FIX 2 ---
-                # Set the unique_id to be the same. This is the simplest
-                # and cleanest unique ID.
-                "unique_id": entity_name,
-                
-                "state_topic": state_topic,
-                "unit_of_measurement": sensor_info['unit'],
-                "icon": sensor_info['icon'],
-                "device": MQTT_DEVICE_CONFIG,
-                "availability_topic": MQTT_AVAILABILITY_TOPIC,
-                "payload_available": "online",
-                "payload_not_available": "offline"
-            }
-            
-            mqtt_client.publish(discovery_topic, json.dumps(config_payload), retain=True)
-            logger.debug(f"Published discovery config for: {entity_name}")
-            
+        with _discovery_lock:
+            sensors = sensors if sensors is not None else _current_sensors
+            if not sensors:
+                # No statistics read yet; the first sensor publish will send the configs.
+                return
+            configs = _build_discovery_configs(sensors)
+            retired = (set(_published_discovery) | _retained_discovery_topics) - set(configs)
+            config_hash = hashlib.sha256(json.dumps(configs, sort_keys=True).encode('utf-8')).hexdigest()
+            if config_hash == _discovery_hash and not retired:
+                logger.debug("MQTT discovery configuration unchanged. Skipping publish.")
+                return
+
+            logger.info(f"Publishing MQTT discovery configuration for {len(configs)} sensors...")
+            for discovery_topic, config_payload in configs.items():
+                result = mqtt_client.publish(discovery_topic, config_payload, retain=True)
+                if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                    logger.warning(f"Failed to queue discovery config on {discovery_topic} (rc={result.rc}).")
+                    return
+                logger.debug(f"Published discovery config: {discovery_topic}")
+            for discovery_topic in retired:
+                _retire_discovery_topic(discovery_topic)
+
+            _retained_discovery_topics.clear()
+            _published_discovery = configs
+            _discovery_hash = config_hash
         logger.info("Finished publishing MQTT discovery configuration.")
     except Exception as e:
         logger.error(f"Error publishing MQTT discovery config: {e}", exc_info=True)
 
-def publish_stats_to_mqtt(stats: dict):
-    """Publishes all inventory statistics to their respective MQTT topics."""
+def publish_stats_to_mqtt(sensors: dict, keys=None, refresh_availability: bool = True):
+    """
+    Publishes sensor values (from build_sensor_definitions) to their respective MQTT topics.
+    Only the sensors in `keys` are sent (all of them if None). Returns the keys that were queued.
+    In JSON state mode every sensor goes out in one retained document, whatever `keys` holds.
+    """
     if not is_mqtt_connected or not mqtt_client:
         logger.warning("Cannot publish stats to MQTT: not connected.")
-        return
+        return []
 
     logger.debug("Publishing stats to MQTT topics...")
+    published = []
     try:
-        for key, sensor_info in SENSOR_DEFINITIONS.items():
-            state_value = stats.get(key, 0)
-            entity_name = sensor_info['name']
-            state_topic = f"wonderful_wino/sensor/{entity_name}/state"
-            
-            mqtt_client.publish(state_topic, str(state_value), retain=True)
+        if config.MQTT_JSON_STATE:
+            document = {key: sensor_info['value'] for key, sensor_info in sensors.items()}
+            result = mqtt_client.publish(MQTT_JSON_STATE_TOPIC, json.dumps(document), retain=True)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                published = list(sensors)
+        else:
+            for key in (keys if keys is not None else sensors):
+                sensor_info = sensors[key]
+                state_topic = _sensor_state_topic(sensor_info['name'])
+                
+                result = mqtt_client.publish(state_topic, str(sensor_info['value']), retain=True)
+                if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                    published.append(key)
             
-        # Also refresh availability
-        mqtt_client.publish(MQTT_AVAILABILITY_TOPIC, "online", retain=True)
-        logger.debug("Stats and availability published to MQTT.")
+        if refresh_availability:
+            mqtt_client.publish(MQTT_AVAILABILITY_TOPIC, "online", retain=True)
+        logger.debug(f"Published {len(published)} sensor states to MQTT.")
         
     except Exception as e:
         logger.error(f"Error publishing stats to MQTT: {e}", exc_info=True)
+    return published
 
 
 # --- HA REST API Functions (Original) ---
 
-def _get_ha_headers():
-    """Returns the authorization headers for HA API calls."""
+def _get_ha_client():
+    """Returns the shared, pooled HA REST client (see ha_client.py)."""
     if not config.HA_LONG_LIVED_TOKEN:
         logger.error("Home Assistant Long-Lived Token is not configured.")
         return None
-    return {
-        "Authorization": f"Bearer {config.HA_LONG_LIVED_TOKEN}",
-        "Content-Type": "application/json",
-    }
+    return ha_client.get_client()
 
 # NOTE: The To-Do List and Event firing MUST use the HA REST API as there is no MQTT equivalent.
 # Seeing REST calls here does NOT mean sensor updates are defaulting to REST.
 
-def _remove_ha_todo_item(item_text, headers):
-    """Fires a 'remove_item' call to HA and logs the outcome without halting."""
-    remove_url = f"{config.HOME_ASSISTANT_URL}/api/services/todo/remove_item"
+def is_rest_configured() -> bool:
+    """True when the HA URL and token needed for REST calls are set."""
+    return bool(config.HOME_ASSISTANT_URL and config.HA_LONG_LIVED_TOKEN)
+
+def _is_transient_error(exc, idempotent: bool = True) -> bool:
+    """
+    Network failures and 5xx responses are worth retrying; 4xx responses are not.
+    A read timeout means HA got the call and may have applied it, so calls that aren't
+    idempotent (todo/add_item, events) are not retried after one.
+    """
+    if not idempotent and isinstance(exc, requests.exceptions.ReadTimeout):
+        return False
+    response = getattr(exc, 'response', None)
+    return response is None or response.status_code >= 500
+
+def _remove_ha_todo_item(item_text, client):
+    """
+    Fires a 'remove_item' call to HA and logs the outcome without halting.
+    Returns False only if HA could not be reached at all.
+    """
     payload = { "entity_id": config.TODO_LIST_ENTITY_ID, "item": item_text }
     try:
-        resp = requests.post(remove_url, json=payload, headers=headers, timeout=5)
+        resp = client.post("/api/services/todo/remove_item", payload, timeout=5)
         # Check for any non-successful status code.
         if resp.status_code >= 400:
             logger.debug(f"Pre-sync cleanup for '{item_text}' failed with status {resp.status_code}. This is normal if the item is new.")
         else:
             logger.info(f"Successfully cleared old item '{item_text}' from HA To-Do list.")
+        return True
     except requests.exceptions.RequestException:
         # If the request fails entirely, log it quietly and move on.
         logger.debug(f"Pre-sync cleanup for '{item_text}' failed with a network error. Proceeding.")
+        return False
 
 def sync_wine_to_todo(wine: dict, current_quantity: int):
-    """Adds, updates, or removes a single wine item from the HA To-Do list."""
-    headers = _get_ha_headers()
-    if not headers or not config.HOME_ASSISTANT_URL or not config.TODO_LIST_ENTITY_ID:
+    """
+    Adds, updates, or removes a single wine item from the HA To-Do list.
+    Returns False if HA could not be reached (worth retrying), True otherwise.
+    """
+    client = _get_ha_client()
+    if not client or not config.HOME_ASSISTANT_URL or not config.TODO_LIST_ENTITY_ID:
         logger.error("Cannot sync to HA: Missing URL, Token, or Entity ID configuration.")
-        return
+        return True
     
     item_text = formatting.format_wine_for_todo(wine)
     
     logger.info(f"Starting sync for '{item_text}'.")
+
+    # Known item: update (or remove) it in place by UID, renames included.
+    if wine.get('ha_todo_uid'):
+        result = _sync_todo_item_by_uid(client, wine, item_text, current_quantity)
+        if result is not None:
+            return result
     
     # Perform the "fire and forget" removal of any existing item.
-    _remove_ha_todo_item(item_text, headers)
+    if not _remove_ha_todo_item(item_text, client):
+        return False
 
     if current_quantity > 0:
         description = formatting.build_markdown_description(wine, current_quantity)
-        add_url = f"{config.HOME_ASSISTANT_URL}/api/services/todo/add_item"
         add_payload = {
             "entity_id": config.TODO_LIST_ENTITY_ID,
             "item": item_text,
             "description": description
         }
         try:
-            resp = requests.post(add_url, json=add_payload, headers=headers, timeout=5)
+            resp = client.post("/api/services/todo/add_item", add_payload, timeout=5)
             resp.raise_for_status()
             # Use a clear, general-purpose success message.
             logger.info(f"Successfully synced '{item_text}' to the HA To-Do list.")
                 
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to add/update '{item_text}' in HA To-Do list: {e}")
+            return not _is_transient_error(e, idempotent=False)
+        # todo.add_item returns no response data; the outbox records the new item's UID
+        # with one list read per delivery pass (see record_todo_uids).
+    return True
+
+# --- NEW: UID-based item identity ---
+
+def _sync_todo_item_by_uid(client, wine: dict, item_text: str, current_quantity: int):
+    """
+    Updates (todo.update_item, including a rename) or removes a wine's item by its stored UID.
+    Returns True/False like sync_wine_to_todo, or None if HA no longer has that item,
+    in which case the stale UID is cleared and the caller falls back to the summary path.
+    """
+    uid = wine['ha_todo_uid']
+    if current_quantity > 0:
+        service = "update_item"
+        payload = {
+            "entity_id": config.TODO_LIST_ENTITY_ID, "item": uid, "rename": item_text,
+            "description": formatting.build_markdown_description(wine, current_quantity),
+            "status": "needs_action"
+        }
+    else:
+        service = "remove_item"
+        payload = {"entity_id": config.TODO_LIST_ENTITY_ID, "item": uid}
+    try:
+        resp = client.post(f"/api/services/todo/{service}", payload, timeout=5)
+        resp.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        if _is_transient_error(e):
+            logger.error(f"Failed to {service} '{item_text}' in HA To-Do list: {e}")
+            return False
+        logger.info(f"HA To-Do item {uid} for '{item_text}' no longer exists; re-syncing by summary.")
+        db.set_ha_todo_uids({wine['vivino_url']: None})
+        return None
+    if service == "remove_item":
+        db.set_ha_todo_uids({wine['vivino_url']: None})
+    logger.info(f"Successfully synced '{item_text}' to the HA To-Do list (by UID).")
+    return True
+
+def _lookup_todo_uids(url_by_summary: dict) -> dict:
+    """Reads the list once and returns {vivino_url: uid} for the items whose summary is in `url_by_summary`."""
+    uid_updates = {}
+    for item in get_ha_todo_items() or []:
+        vivino_url = url_by_summary.get(item.get('summary'))
+        if vivino_url and item.get('uid'):
+            uid_updates[vivino_url] = item['uid']
+    return uid_updates
+
+def record_todo_uids(wines: list):
+    """Stores the UIDs of the given wines' items with a single list read."""
+    url_by_summary = {formatting.format_wine_for_todo(wine): wine['vivino_url'] for wine in wines if wine.get('vivino_url')}
+    uid_updates = _lookup_todo_uids(url_by_summary) if url_by_summary else {}
+    if uid_updates:
+        db.set_ha_todo_uids(uid_updates)
+
+def _render_todo_item(wine: dict, quantity: int):
+    """Returns the (summary, description) pair the To-Do list shows for a wine."""
+    summary = formatting.format_wine_for_todo(wine)
+    description = formatting.build_markdown_description(wine, quantity) if quantity > 0 else None
+    return summary, description
+
+def sync_wine_to_todo_if_changed(previous_wine: dict, wine: dict):
+    """
+    Syncs a wine to the HA To-Do list only when its rendered item differs from
+    the one rendered from `previous_wine` (the row before the write).
+    If the summary text itself changed, the stale item is removed first.
+    Returns False if HA could not be reached (worth retrying), True otherwise.
+    """
+    current_quantity = wine.get('quantity', 0)
+    if previous_wine:
+        previous_quantity = previous_wine.get('quantity', 0)
+        old_summary, old_description = _render_todo_item(previous_wine, previous_quantity)
+        new_summary, new_description = _render_todo_item(wine, current_quantity)
+        if (old_summary, old_description) == (new_summary, new_description):
+            logger.debug(f"To-Do item for '{new_summary}' is unchanged. Skipping HA sync.")
+            return True
+        # With a stored UID the item is renamed in place; otherwise the old summary is removed.
+        if old_summary != new_summary and previous_quantity > 0 and not wine.get('ha_todo_uid'):
+            client = _get_ha_client()
+            if client and config.TODO_LIST_ENTITY_ID and not _remove_ha_todo_item(old_summary, client):
+                return False
+    return sync_wine_to_todo(wine, current_quantity)
+
+# Wine columns that feed get_inventory_statistics(); other edits leave the sensors as they are.
+SENSOR_SOURCE_FIELDS = ('quantity', 'wine_type', 'needs_review', 'country')
+
+def changes_affect_sensors(changes: dict) -> bool:
+    """Returns True if a {column: (old, new)} change set can alter any HA sensor value."""
+    return any(field in changes for field in SENSOR_SOURCE_FIELDS)
 
 def fire_consumption_event(wine_data: dict):
-    """Fires a 'wonderful_wino_wine_consumed' event to the HA event bus."""
-    headers = _get_ha_headers()
-    if not headers or not config.HOME_ASSISTANT_URL:
+    """
+    Fires a 'wonderful_wino_wine_consumed' event to the HA event bus.
+    Returns False if HA could not be reached (worth retrying), True otherwise.
+    """
+    client = _get_ha_client()
+    if not client or not config.HOME_ASSISTANT_URL:
         logger.error("Cannot fire HA event: Missing URL or Token configuration.")
-        return
+        return True
 
-    event_url = f"{config.HOME_ASSISTANT_URL}/api/events/wonderful_wino_wine_consumed"
     payload = {
         "name": wine_data.get('name'),
         "vintage": wine_data.get('vintage'),
@@ -251,43 +489,168 @@ def fire_consumption_event(wine_data: dict):
         "vivino_url": wine_data.get('vivino_url')
     }
     try:
-        resp = requests.post(event_url, json=payload, headers=headers, timeout=5)
+        resp = client.post("/api/events/wonderful_wino_wine_consumed", payload, timeout=5)
         resp.raise_for_status()
         logger.info(f"Successfully fired 'wonderful_wino_wine_consumed' event for '{wine_data.get('name')}'")
+        return True
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to fire HA event: {e}")
+        return not _is_transient_error(e, idempotent=False)
 
 
-def sync_all_wines_to_ha(all_wines: list):
-    """Performs a simple sync of all provided wines to the HA To-Do list."""
+def sync_all_wines_to_ha(all_wines: list, job=None):
+    """Performs a simple sync of all provided wines to the HA To-Do list (bounded-concurrency, rate-limited)."""
     logger.info(f"Starting sync of {len(all_wines)} wines to HA To-Do list.")
     on_hand_wines = [wine for wine in all_wines if wine.get('quantity', 0) > 0]
-    for wine in on_hand_wines:
-        sync_wine_to_todo(wine, wine.get('quantity', 0))
+    # Each wine costs a remove plus an add.
+    jobs.bulk_map(lambda wine: sync_wine_to_todo(wine, wine.get('quantity', 0)), on_hand_wines, cost=2, job=job)
+    # One list read for the whole batch to remember the items' UIDs.
+    record_todo_uids(on_hand_wines)
     logger.info("Completed sync.")
 
-def force_clear_ha_list():
-    """Gets all wines ever in the DB and attempts to remove them from HA."""
+def force_clear_ha_list(historical_wines=None, job=None):
+    """Gets all wines ever in the DB (unless given) and attempts to remove them from HA."""
     logger.warning("Performing a force-clear of Home Assistant To-Do list.")
-    headers = _get_ha_headers()
-    if not headers:
+    client = _get_ha_client()
+    if not client:
         return
 
-    historical_wines = db.get_all_historical_wines()
+    if historical_wines is None:
+        historical_wines = db.get_all_historical_wines()
     if not historical_wines:
         logger.info("No historical wines found in DB to clear from HA.")
         return
 
     logger.info(f"Attempting to remove {len(historical_wines)} historical wine entries from HA.")
-    for wine in historical_wines:
-        item_text = formatting.format_wine_for_todo(wine)
-        _remove_ha_todo_item(item_text, headers)
+    item_texts = {formatting.format_wine_for_todo(wine) for wine in historical_wines}
+    jobs.bulk_map(lambda item_text: _remove_ha_todo_item(item_text, client), item_texts, job=job)
     
     logger.info("Force-clear operation completed.")
 
 
-# --- HA SENSORS (Original definitions) ---
+# --- NEW: Diff-based To-Do reconciliation ---
 
+def get_ha_todo_items():
+    """
+    Reads the To-Do list through todo.get_items (with response data).
+    Returns a list of item dicts (summary, uid, status, description) or None if it can't be read.
+    """
+    client = _get_ha_client()
+    if not client or not config.TODO_LIST_ENTITY_ID:
+        return None
+    try:
+        resp = client.post(
+            "/api/services/todo/get_items", {"entity_id": config.TODO_LIST_ENTITY_ID},
+            timeout=10, params={"return_response": ""}
+        )
+        resp.raise_for_status()
+        response = resp.json().get("service_response", {})
+        return response.get(config.TODO_LIST_ENTITY_ID, {}).get("items", [])
+    except (requests.exceptions.RequestException, ValueError, AttributeError) as e:
+        logger.error(f"Failed to read HA To-Do list items: {e}")
+        return None
+
+def _call_todo_service(client, service: str, payload: dict) -> bool:
+    payload = dict(payload, entity_id=config.TODO_LIST_ENTITY_ID)
+    try:
+        resp = client.post(f"/api/services/todo/{service}", payload, timeout=10)
+        resp.raise_for_status()
+        return True
+    except requests.exceptions.RequestException as e:
+        logger.error(f"HA todo.{service} failed: {e}")
+        return False
+
+def reconcile_todo_list(all_wines: list, job=None, known_wines=None):
+    """
+    Brings the HA To-Do list in line with the on-hand wines using the fewest calls:
+    one get_items, one batched remove_item for every stale or duplicate item, an
+    update_item per item whose description (or completed status) is out of date, and
+    an add_item per missing wine.
+    Only items Wonderful Wino put there are removed: those whose UID is stored on a wine
+    and those whose summary is rendered from one of `known_wines` (defaults to every
+    wine in the DB). Anything else on the list, e.g. items typed in by hand, is left alone.
+    Updates and adds run through jobs.bulk_map (bounded concurrency, rate-limited).
+    Returns a summary dict, or None if the list couldn't be read (caller may fall back).
+    """
+    client = _get_ha_client()
+    if not client or not config.TODO_LIST_ENTITY_ID:
+        logger.error("Cannot reconcile HA To-Do list: Missing URL, Token, or Entity ID configuration.")
+        return None
+    current_items = get_ha_todo_items()
+    if current_items is None:
+        return None
+
+    desired, wine_urls, summary_by_uid = {}, {}, {}
+    for wine in all_wines:
+        quantity = wine.get('quantity', 0)
+        if quantity > 0:
+            summary, description = _render_todo_item(wine, quantity)
+            desired[summary] = description
+            wine_urls[summary] = wine.get('vivino_url')
+            if wine.get('ha_todo_uid'):
+                summary_by_uid[wine['ha_todo_uid']] = summary
+
+    if known_wines is None:
+        known_wines = db.get_all_historical_wines()
+    own_uids = {wine['ha_todo_uid'] for wine in list(known_wines) + list(all_wines) if wine.get('ha_todo_uid')}
+    own_summaries = {formatting.format_wine_for_todo(wine) for wine in known_wines}
+
+    seen = set()
+    to_remove, to_update, uid_updates = [], [], {}
+    kept = 0
+    for item in current_items:
+        uid = item.get('uid')
+        # Items we hold a UID for match their wine even if the wine was renamed since.
+        summary = summary_by_uid.get(uid, item.get('summary'))
+        if summary not in desired or summary in seen:
+            if uid not in own_uids and summary not in own_summaries and summary not in desired:
+                kept += 1  # Not ours: leave it on the list.
+                continue
+            # Prefer the uid so duplicates with the same summary are removed individually.
+            to_remove.append(uid or item.get('summary'))
+            continue
+        seen.add(summary)
+        if uid and uid not in summary_by_uid and wine_urls[summary]:
+            uid_updates[wine_urls[summary]] = uid
+        if (item.get('summary') != summary or (item.get('description') or None) != desired[summary]
+                or item.get('status') == 'completed'):
+            to_update.append((uid or summary, summary))
+    to_add = [summary for summary in desired if summary not in seen]
+
+    result = {"removed": 0, "updated": 0, "added": 0, "unchanged": len(seen) - len(to_update),
+              "kept": kept, "failed": 0}
+    if to_remove:
+        if _call_todo_service(client, "remove_item", {"item": to_remove}):
+            result["removed"] = len(to_remove)
+        else:
+            result["failed"] += len(to_remove)
+    updated = jobs.bulk_map(
+        lambda update: _call_todo_service(client, "update_item", {
+            "item": update[0], "rename": update[1], "description": desired[update[1]], "status": "needs_action"
+        }), to_update, job=job
+    )
+    added = jobs.bulk_map(
+        lambda summary: _call_todo_service(client, "add_item", {"item": summary, "description": desired[summary]}),
+        to_add, job=job
+    )
+    result["updated"] = sum(1 for ok in updated if ok)
+    result["added"] = sum(1 for ok in added if ok)
+    result["failed"] += sum(1 for ok in updated + added if ok is False)
+
+    # Remember the UIDs of matched and newly added items so later syncs update them in place.
+    if added and any(added):
+        uid_updates.update(_lookup_todo_uids({summary: wine_urls[summary] for summary in to_add}))
+    if uid_updates:
+        db.set_ha_todo_uids(uid_updates)
+
+    logger.info(f"Reconciled HA To-Do list: {result}")
+    return result
+
+
+# --- HA SENSORS ---
+
+# Cellar-level sensors. Per-type (and optional per-country) sensors are generated
+# from the grouped statistics by build_sensor_definitions().
 SENSOR_DEFINITIONS = {
     'total_bottles': {
         'name': 'wwino_total_bottles',
@@ -295,72 +658,12 @@ SENSOR_DEFINITIONS = {
         'unit': 'bottles',
         'icon': 'mdi:bottle-wine'
     },
-    'red_bottles': {
-        'name': 'wwino_red_bottles',
-        'friendly_name': 'Wino Red Bottles',
-        'unit': 'bottles',
-        'icon': 'mdi:bottle-wine-outline'
-    },
-    'white_bottles': {
-        'name': 'wwino_white_bottles',
-        'friendly_name': 'Wino White Bottles',
-        'unit': 'bottles',
-        'icon': 'mdi:bottle-wine-outline'
-    },
-    'sparkling_bottles': {
-        'name': 'wwino_sparkling_bottles',
-        'friendly_name': 'Wino Sparkling Bottles',
-        'unit': 'bottles',
-        'icon': 'mdi:bottle-wine-outline'
-    },
-    'rose_bottles': {
-        'name': 'wwino_rose_bottles',
-        'friendly_name': 'Wino Rosé Bottles',
-        'unit': 'bottles',
-        'icon': 'mdi:bottle-wine-outline'
-    },
-    'dessert_bottles': {
-        'name': 'wwino_dessert_bottles',
-        'friendly_name': 'Wino Dessert Bottles',
-        'unit': 'bottles',
-        'icon': 'mdi:bottle-wine-outline'
-    },
     'unique_wines': {
         'name': 'wwino_unique_wines',
         'friendly_name': 'Wino Unique Wines',
         'unit': 'wines',
         'icon': 'mdi:glass-wine'
     },
-    'unique_red_wines': {
-        'name': 'wwino_unique_red_wines',
-        'friendly_name': 'Wino Unique Red Wines',
-        'unit': 'wines',
-        'icon': 'mdi:glass-wine'
-    },
-    'unique_white_wines': {
-        'name': 'wwino_unique_white_wines',
-        'friendly_name': 'Wino Unique White Wines',
-        'unit': 'wines',
-        'icon': 'mdi:glass-wine'
-    },
-    'unique_sparkling_wines': {
-        'name': 'wwino_unique_sparkling_wines',
-        'friendly_name': 'Wino Unique Sparkling Wines',
-        'unit': 'wines',
-        'icon': 'mdi:glass-wine'
-    },
-    'unique_rose_wines': {
-        'name': 'wwino_unique_rose_wines',
-        'friendly_name': 'Wino Unique Rosé Wines',
-        'unit': 'wines',
-        'icon': 'mdi:glass-wine'
-    },
-    'unique_dessert_wines': {
-        'name': 'wwino_unique_dessert_wines',
-        'friendly_name': 'Wino Unique Dessert Wines',
-        'unit': 'wines',
-        'icon': 'mdi:glass-wine'
-    },
     'needs_review': {
         'name': 'wwino_needs_review',
         'friendly_name': 'Wino Wines Needing Review',
@@ -369,24 +672,80 @@ SENSOR_DEFINITIONS = {
     }
 }
 
-def update_ha_sensors(stats: dict):
+# Wine types that always have sensors (reporting 0 when none are on hand).
+# Any other type found in the cellar gets sensors while it has bottles.
+CORE_WINE_TYPES = ('Red', 'White', 'Sparkling', 'Rosé', 'Dessert', 'Fortified')
+
+def _slugify(text: str) -> str:
+    """'Rosé' -> 'rose', 'New Zealand' -> 'new_zealand' (used in entity ids)."""
+    ascii_text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '_', ascii_text.lower()).strip('_')
+
+def build_sensor_definitions(stats: dict) -> dict:
+    """
+    Turns get_inventory_statistics() output into the sensor set to publish:
+    {sensor_key: {'name', 'friendly_name', 'unit', 'icon', 'value'}}, in display order.
+    Entity names match the original fixed sensors (e.g. wwino_red_bottles, wwino_unique_rose_wines).
+    Rolling consumption sensors are added when stats has a 'consumption' entry
+    (consumption_stats.get_window_stats()); an average with no ratings is None.
+    """
+    by_type = stats.get('by_type', {})
+    wine_types = list(CORE_WINE_TYPES) + sorted(t for t in by_type if t not in CORE_WINE_TYPES)
+    typed = [(wine_type, _slugify(wine_type)) for wine_type in wine_types]
+    sensors = {}
+
+    def add(key, name, friendly_name, unit, icon, value):
+        if key not in sensors:
+            sensors[key] = {'name': name, 'friendly_name': friendly_name, 'unit': unit, 'icon': icon, 'value': value}
+
+    def add_cellar(key):
+        info = SENSOR_DEFINITIONS[key]
+        add(key, info['name'], info['friendly_name'], info['unit'], info['icon'], stats.get(key, 0))
+
+    add_cellar('total_bottles')
+    for wine_type, slug in typed:
+        if slug:
+            add(f"{slug}_bottles", f"wwino_{slug}_bottles", f"Wino {wine_type} Bottles", 'bottles',
+                'mdi:bottle-wine-outline', by_type.get(wine_type, {}).get('bottles', 0))
+    add_cellar('unique_wines')
+    for wine_type, slug in typed:
+        if slug:
+            add(f"unique_{slug}_wines", f"wwino_unique_{slug}_wines", f"Wino Unique {wine_type} Wines", 'wines',
+                'mdi:glass-wine', by_type.get(wine_type, {}).get('wines', 0))
+    add_cellar('needs_review')
+    for days, window in sorted(stats.get('consumption', {}).items()):
+        add(f"consumed_{days}d", f"wwino_consumed_{days}d", f"Wino Consumed Last {days} Days", 'bottles',
+            'mdi:glass-wine', window['consumed'])
+        add(f"avg_rating_{days}d", f"wwino_avg_rating_{days}d", f"Wino Average Rating Last {days} Days", '★',
+            'mdi:star', window['avg_rating'])
+    for country, counts in sorted(stats.get('by_country', {}).items()):
+        slug = _slugify(country)
+        if slug:
+            add(f"country_{slug}_bottles", f"wwino_country_{slug}_bottles", f"Wino {country} Bottles", 'bottles',
+                'mdi:earth', counts.get('bottles', 0))
+    return sensors
+
+def update_ha_sensors(sensors: dict, keys=None):
     """
-    Pushes all inventory statistics to Home Assistant as sensor states.
+    Pushes sensor values (from build_sensor_definitions) to Home Assistant as sensor states.
     (This is the original "ghost" entity method via REST API)
+    Only the sensors in `keys` are sent (all of them if None). Returns the keys that HA accepted.
     """
-    headers = _get_ha_headers()
-    if not headers or not config.HOME_ASSISTANT_URL:
+    client = _get_ha_client()
+    if not client or not config.HOME_ASSISTANT_URL:
         logger.error("Cannot update HA sensors (REST): Missing URL or Token configuration.")
-        return
+        return []
 
     logger.debug("Publishing stats to HA via REST API...")
-    for key, sensor_info in SENSOR_DEFINITIONS.items():
-        state_value = stats.get(key, 0)
+    pending = list(keys if keys is not None else sensors)
+    published = []
+    while pending:
+        key = pending.pop(0)
+        sensor_info = sensors[key]
         entity_id = f"sensor.{sensor_info['name']}"
-        sensor_url = f"{config.HOME_ASSISTANT_URL}/api/states/{entity_id}"
         
         payload = {
-            "state": str(state_value),
+            "state": "unknown" if sensor_info['value'] is None else str(sensor_info['value']),
             "attributes": {
                 "unit_of_measurement": sensor_info['unit'],
                 "friendly_name": sensor_info['friendly_name'],
@@ -395,29 +754,111 @@ def update_ha_sensors(stats: dict):
         }
         
         try:
-            resp = requests.post(sensor_url, json=payload, headers=headers, timeout=3)
+            resp = client.post(f"/api/states/{entity_id}", payload, timeout=3)
             resp.raise_for_status()
+            published.append(key)
             logger.debug(f"Successfully updated HA sensor (REST): {entity_id}")
+            # 201 means HA had no such state, i.e. it restarted and dropped our REST-only entities.
+            if resp.status_code == 201 and _has_been_published(key):
+                missing = [k for k in sensors if k not in published and k not in pending]
+                if missing:
+                    logger.info("Home Assistant appears to have restarted. Republishing all sensors (REST).")
+                    pending.extend(missing)
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to update HA sensor {entity_id} (REST): {e}")
+    return published
+
+def remove_ha_sensors(entity_names):
+    """Deletes REST-created sensor states for categories that no longer exist."""
+    client = _get_ha_client()
+    if not client:
+        return
+    for entity_name in entity_names:
+        try:
+            resp = client.delete(f"/api/states/sensor.{entity_name}", timeout=3)
+            if resp.status_code not in (200, 404):
+                resp.raise_for_status()
+            logger.info(f"Retired HA sensor (REST): sensor.{entity_name}")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to remove HA sensor sensor.{entity_name} (REST): {e}")
 
 # --- MODIFIED ROUTER FUNCTION ---
 
+# --- NEW: Delta publishing state ---
+# Last value successfully sent for each sensor. Only sensors whose value differs
+# are published, except on a full publish (startup, MQTT reconnect, HA restart,
+# or the periodic heartbeat), which re-sends everything.
+_published_lock = threading.Lock()
+_sensor_publish_lock = threading.Lock()
+_last_published = {}
+_published_entities = {}
+_full_publish_requested = True
+_last_full_publish_at = 0.0
+
+def _has_been_published(key) -> bool:
+    with _published_lock:
+        return key in _last_published
+
+def _select_sensors_to_publish(sensors: dict):
+    """Returns (keys, is_full) for this publish."""
+    with _published_lock:
+        heartbeat_seconds = config.SENSOR_HEARTBEAT_MINUTES * 60
+        heartbeat_due = heartbeat_seconds > 0 and time.monotonic() - _last_full_publish_at >= heartbeat_seconds
+        if _full_publish_requested or heartbeat_due:
+            return list(sensors), True
+        return [key for key, info in sensors.items() if _last_published.get(key) != str(info['value'])], False
+
+def _record_published(sensors: dict, published_keys, is_full: bool):
+    global _full_publish_requested, _last_full_publish_at
+    with _published_lock:
+        for key in published_keys:
+            _last_published[key] = str(sensors[key]['value'])
+            _published_entities[key] = sensors[key]['name']
+        if is_full and set(published_keys) >= set(sensors):
+            _full_publish_requested = False
+            _last_full_publish_at = time.monotonic()
+
+def _forget_retired_sensors(sensors: dict) -> dict:
+    """Drops sensors that are no longer in the set from the delta cache. Returns {key: entity_name} of those."""
+    with _published_lock:
+        retired = {key: name for key, name in _published_entities.items() if key not in sensors}
+        for key in retired:
+            _published_entities.pop(key, None)
+            _last_published.pop(key, None)
+        return retired
+
+def request_full_sensor_publish():
+    """Forces the next refresh to re-send every sensor, then schedules it."""
+    global _full_publish_requested
+    with _published_lock:
+        _full_publish_requested = True
+    request_sensor_refresh()
+
 def trigger_sensor_update():
     """
     A single function to fetch statistics and update HA sensors.
     This now acts as a router, deciding *how* to publish based on config.
+    Only sensors whose value changed since the last successful publish are sent.
     """
-    try:
-        # Add a very short delay to prevent a race condition.
-        # This ensures any database commit (e.g., from consume_wine)
-        # has finalized before we read the new stats.
-        time.sleep(0.5) # Wait 500ms
+    # Serialized so two publishes can't interleave and leave the delta cache out of step with HA.
+    with _sensor_publish_lock:
+        _publish_sensor_stats()
 
-        stats = db.get_inventory_statistics()
+def _publish_sensor_stats():
+    global _current_sensors
+    try:
+        stats = db.get_inventory_statistics(include_countries=config.SENSOR_PER_COUNTRY)
         if not stats:
             logger.warning("Could not retrieve stats to update HA sensors.")
             return
+        stats['consumption'] = consumption_stats.get_window_stats()
+
+        sensors = build_sensor_definitions(stats)
+        retired = _forget_retired_sensors(sensors)
+        keys, is_full = _select_sensors_to_publish(sensors)
+        if not keys and not retired:
+            logger.debug("Sensor values unchanged since last publish. Nothing to send.")
+            return
             
         # --- This is the new router logic ---
         # Also check against the string "true" to catch improperly parsed config.
@@ -425,16 +866,82 @@ def trigger_sensor_update():
         
         if is_mqtt_enabled:
             if is_mqtt_connected:
-                logger.info("MQTT discovery enabled and connected. Publishing sensor states via MQTT.")
-                publish_stats_to_mqtt(stats)
+                logger.info(f"MQTT discovery enabled and connected. Publishing {len(keys)} sensor states via MQTT.")
+                with _discovery_lock:
+                    _current_sensors = sensors
+                # Creates configs for new categories and retires vanished ones (no-op if unchanged).
+                _publish_mqtt_discovery_config(sensors)
+                if keys:
+                    _record_published(sensors, publish_stats_to_mqtt(sensors, keys, refresh_availability=is_full), is_full)
             else:
                 # Don't log an error, just a warning. The client might be reconnecting.
                 logger.warning("MQTT is enabled but not connected. Skipping sensor update.")
         else:
             # The "old" way
             # Added explicit log to confirm why REST is being used.
-            logger.info("MQTT discovery disabled in config. Updating sensors via HA REST API.") 
-            update_ha_sensors(stats)
+            logger.info(f"MQTT discovery disabled in config. Updating {len(keys)} sensors via HA REST API.") 
+            if retired:
+                remove_ha_sensors(retired.values())
+            if keys:
+                published = update_ha_sensors(sensors, keys)
+                # A detected HA restart turns a delta publish into a full one.
+                _record_published(sensors, published, is_full or set(published) >= set(sensors))
             
     except Exception as e:
-        logger.error(f"An unexpected error occurred during trigger_sensor_update: {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"An unexpected error occurred during trigger_sensor_update: {e}", exc_info=True)
+
+# --- NEW: Coalesced sensor refresh ---
+# Callers signal after their DB commit instead of publishing directly. The first
+# signal starts a refresher thread; signals arriving
+# during the debounce window are absorbed into it, and a signal that arrives while
+# the stats are being read/published causes one more pass, so the last committed
+# state is always what ends up in HA.
+_sensor_refresh_lock = threading.Lock()
+_sensor_refresh_scheduled = False
+_sensor_refresh_dirty = False
+_sensor_refresh_thread = None
+
+def _run_sensor_refresh():
+    global _sensor_refresh_scheduled, _sensor_refresh_dirty
+    while True:
+        time.sleep(config.SENSOR_REFRESH_DEBOUNCE)
+        with _sensor_refresh_lock:
+            _sensor_refresh_dirty = False
+        try:
+            trigger_sensor_update()
+        except Exception as e:
+            logger.error(f"Sensor refresh failed: {e}", exc_info=True)
+        with _sensor_refresh_lock:
+            if not _sensor_refresh_dirty:
+                _sensor_refresh_scheduled = False
+                return
+
+def _sensor_heartbeat_loop():
+    interval = config.SENSOR_HEARTBEAT_MINUTES * 60
+    while True:
+        time.sleep(interval)
+        request_full_sensor_publish()
+
+def start_sensor_heartbeat():
+    """Starts a thread that forces a full sensor republish every SENSOR_HEARTBEAT_MINUTES (0 disables)."""
+    if config.SENSOR_HEARTBEAT_MINUTES <= 0:
+        return
+    threading.Thread(target=_sensor_heartbeat_loop, name="sensor-heartbeat", daemon=True).start()
+    logger.info(f"Sensor heartbeat enabled: full republish every {config.SENSOR_HEARTBEAT_MINUTES} minutes.")
+
+def request_sensor_refresh():
+    """Asks for the HA sensors to be republished; bursts of requests collapse into one publish."""
+    global _sensor_refresh_scheduled, _sensor_refresh_dirty, _sensor_refresh_thread
+    with _sensor_refresh_lock:
+        _sensor_refresh_dirty = True
+        if _sensor_refresh_scheduled:
+            return
+        _sensor_refresh_scheduled = True
+        _sensor_refresh_thread = threading.Thread(target=_run_sensor_refresh, name="sensor-refresh", daemon=True)
+        _sensor_refresh_thread.start()
+
+def flush_sensor_refresh(timeout=10):
+    """Waits (bounded by `timeout`) for a scheduled sensor refresh to publish, e.g. at shutdown."""
+    thread = _sensor_refresh_thread
+    if thread and thread.is_alive():
+        thread.join(timeout)
\ No newline at end of file
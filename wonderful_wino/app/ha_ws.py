@@ -0,0 +1,229 @@
+import json
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse, urlunparse
+from . import config
+
+try:
+    import websocket  # websocket-client
+except ImportError:  # pragma: no cover - optional dependency
+    websocket = None
+
+# Set up a logger specific to this module
+logger = logging.getLogger(__name__)
+
+# Optional persistent connection to the Home Assistant WebSocket API.
+# One authenticated socket carries every service call and event; requests are
+# tagged with message ids so many can be in flight at once (the reconciler's
+# bulk calls pipeline over it). A background thread reads replies, resolves the
+# matching futures and reconnects with backoff if the socket drops. ha_client
+# sends through this connection when it is up and falls back to REST otherwise.
+
+class HAWebSocketError(Exception):
+    """A command that HA answered with success: false."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+
+class HAWebSocketTimeout(TimeoutError):
+    """A command HA did not answer in time. It may still have been applied, so it is not safe to resend."""
+
+def websocket_url(base_url: str) -> str:
+    """Maps the configured HA URL to its WebSocket endpoint (the Supervisor proxy uses /core/websocket)."""
+    parsed = urlparse(base_url.rstrip('/'))
+    scheme = "wss" if parsed.scheme == "https" else "ws"
+    path = parsed.path + ("/websocket" if parsed.path.endswith("/core") else "/api/websocket")
+    return urlunparse(parsed._replace(scheme=scheme, path=path))
+
+class HAWebSocketClient:
+    """Authenticated, auto-reconnecting HA WebSocket connection with id-tagged, pipelined requests."""
+
+    def __init__(self, url: str, token: str, connect_timeout: float = 10, max_backoff: float = 30):
+        self.url = url
+        self.token = token
+        self.connect_timeout = connect_timeout
+        self.max_backoff = max_backoff
+        self._ws = None
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._next_id = 1
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"connects": 0, "disconnects": 0, "sent": 0, "errors": 0}
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ha-websocket", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        ws = self._ws
+        if ws:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(5)
+
+    def wait_connected(self, timeout: float) -> bool:
+        return self._connected.wait(timeout)
+
+    def _authenticate(self, ws):
+        hello = json.loads(ws.recv())
+        if hello.get("type") != "auth_required":
+            raise ConnectionError(f"Unexpected greeting from HA: {hello.get('type')}")
+        ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+        reply = json.loads(ws.recv())
+        if reply.get("type") != "auth_ok":
+            raise PermissionError(f"HA WebSocket authentication failed: {reply.get('message', reply.get('type'))}")
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                ws = websocket.create_connection(self.url, timeout=self.connect_timeout, enable_multithread=True)
+                self._authenticate(ws)
+                ws.settimeout(None)
+                self._ws = ws
+                self._connected.set()
+                self.stats["connects"] += 1
+                backoff = 1
+                logger.info(f"Connected to HA WebSocket API at {self.url}.")
+                self._read_loop(ws)
+            except PermissionError as e:
+                logger.error(str(e))
+            except Exception as e:
+                if not self._stop.is_set():
+                    logger.warning(f"HA WebSocket connection error: {e}")
+            finally:
+                was_connected = self._connected.is_set()
+                self._connected.clear()
+                if self._ws:
+                    try:
+                        self._ws.close()
+                    except Exception:
+                        pass
+                    self._ws = None
+                if was_connected:
+                    self.stats["disconnects"] += 1
+                self._fail_pending(ConnectionError("HA WebSocket connection lost"))
+            if self._stop.wait(backoff):
+                break
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _read_loop(self, ws):
+        while not self._stop.is_set():
+            raw = ws.recv()
+            if not raw:
+                raise ConnectionError("HA WebSocket closed by server")
+            message = json.loads(raw)
+            with self._pending_lock:
+                future = self._pending.pop(message.get("id"), None)
+            if future is None:
+                continue
+            if message.get("type") == "pong" or message.get("success"):
+                future.set_result(message.get("result"))
+            else:
+                error = message.get("error") or {}
+                self.stats["errors"] += 1
+                future.set_exception(HAWebSocketError(error.get("code", "unknown_error"), error.get("message", "")))
+
+    def _fail_pending(self, exc):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    def send(self, payload: dict) -> Future:
+        """Sends a command with a fresh message id and returns a Future for its result."""
+        if not self.connected:
+            raise ConnectionError("HA WebSocket is not connected")
+        future = Future()
+        with self._send_lock:
+            message_id = self._next_id
+            self._next_id += 1
+            with self._pending_lock:
+                self._pending[message_id] = future
+            try:
+                self._ws.send(json.dumps(dict(payload, id=message_id)))
+            except Exception as e:
+                with self._pending_lock:
+                    self._pending.pop(message_id, None)
+                raise ConnectionError(f"HA WebSocket send failed: {e}") from e
+        self.stats["sent"] += 1
+        future.message_id = message_id
+        return future
+
+    def _call(self, payload: dict, timeout: float):
+        """Sends a command and waits for its result. A timed-out command is dropped from the pending map."""
+        future = self.send(payload)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            with self._pending_lock:
+                self._pending.pop(future.message_id, None)
+            raise HAWebSocketTimeout(f"No reply from HA within {timeout}s") from None
+
+    def call_service(self, domain: str, service: str, service_data: dict = None, return_response: bool = False, timeout: float = 10):
+        """Calls an HA service and returns HA's result ({"context", "response"})."""
+        payload = {"type": "call_service", "domain": domain, "service": service, "service_data": service_data or {}}
+        if return_response:
+            payload["return_response"] = True
+        return self._call(payload, timeout)
+
+    def fire_event(self, event_type: str, event_data: dict = None, timeout: float = 10):
+        return self._call({"type": "fire_event", "event_type": event_type, "event_data": event_data or {}}, timeout)
+
+    def ping(self, timeout: float = 5):
+        return self._call({"type": "ping"}, timeout)
+
+_client = None
+_client_lock = threading.Lock()
+
+def start():
+    """Starts the shared WebSocket connection if enabled and configured. Returns the client or None."""
+    global _client
+    if not config.HA_USE_WEBSOCKET:
+        return None
+    if websocket is None:
+        logger.warning("HA_USE_WEBSOCKET is enabled but the 'websocket-client' package is not installed. Using REST.")
+        return None
+    if not config.HOME_ASSISTANT_URL or not config.HA_LONG_LIVED_TOKEN:
+        return None
+    with _client_lock:
+        if _client is None:
+            _client = HAWebSocketClient(websocket_url(config.HOME_ASSISTANT_URL), config.HA_LONG_LIVED_TOKEN)
+            _client.start()
+        return _client
+
+def get_connection():
+    """Returns the shared client if it is currently connected, else None."""
+    client = _client
+    return client if client is not None and client.connected else None
+
+def get_stats():
+    client = _client
+    if client is None:
+        return {"enabled": bool(config.HA_USE_WEBSOCKET), "connected": False}
+    return dict(client.stats, enabled=True, connected=client.connected)
+
+def stop():
+    global _client
+    with _client_lock:
+        if _client:
+            _client.stop()
+            _client = None
@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from . import config, events
+
+# Set up a logger specific to this module
+logger = logging.getLogger(__name__)
+
+# Bulk Home Assistant operations (full To-Do sync, restore, force-clear) run as
+# background jobs. Their per-wine calls go through a bounded worker pool and a
+# shared token-bucket rate limit so a large cellar syncs quickly without flooding
+# HA. Jobs report progress and can be cancelled via /api/jobs/<id>.
+
+MAX_FINISHED_JOBS = 20
+
+class RateLimiter:
+    """Token bucket: allows `rate` calls per second on average, with bursts up to `rate` calls."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1, cancel_event: threading.Event = None) -> bool:
+        """Blocks until `tokens` are available. Returns False if cancelled while waiting."""
+        if self.rate <= 0:
+            return True
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.rate
+            if cancel_event is not None:
+                if cancel_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+class BulkJob:
+    """Progress and cancellation state for one background bulk operation."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = "running"
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.message = None
+        self.result = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def add_total(self, count: int):
+        with self._lock:
+            self.total += count
+
+    def record(self, ok: bool):
+        with self._lock:
+            self.done += 1
+            if not ok:
+                self.failed += 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id, "kind": self.kind, "status": self.status,
+                "total": self.total, "done": self.done, "failed": self.failed,
+                "message": self.message, "result": self.result,
+                "started_at": self.started_at, "finished_at": self.finished_at
+            }
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def _get_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(config.HA_BULK_RATE_LIMIT)
+        return _limiter
+
+def bulk_map(fn, items, cost: float = 1, job: BulkJob = None):
+    """
+    Calls fn(item) for every item on a pool of HA_BULK_CONCURRENCY threads, taking
+    `cost` rate-limit tokens (i.e. HA requests) per item. fn should return True on
+    success. Items not yet started when the job is cancelled are skipped.
+    Returns the list of results (None for skipped items).
+    """
+    items = list(items)
+    if job:
+        job.add_total(len(items))
+    cancel_event = job._cancel_event if job else None
+    limiter = _get_limiter()
+
+    def run_one(item):
+        if job and job.cancelled:
+            return None
+        if not limiter.acquire(cost, cancel_event):
+            return None
+        try:
+            ok = fn(item)
+        except Exception as e:
+            logger.error(f"Bulk task failed: {e}", exc_info=True)
+            ok = False
+        if job:
+            job.record(bool(ok))
+        return ok
+
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, config.HA_BULK_CONCURRENCY), thread_name_prefix="ha-bulk") as pool:
+        return list(pool.map(run_one, items))
+
+def _prune_finished():
+    finished = sorted((j for j in _jobs.values() if j.finished_at), key=lambda j: j.finished_at)
+    for job in finished[:-MAX_FINISHED_JOBS]:
+        del _jobs[job.id]
+
+def start_job(kind: str, target, *args):
+    """Runs target(job, *args) on a background thread and returns the BulkJob. target's return value becomes job.result."""
+    job = BulkJob(kind)
+    with _jobs_lock:
+        _prune_finished()
+        _jobs[job.id] = job
+
+    def runner():
+        logger.info(f"Job {job.id} ({kind}) started.")
+        try:
+            job.result = target(job, *args)
+            job.status = "cancelled" if job.cancelled else "completed"
+        except Exception as e:
+            logger.error(f"Job {job.id} ({kind}) failed: {e}", exc_info=True)
+            job.status = "failed"
+            job.message = str(e)
+        job.finished_at = time.time()
+        logger.info(f"Job {job.id} ({kind}) {job.status}: {job.done}/{job.total} done, {job.failed} failed.")
+        events.publish_job(job.to_dict())
+
+    threading.Thread(target=runner, name=f"job-{job.id}", daemon=True).start()
+    return job
+
+def get_job(job_id: str):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def list_jobs():
+    with _jobs_lock:
+        return [job.to_dict() for job in sorted(_jobs.values(), key=lambda j: j.started_at, reverse=True)]
+
+def cancel_job(job_id: str) -> bool:
+    job = get_job(job_id)
+    if not job or job.finished_at:
+        return False
+    job.cancel()
+    return True
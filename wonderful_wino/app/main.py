@@ -1,12 +1,13 @@
 import os
 import logging
 import atexit # <-- NEW IMPORT
-from flask import Flask, request, jsonify, send_from_directory
+import threading
+import time
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
-from . import config, db, ha_service, scraper, formatting
+from . import config, db, ha_service, ha_client, ha_ws, outbox, jobs, commands, scraper, formatting, snapshots, consumption_stats, server, events, compression, assets, reference_data
 import re
 from urllib.parse import urlparse, urlunparse, parse_qs
-import yaml
 
 # Quieten down the very verbose output from underlying libraries
 logging.getLogger('selenium').setLevel(logging.WARNING)
@@ -21,20 +22,20 @@ logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"),
 logger = logging.getLogger(__name__)
 app = Flask(__name__, static_folder="../frontend", static_url_path="")
 CORS(app)
+compression.init_app(app)
 
 # Define the path to the grapes.yaml file
 GRAPES_YAML_PATH = os.path.join(os.path.dirname(__file__), 'data', 'grapes.yaml')
 
 # Function to load the grape varietals
 def _load_grape_varietals():
-    """Loads the grape varietals list from the YAML file."""
+    """Loads the grape varietals list from the YAML file (via the compiled cache)."""
     try:
-        with open(GRAPES_YAML_PATH, 'r') as f:
-            data = yaml.safe_load(f)
-            # We assume the YAML is structured as: {'grapes': ['Grape 1', 'Grape 2', ...]}
-            varietals = data.get('grapes', [])
-            # Convert all varietal names to lowercase for case-insensitive matching later
-            return [v.lower() for v in varietals]
+        data = reference_data.load('grapes')
+        # We assume the YAML is structured as: {'grapes': ['Grape 1', 'Grape 2', ...]}
+        varietals = data.get('grapes', [])
+        # Convert all varietal names to lowercase for case-insensitive matching later
+        return [v.lower() for v in varietals]
     except FileNotFoundError:
         logger.error(f"Grape varietals file not found at: {GRAPES_YAML_PATH}")
         return []
@@ -51,12 +52,11 @@ scraper.initialize_varietals(GRAPE_VARIETALS)
 REGIONS_YAML_PATH = os.path.join(os.path.dirname(__file__), 'data', 'regions.yaml')
 
 def _load_regions():
-    """Loads the regions data from the YAML file."""
+    """Loads the regions data from the YAML file (via the compiled cache)."""
     try:
-        with open(REGIONS_YAML_PATH, 'r') as f:
-            data = yaml.safe_load(f)
-            # The YAML is expected to be structured as {Country: {Region: [Subregions...]}}
-            return data or {}
+        data = reference_data.load('regions')
+        # The YAML is expected to be structured as {Country: {Region: [Subregions...]}}
+        return data or {}
     except FileNotFoundError:
         logger.error(f"Regions file not found at: {REGIONS_YAML_PATH}")
         return {}
@@ -90,6 +90,29 @@ class ReverseProxied:
         return self.app(environ, start_response)
 app.wsgi_app = ReverseProxied(app.wsgi_app)
 
+# --- NEW: Conditional GET for read endpoints ---
+# ETags come from db.get_data_version(), which triggers bump on every write, so a
+# request whose If-None-Match still matches gets a 304 before any table is read.
+# The startup token keeps ETags from an older add-on version from matching.
+_ETAG_TOKEN = format(int(time.time()), 'x')
+
+def _versioned_json(build):
+    """Serves build() -> (payload, status) as JSON with a data-version ETag, or 304 if the client's copy is current."""
+    version = db.get_data_version()
+    etag = f"{_ETAG_TOKEN}-{version}" if version is not None else None
+    if etag and request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        payload, status = build()
+        response = jsonify(payload)
+        response.status_code = status
+        if status != 200 or not etag:
+            return response
+    response.set_etag(etag, weak=True)
+    # Browsers revalidate every time, which is a cheap 304 while nothing changes.
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # --- Flask Routes (NO CHANGES TO ROUTES) ---
 
 @app.route('/api/wine/focal-point', methods=['POST'])
@@ -121,6 +144,8 @@ def update_log_entry():
     try:
         # Client should send a full ISO 8601 string, which SQLite will store.
         if db.update_consumption_date(log_id, new_date):
+            consumption_stats.rebuild()
+            ha_service.request_sensor_refresh() # <--- UPDATE SENSORS
             return jsonify({"status": "success", "message": "Log entry updated."}), 200
         else:
             return jsonify({"status": "error", "message": "Log entry not found or DB error."}), 404
@@ -134,18 +159,17 @@ def get_wine_history():
     vivino_url = request.args.get('vivino_url')
     if not vivino_url:
         return jsonify({"error": "Missing vivino_url parameter"}), 400
-    
-    wine = db.get_wine_by_url(vivino_url)
-    if not wine:
-        return jsonify({"error": "Wine not found"}), 404
-    
-    history = db.get_consumption_history(wine['id'])
-    return jsonify(history), 200
+
+    def build():
+        wine = db.get_wine_by_url(vivino_url)
+        if not wine:
+            return {"error": "Wine not found"}, 404
+        return db.get_consumption_history(wine['id']), 200
+    return _versioned_json(build)
 
 @app.route('/api/settings', methods=['GET'])
 def get_settings():
-    settings_dict = db.get_settings()
-    return jsonify(settings_dict), 200
+    return _versioned_json(lambda: (db.get_settings(), 200))
 
 @app.route('/api/settings', methods=['POST'])
 def update_settings():
@@ -213,12 +237,14 @@ def scan_wine():
     if existing_wine_row:
         wine_data['vivino_url'] = existing_wine_row['vivino_url']
 
-    if db.add_or_update_wine(wine_data, quantity, cost_tier):
+    success, changes = db.add_or_update_wine(wine_data, quantity, cost_tier)
+    if success:
         updated_wine_row = db.get_wine_by_url(wine_data['vivino_url'])
         if updated_wine_row:
             current_total_quantity = updated_wine_row.get('quantity', 0)
-            ha_service.sync_wine_to_todo(updated_wine_row, current_total_quantity)
-            ha_service.trigger_sensor_update() # <--- UPDATE SENSORS
+            outbox.notify()
+            if ha_service.changes_affect_sensors(changes):
+                ha_service.request_sensor_refresh() # <--- UPDATE SENSORS
             return jsonify({
                 "status": "success", "message": "Wine data scraped and stored/updated.",
                 "wine_name": updated_wine_row['name'], "vintage": updated_wine_row['vintage'],
@@ -260,13 +286,15 @@ def add_manual_wine():
         'wine_type': data.get('wine_type')
     }
 
-    if db.add_or_update_wine(wine_data, quantity, cost_tier):
+    success, changes = db.add_or_update_wine(wine_data, quantity, cost_tier)
+    if success:
         updated_wine_row = db.get_wine_by_url(synthetic_url)
         if not updated_wine_row:
              return jsonify({"status": "error", "message": "Failed to retrieve manually added wine."}), 500
         current_total_quantity = updated_wine_row.get('quantity', 0)
-        ha_service.sync_wine_to_todo(updated_wine_row, current_total_quantity)
-        ha_service.trigger_sensor_update() # <--- UPDATE SENSORS
+        outbox.notify()
+        if ha_service.changes_affect_sensors(changes):
+            ha_service.request_sensor_refresh() # <--- UPDATE SENSORS
         return jsonify({
             "status": "success", "message": "Wine manually added/updated successfully.",
             "wine_name": wine_data['name'], "vintage": wine_data['vintage'],
@@ -287,8 +315,6 @@ def edit_wine():
     if not old_wine_row:
         return jsonify({"status": "error", "message": "Wine to edit not found."}), 404
 
-    ha_service.sync_wine_to_todo(old_wine_row, 0)
-        
     success = db.update_wine_details(
         vivino_url, data['name'], data['vintage'], data['quantity'], data.get('varietal'),
         data.get('region'), data.get('country'), data.get('cost_tier'),
@@ -297,23 +323,22 @@ def edit_wine():
     )
     
     if not success:
-        ha_service.sync_wine_to_todo(old_wine_row, old_wine_row['quantity'])
         return jsonify({"status": "error", "message": "Database error while editing wine."}), 500
     
-    updated_wine_row = db.get_wine_by_url(vivino_url)
-    if updated_wine_row:
-        ha_service.sync_wine_to_todo(updated_wine_row, updated_wine_row['quantity'])
-    
-    ha_service.trigger_sensor_update() # <--- UPDATE SENSORS
+    outbox.notify()
+    ha_service.request_sensor_refresh() # <--- UPDATE SENSORS
     return jsonify({"status": "success", "message": "Wine updated successfully."}), 200
 
 @app.route('/inventory', methods=['GET'])
 def get_inventory():
     status_filter = request.args.get('filter', 'on_hand')
-    wines = db.get_all_wines(status_filter)
-    for wine in wines:
-        wine['b4b_score'] = formatting.calculate_b4b_score(wine)
-    return jsonify(wines), 200
+
+    def build():
+        wines = db.get_all_wines(status_filter)
+        for wine in wines:
+            wine['b4b_score'] = formatting.calculate_b4b_score(wine)
+        return wines, 200
+    return _versioned_json(build)
 
 @app.route('/inventory/wine/set_quantity', methods=['POST'])
 def set_wine_quantity():
@@ -328,8 +353,8 @@ def set_wine_quantity():
     if not wine_data:
         return jsonify({"status": "error", "message": "Wine not found."}), 404
     if db.update_wine_quantity(vivino_url, new_quantity):
-        ha_service.sync_wine_to_todo(wine_data, new_quantity)
-        ha_service.trigger_sensor_update() # <--- UPDATE SENSORS
+        outbox.notify()
+        ha_service.request_sensor_refresh() # <--- UPDATE SENSORS
         return jsonify({"status": "success", "message": f"Quantity set to {new_quantity}."}), 200
     else:
         return jsonify({"status": "error", "message": "Failed to update quantity in database."}), 500
@@ -363,9 +388,9 @@ def consume_wine_from_webhook():
         status, message, updated_wine = db.atomically_consume_wine(vivino_url, personal_rating)
         
         if status == "success":
-            ha_service.fire_consumption_event(updated_wine)
-            ha_service.sync_wine_to_todo(updated_wine, message) # message is new_quantity
-            ha_service.trigger_sensor_update() # <--- UPDATE SENSORS
+            outbox.notify()
+            consumption_stats.record_consumption(personal_rating)
+            ha_service.request_sensor_refresh() # <--- UPDATE SENSORS
             return jsonify({"status": "success", "message": f"Quantity updated. New quantity: {message}."}), 200
         elif message == "Quantity already zero":
             return jsonify({"status": "warning", "message": "Quantity already zero."}), 404
@@ -388,9 +413,9 @@ def consume_wine():
     status, message, updated_wine = db.atomically_consume_wine(vivino_url, personal_rating)
     
     if status == "success":
-        ha_service.fire_consumption_event(updated_wine)
-        ha_service.sync_wine_to_todo(updated_wine, message) # message is new_quantity
-        ha_service.trigger_sensor_update() # <--- UPDATE SENSORS
+        outbox.notify()
+        consumption_stats.record_consumption(personal_rating)
+        ha_service.request_sensor_refresh() # <--- UPDATE SENSORS
         return jsonify({'status': 'success', 'new_quantity': message})
     elif message == "Wine not found":
         return jsonify({'error': 'Wine not found'}), 404
@@ -410,8 +435,8 @@ def delete_wine():
     if not wine_to_delete:
         return jsonify({"status": "error", "message": "Wine not found."}), 404
     if db.delete_wine_by_url(vivino_url):
-        ha_service.sync_wine_to_todo(wine_to_delete, 0)
-        ha_service.trigger_sensor_update() # <--- UPDATE SENSORS
+        outbox.notify()
+        ha_service.request_sensor_refresh() # <--- UPDATE SENSORS
         return jsonify({"status": "success"}), 200
     else:
         return jsonify({"status": "error", "message": "Failed to delete wine from database."}), 500
@@ -430,9 +455,7 @@ def rate_wine():
         return jsonify({"status": "error", "message": "Invalid rating."}), 400
     if not db.update_personal_rating(vivino_url, rating_val):
         return jsonify({"status": "error", "message": "Wine not found or DB error"}), 404
-    updated_wine_row = db.get_wine_by_url(vivino_url)
-    if updated_wine_row and updated_wine_row['quantity'] > 0:
-        ha_service.sync_wine_to_todo(updated_wine_row, updated_wine_row['quantity'])
+    outbox.notify()
     # Note: Rating a wine doesn't change inventory counts,
     # so no sensor update is strictly needed here.
     return jsonify({"status": "success"}), 200
@@ -455,14 +478,33 @@ def save_tasting_notes_and_image():
     else:
         return jsonify({"status": "error", "message": "Wine not found or DB error."}), 404
 
+def _reconcile_or_resync(job, wines, historical_wines=None):
+    """
+    Job body: diff-syncs the HA To-Do list; falls back to clear-and-re-add if the list can't be read.
+    `historical_wines` are the wines whose items count as ours, both for the reconciler and for
+    what to clear in the fallback (defaults to every wine in the DB).
+    """
+    result = ha_service.reconcile_todo_list(wines, job=job, known_wines=historical_wines)
+    if result is None:
+        logger.warning("Could not read the HA To-Do list; falling back to a full clear and re-add.")
+        ha_service.force_clear_ha_list(historical_wines, job=job)
+        if not job.cancelled:
+            ha_service.sync_all_wines_to_ha(wines, job=job)
+    job.message = "Sync cancelled." if job.cancelled else "All wines synchronized."
+    ha_service.request_sensor_refresh() # <--- UPDATE SENSORS
+    return result
+
+def _job_accepted(job, message):
+    return jsonify({"status": "accepted", "message": message, "job_id": job.id}), 202
+
 @app.route("/sync-all-wines", methods=["POST"])
 def sync_all_wines_to_ha_endpoint():
     try:
         wines = db.get_all_wines(status_filter='all')
-        ha_service.force_clear_ha_list()
-        ha_service.sync_all_wines_to_ha(wines)
-        ha_service.trigger_sensor_update() # <--- UPDATE SENSORS
-        return jsonify({"status": "success", "message": "All wines synchronized."}), 200
+        # A full re-sync supersedes any queued per-wine To-Do updates.
+        db.clear_ha_outbox(db.OUTBOX_TODO_SYNC)
+        job = jobs.start_job("sync_all", _reconcile_or_resync, wines)
+        return _job_accepted(job, "Sync started.")
     except Exception as e:
         logger.error(f"Error during full sync: {e}", exc_info=True)
         return jsonify({"status": "error", "message": "Internal error during sync."}), 500
@@ -470,10 +512,12 @@ def sync_all_wines_to_ha_endpoint():
 @app.route("/reinitialize-database-action", methods=["POST"])
 def reinitialize_db_endpoint():
     try:
-        ha_service.force_clear_ha_list()
+        historical_wines = db.get_all_historical_wines()
         db.reinitialize_database()
-        ha_service.trigger_sensor_update() # <--- UPDATE SENSORS
-        return jsonify({"status": "success", "message": "Database reinitialized."}), 200
+        consumption_stats.rebuild()
+        # Empty cellar: the reconciler removes every item the old wines put on the list.
+        job = jobs.start_job("clear_list", _reconcile_or_resync, [], historical_wines)
+        return jsonify({"status": "success", "message": "Database reinitialized.", "job_id": job.id}), 200
     except Exception as e:
         logger.error(f"Error reinitializing database: {e}", exc_info=True)
         return jsonify({"status": "error", "message": "Internal error during reinitialization."}), 500
@@ -493,19 +537,99 @@ def backup_db_endpoint():
 @app.route("/restore-database", methods=["POST"])
 def restore_db_endpoint():
     try:
+        previous_wines = db.get_all_historical_wines()
         success, message = db.restore_database()
         if success:
+            consumption_stats.rebuild()
             wines = db.get_all_wines(status_filter='all')
-            ha_service.force_clear_ha_list()
-            ha_service.sync_all_wines_to_ha(wines)
-            ha_service.trigger_sensor_update() # <--- UPDATE SENSORS
-            return jsonify({"status": "success", "message": message}), 200
+            # Entries restored from the backup describe changes HA has already seen.
+            db.clear_ha_outbox()
+            # Items from the replaced database are ours too, so they can be removed.
+            known_wines = previous_wines + db.get_all_historical_wines()
+            job = jobs.start_job("restore_sync", _reconcile_or_resync, wines, known_wines)
+            return jsonify({"status": "success", "message": f"{message} Syncing Home Assistant...", "job_id": job.id}), 200
         else:
             return jsonify({"status": "error", "message": message}), 500
     except Exception as e:
         logger.error(f"Error during restore: {e}", exc_info=True)
         return jsonify({"status": "error", "message": "Restore failed."}), 500
 
+def _reparse_snapshots(job, urls, apply_changes):
+    """Job body: reparses stored snapshots in a process pool; job.result holds the per-wine diffs."""
+    reports = snapshots.diff_reparsed_wines(urls)
+    job.add_total(len(reports))
+    applied = 0
+    if apply_changes:
+        for report in reports:
+            if job.cancelled:
+                break
+            ok = db.update_wine_fields(report['vivino_url'], report['changes'])
+            applied += 1 if ok else 0
+            job.record(ok)
+        outbox.notify()
+        if any(ha_service.changes_affect_sensors(report['changes']) for report in reports):
+            ha_service.request_sensor_refresh() # <--- UPDATE SENSORS
+    job.message = f"{len(reports)} wines would change." if not apply_changes else f"Applied changes to {applied} wines."
+    return {
+        "snapshots": len(snapshots.get_snapshot_urls()),
+        "diffs": [
+            {"vivino_url": r['vivino_url'], "name": r['name'],
+             "changes": {column: {"old": old, "new": new} for column, (old, new) in r['changes'].items()}}
+            for r in reports
+        ],
+        "applied": applied
+    }
+
+@app.route("/api/snapshots/reparse", methods=["POST"])
+def reparse_snapshots_endpoint():
+    """
+    Starts a job that re-runs the parser over stored page snapshots and reports per-wine diffs
+    (in the job's result, via /api/jobs/<id>). With {"apply": true} the diffs (optionally
+    limited to "urls") are written and synced to HA.
+    """
+    data = request.get_json(silent=True) or {}
+    apply_changes = bool(data.get('apply', False))
+    urls = data.get('urls') or None
+    try:
+        job = jobs.start_job("snapshot_reparse", _reparse_snapshots, urls, apply_changes)
+        return _job_accepted(job, "Reparse started.")
+    except Exception as e:
+        logger.error(f"Error starting snapshot reparse: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": "Reparse failed."}), 500
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify(jobs.list_jobs()), 200
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get_job(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Job not found."}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancels a running bulk job; work already in flight finishes, the rest is skipped."""
+    if not jobs.cancel_job(job_id):
+        return jsonify({"status": "error", "message": "Job not found or already finished."}), 404
+    return jsonify({"status": "success", "message": "Cancellation requested."}), 200
+
+@app.route('/api/diagnostics', methods=['GET'])
+def diagnostics():
+    """Reports runtime metrics for the Home Assistant integration."""
+    return jsonify({"ha_http": ha_client.get_stats(), "outbox": outbox.get_stats(),
+                    "ha_websocket": ha_ws.get_stats(), "event_streams": events.get_stats()}), 200
+
+@app.route('/api/events', methods=['GET'])
+def event_stream():
+    """Server-sent events for inventory changes and finished jobs (see events.py)."""
+    subscriber = events.subscribe(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    if subscriber is None:
+        return jsonify({"status": "error", "message": "Event streams are disabled."}), 503
+    return Response(events.stream(subscriber), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """A simple endpoint to verify the server is running."""
@@ -513,23 +637,29 @@ def health_check():
 
 @app.route("/")
 def serve_frontend():
-    return send_from_directory("../frontend", "index.html")
+    return assets.response_for("index.html") or send_from_directory("../frontend", "index.html")
+
+@app.route("/assets/<path:filename>")
+def serve_built_asset(filename):
+    return assets.response_for(f"assets/{filename}") or send_from_directory("../frontend", f"assets/{filename}")
 
 @app.route("/<path:path>")
 def serve_static(path):
     return send_from_directory("../frontend", path)
 
-# --- MODIFIED STARTUP BLOCK ---
-if __name__ == '__main__':
-    db.init_db()
-    
-    # --- NEW: Register MQTT shutdown hook ---
-    atexit.register(ha_service.stop_mqtt)
+# --- NEW: Background startup ---
+# Everything that waits on Home Assistant, the MQTT broker or the frontend build
+# runs here, after the web server is already answering. Sensor refreshes that
+# routes request in the meantime are serialized with this first publish.
+def _initialize_integrations():
+    if config.ASSET_PIPELINE:
+        assets.build()
 
     # --- NEW: Initialize MQTT client if enabled ---
     if config.USE_MQTT_DISCOVERY:
         try:
             logger.info("MQTT Discovery is enabled. Initializing MQTT client...")
+            commands.register()
             ha_service.initialize_mqtt()
         except Exception as e:
             logger.error(f"Failed to initialize MQTT client: {e}", exc_info=True)
@@ -542,11 +672,26 @@ if __name__ == '__main__':
             logger.info("Initial HA sensor (REST) sync complete.")
         except Exception as e:
             logger.error(f"Failed to perform initial HA sensor (REST) sync: {e}", exc_info=True)
-    
+
     # Note: If MQTT is enabled, the initial sensor update will happen
     # automatically inside the `on_connect` callback.
+
+# --- MODIFIED STARTUP BLOCK ---
+if __name__ == '__main__':
+    db.init_db()
+    
+    # --- NEW: Register MQTT shutdown hook ---
+    atexit.register(ha_service.stop_mqtt)
+    atexit.register(ha_client.close_client)
+    atexit.register(ha_ws.stop)
+    atexit.register(ha_service.flush_sensor_refresh)
+    atexit.register(outbox.stop)
+    ha_ws.start()
+    outbox.start()
+    ha_service.start_sensor_heartbeat()
+    consumption_stats.start_daily_tick(ha_service.request_sensor_refresh)
+    threading.Thread(target=_initialize_integrations, name="startup-init", daemon=True).start()
         
-    logger.info(f"Starting Wonderful Wino on port 5000 with log level {config.LOG_LEVEL}")
-    print("\n---> NOTE: The following 'WARNING' is a standard benign message from the internal web server.\n"
-          "---> It is normal and expected for a Home Assistant add-on and can be safely ignored.\n")
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    logger.info(f"Starting Wonderful Wino on port {config.WEB_PORT} with log level {config.LOG_LEVEL}")
+    # Returns after SIGTERM once in-flight requests finish, so the atexit hooks above run.
+    server.serve(app, host='0.0.0.0', port=config.WEB_PORT, on_stop=events.shutdown)
@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+from . import config, db, ha_service
+
+# Set up a logger specific to this module
+logger = logging.getLogger(__name__)
+
+# Delivery worker for the ha_outbox table (see db.py).
+# Entries are written in the same transaction as the wine change, so nothing is
+# lost if HA is down or the add-on restarts; this thread drains them, retrying
+# with exponential backoff. A failed entry holds back later entries for the same
+# wine until its retry is due, so per-wine order is kept.
+
+_thread = None
+_thread_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+_metrics_lock = threading.Lock()
+_metrics = {"delivered": 0, "failed_attempts": 0, "dropped": 0}
+
+def _bump(name):
+    with _metrics_lock:
+        _metrics[name] += 1
+
+def _backoff_seconds(attempts: int) -> float:
+    return min(config.HA_OUTBOX_BACKOFF * (2 ** attempts), config.HA_OUTBOX_MAX_BACKOFF)
+
+def _deliver_todo_sync(entry):
+    """Pushes the wine's current state, diffed against what HA last received. Returns (ok, delivered_row)."""
+    previous = (entry['payload'] or {}).get('previous')
+    current = db.get_wine_by_url(entry['wine_key'])
+    if current is None:
+        if previous is None:
+            # Added and deleted before HA ever saw it.
+            return True, None
+        # Deleted: render the old row with nothing left so the item is removed.
+        current = dict(previous, quantity=0)
+    return ha_service.sync_wine_to_todo_if_changed(previous, current), current
+
+def _deliver(entry):
+    if entry['kind'] == db.OUTBOX_TODO_SYNC:
+        ok, delivered_row = _deliver_todo_sync(entry)
+    elif entry['kind'] == db.OUTBOX_CONSUMED_EVENT:
+        ok, delivered_row = ha_service.fire_consumption_event(entry['payload'] or {}), None
+    else:
+        logger.warning(f"Dropping HA outbox entry {entry['id']} with unknown kind '{entry['kind']}'.")
+        _bump("dropped")
+        ok, delivered_row = True, None
+    if ok:
+        db.complete_outbox_entry(entry['id'], entry['revision'], delivered_row)
+        _bump("delivered")
+    return ok
+
+def _record_new_todo_uids(vivino_urls):
+    """After a pass, reads the To-Do list once for the on-hand wines that were synced but have no UID yet."""
+    wines = [db.get_wine_by_url(vivino_url) for vivino_url in dict.fromkeys(vivino_urls)]
+    wines = [wine for wine in wines if wine and wine.get('quantity', 0) > 0 and not wine.get('ha_todo_uid')]
+    if wines:
+        ha_service.record_todo_uids(wines)
+
+def deliver_due():
+    """Delivers every entry that is due. Returns the number of seconds until the next one is."""
+    if not ha_service.is_rest_configured():
+        # Nothing can be delivered; drop the backlog rather than let it grow forever.
+        stats = db.get_outbox_stats()
+        if stats.get("pending"):
+            logger.warning("HA URL/token not configured; discarding pending HA outbox entries.")
+            db.clear_ha_outbox()
+        return config.HA_OUTBOX_POLL_INTERVAL
+
+    # Entries behind a backing-off entry aren't returned as due; this covers failures in this pass.
+    blocked_keys = set()
+    synced_urls = []
+    for entry in db.get_due_outbox_entries(time.time()):
+        if _stop.is_set():
+            break
+        if entry['wine_key'] in blocked_keys:
+            continue
+        try:
+            ok = _deliver(entry)
+            error = None if ok else "HA unreachable"
+        except Exception as e:
+            logger.error(f"Unexpected error delivering HA outbox entry {entry['id']}: {e}", exc_info=True)
+            ok, error = False, str(e)
+        if ok and entry['kind'] == db.OUTBOX_TODO_SYNC:
+            synced_urls.append(entry['wine_key'])
+        if not ok:
+            blocked_keys.add(entry['wine_key'])
+            delay = _backoff_seconds(entry['attempts'])
+            db.reschedule_outbox_entry(entry['id'], time.time() + delay, error)
+            _bump("failed_attempts")
+            logger.warning(f"HA outbox entry {entry['id']} ({entry['kind']}) failed; retrying in {delay:.0f}s.")
+
+    if synced_urls:
+        _record_new_todo_uids(synced_urls)
+
+    next_at = db.get_outbox_stats().get("next_attempt_at")
+    if next_at is None:
+        return config.HA_OUTBOX_POLL_INTERVAL
+    return max(0.0, min(next_at - time.time(), config.HA_OUTBOX_POLL_INTERVAL))
+
+def _run():
+    logger.info("HA outbox worker started.")
+    while not _stop.is_set():
+        # Cleared before draining so a notify() that arrives mid-pass triggers another pass.
+        _wake.clear()
+        try:
+            delay = deliver_due()
+        except Exception as e:
+            logger.error(f"HA outbox worker error: {e}", exc_info=True)
+            delay = config.HA_OUTBOX_POLL_INTERVAL
+        _wake.wait(delay)
+
+def start():
+    """Starts the delivery thread (idempotent). Pending entries from a previous run are picked up immediately."""
+    global _thread
+    with _thread_lock:
+        if _thread and _thread.is_alive():
+            return
+        _stop.clear()
+        _thread = threading.Thread(target=_run, name="ha-outbox", daemon=True)
+        _thread.start()
+
+def notify():
+    """Wakes the worker after a commit that queued HA updates."""
+    start()
+    _wake.set()
+
+def stop(timeout=5):
+    _stop.set()
+    _wake.set()
+    if _thread:
+        _thread.join(timeout)
+
+def get_stats():
+    with _metrics_lock:
+        stats = dict(_metrics)
+    stats.update(db.get_outbox_stats())
+    return stats
@@ -1,18 +1,17 @@
-import requests
-from bs4 import BeautifulSoup
 import re
 import json
 import logging
 from urllib.parse import urlparse, parse_qs, urlunparse, urlencode
 import time 
 import random 
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
+from . import config, snapshots
+
+# selenium and bs4/lxml take about 200 ms to import, so they are imported inside
+# the functions that use them: the first scan pays that once instead of every startup.
 
 # Set up a logger specific to this module
 logger = logging.getLogger(__name__)
@@ -27,6 +26,87 @@ USER_AGENTS = [
 
 WINE_TYPES = {'Red', 'White', 'Sparkling', 'Rosé', 'Fortified', 'Dessert'}
 
+# Images, fonts, stylesheets and media.
+BLOCKED_FILE_EXTENSIONS = (
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'avif', 'svg', 'ico',
+    'woff', 'woff2', 'ttf', 'otf', 'eot',
+    'css',
+    'mp4', 'webm', 'mp3',
+)
+
+def _extension_patterns(pattern: str):
+    """A '*.ext' wildcard only matches URLs ending in .ext; the '?*' twin covers versioned URLs (app.css?v=123)."""
+    return [pattern, pattern + '?*'] if pattern.startswith('*.') and not pattern.endswith('*') else [pattern]
+
+# URL patterns (Chrome DevTools wildcard syntax) that the extractor never needs.
+# The wine data comes from the HTML and inline scripts only.
+DEFAULT_BLOCKED_URL_PATTERNS = [
+    *(variant for extension in BLOCKED_FILE_EXTENSIONS for variant in _extension_patterns(f'*.{extension}')),
+    # Analytics, ads, tag managers and consent/monitoring widgets
+    '*google-analytics.com*', '*googletagmanager.com*', '*googlesyndication.com*',
+    '*doubleclick.net*', '*googleadservices.com*', '*adservice.google.*',
+    '*facebook.net*', '*facebook.com/tr*', '*connect.facebook*',
+    '*hotjar.com*', '*segment.io*', '*segment.com*', '*optimizely.com*',
+    '*branch.io*', '*sentry.io*', '*sentry-cdn.com*', '*datadoghq*', '*newrelic.com*', '*nr-data.net*',
+    '*criteo.*', '*amazon-adsystem.com*', '*bat.bing.com*', '*tiktok.com*',
+    '*pinterest.com*', '*pinimg.com*', '*scorecardresearch.com*', '*quantserve.com*',
+    '*onetrust.com*', '*cookielaw.org*', '*intercom.io*', '*braze.com*', '*appboy.com*',
+]
+
+# Resolves once the vintage page state (or, for error pages, an h1) is available.
+_PAGE_READY_JS = (
+    "return !!(window.__PRELOADED_STATE__ && window.__PRELOADED_STATE__.vintagePageInformation)"
+    " || !!document.querySelector('h1');"
+)
+
+# Returns everything the extractor needs as structured data in a single round trip.
+_PAGE_STATE_JS = """
+    const state = window.__PRELOADED_STATE__ && window.__PRELOADED_STATE__.vintagePageInformation;
+    const h1 = document.querySelector("h1[class*='wine-page-header__name'], h1[class*='VintageTitle__wine']")
+        || document.querySelector('h1');
+    const jsonLd = [];
+    document.querySelectorAll('script[type="application/ld+json"]').forEach((s) => {
+        try { jsonLd.push(JSON.parse(s.textContent)); } catch (e) { /* ignore malformed blocks */ }
+    });
+    return { state: state || null, json_ld: jsonLd, h1: h1 ? h1.textContent : null };
+"""
+
+class _FetchStopped(Exception):
+    """Raised inside a page load whose result is no longer wanted (a losing nearby-vintage probe)."""
+
+def _check_stop(stop_event):
+    if stop_event is not None and stop_event.is_set():
+        raise _FetchStopped()
+    return False
+
+def _get_blocked_url_patterns():
+    """Returns the effective block list: defaults plus configured extras, minus configured allows."""
+    if not config.SCRAPER_BLOCK_RESOURCES:
+        return []
+    allowed = {variant for pattern in config.SCRAPER_ALLOWED_URL_PATTERNS for variant in _extension_patterns(pattern)}
+    patterns = DEFAULT_BLOCKED_URL_PATTERNS + [
+        variant for pattern in config.SCRAPER_BLOCKED_URL_PATTERNS for variant in _extension_patterns(pattern)
+    ]
+    return [p for p in dict.fromkeys(patterns) if p not in allowed]
+
+def _collect_page_metrics(driver):
+    """Reads navigation/resource timing from the page. Cross-origin sizes may report as 0."""
+    from selenium.common.exceptions import WebDriverException
+    try:
+        return driver.execute_script("""
+            const nav = performance.getEntriesByType('navigation')[0] || {};
+            const resources = performance.getEntriesByType('resource');
+            let bytes = nav.transferSize || 0;
+            for (const r of resources) { bytes += r.transferSize || 0; }
+            return {
+                dom_content_loaded_ms: Math.round(nav.domContentLoadedEventEnd || 0),
+                requests: resources.length + 1,
+                transfer_bytes: bytes
+            };
+        """) or {}
+    except WebDriverException:
+        return {}
+
 # Placeholder for the list loaded from main.py
 GLOBAL_GRAPE_VARIETALS = []
 
@@ -107,11 +187,28 @@ def _parse_url_for_fallback_data(url: str):
     
     return None
 
-def _perform_scrape_attempt_selenium(url: str):
+def _fetch_page_selenium(url: str, stop_event=None):
     """
-    Performs a single, complete scrape attempt using a headless Chrome browser.
+    Loads a page in a headless Chrome browser.
+    Returns (page, final_url), or (None, url) if the page could not be loaded
+    or `stop_event` was set while it loaded.
+    `page["metrics"]` holds the load time, request count and bytes of this load
+    (used by tools/bench_scraper.py).
+
+    In "js" extraction mode, `page["js"]` holds the vintage page state, the JSON-LD
+    blocks and the h1 text read straight from the JS context in one call,
+    `page["wine_data"]` the fields extracted from them, and `page["html"]` is only
+    serialized when that leaves fields unknown that the HTML fallbacks recover
+    (or snapshots are on).
+    In "html" mode `page["html"]` is always set and `page["js"]` is None.
     """
     logger.debug(f"Executing Selenium scrape attempt for URL: {url}")
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException, WebDriverException
     
     options = Options()
     options.page_load_strategy = 'eager'
@@ -126,21 +223,53 @@ def _perform_scrape_attempt_selenium(url: str):
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option('useAutomationExtension', False)
 
+    blocked_patterns = _get_blocked_url_patterns()
+    if blocked_patterns:
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+
     driver = None
     try:
+        _check_stop(stop_event)
         driver = webdriver.Chrome(options=options)
         driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        if blocked_patterns:
+            try:
+                driver.execute_cdp_cmd('Network.enable', {})
+                driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_patterns})
+                logger.debug(f"Blocking {len(blocked_patterns)} URL patterns in the scraper session.")
+            except WebDriverException as e:
+                logger.warning(f"Could not enable request blocking; loading the full page instead: {e}")
+        started_at = time.monotonic()
         driver.get(url)
 
+        use_js_state = config.SCRAPER_EXTRACTION_MODE == 'js'
         # --- FIX: INCREASED TIMEOUT FROM 25 TO 40 SECONDS ---
-        WebDriverWait(driver, 40).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "h1[class*='wine-page-header__name'], h1[class*='VintageTitle__wine'], h1"))
-        )
+        if use_js_state:
+            WebDriverWait(driver, 40).until(lambda d: _check_stop(stop_event) or d.execute_script(_PAGE_READY_JS))
+        else:
+            h1_present = EC.presence_of_element_located((By.CSS_SELECTOR, "h1[class*='wine-page-header__name'], h1[class*='VintageTitle__wine'], h1"))
+            WebDriverWait(driver, 40).until(lambda d: _check_stop(stop_event) or h1_present(d))
         
         final_url_after_scrape = driver.current_url
-        page_source = driver.page_source
-        logger.debug(f"Selenium successfully loaded page. Final URL: {final_url_after_scrape}")
-
+        page = {'js': None, 'wine_data': None, 'html': None}
+        if use_js_state:
+            try:
+                page['js'] = driver.execute_script(_PAGE_STATE_JS)
+            except WebDriverException as e:
+                logger.warning(f"Could not read page state from the JS context; falling back to HTML: {e}")
+            if page['js'] and page['js'].get('state'):
+                page['wine_data'] = extract_wine_data_from_js(page['js'], final_url_after_scrape)
+        if not use_js_state or _js_page_needs_html(page) or config.SAVE_PAGE_SNAPSHOTS:
+            page['html'] = driver.page_source
+        page['metrics'] = _collect_page_metrics(driver)
+        page['metrics']['wall_ms'] = round((time.monotonic() - started_at) * 1000)
+        page['metrics']['blocked_patterns'] = len(blocked_patterns)
+        logger.debug(f"Selenium successfully loaded page. Final URL: {final_url_after_scrape}. Metrics: {page['metrics']}")
+
+    except _FetchStopped:
+        logger.debug(f"Stopped loading {url}; its result is no longer needed.")
+        return None, url
     except TimeoutException:
         logger.error(f"Selenium timed out waiting for page content to load for URL: {url}")
         if driver: driver.quit()
@@ -157,89 +286,102 @@ def _perform_scrape_attempt_selenium(url: str):
         if driver:
             driver.quit()
 
-    soup = BeautifulSoup(page_source, 'lxml')
-    
-    wine_data = {
+    return page, final_url_after_scrape
+
+def _perform_scrape_attempt_selenium(url: str, stop_event=None, save_snapshot: bool = True):
+    """
+    Performs a single, complete scrape attempt using a headless Chrome browser.
+    The raw page is kept in the snapshot store (when enabled and `save_snapshot`)
+    so it can be reparsed later.
+    """
+    page, final_url_after_scrape = _fetch_page_selenium(url, stop_event)
+    if page is None:
+        return None, final_url_after_scrape
+
+    wine_data = page['wine_data']
+    # The HTML parser also reads the page state and JSON-LD, plus the DOM fallbacks on top.
+    if page['html'] and (wine_data is None or _unfilled_fallback_fields(wine_data)):
+        logger.debug("Page state in the JS context is missing or incomplete. Parsing the serialized HTML instead.")
+        wine_data = extract_wine_data(page['html'], final_url_after_scrape)
+    if wine_data and page['html'] and save_snapshot:
+        snapshots.save_snapshot(final_url_after_scrape, page['html'])
+    return wine_data, final_url_after_scrape
+
+def _new_wine_data():
+    return {
         'name': 'Unknown Wine', 'vintage': None, 'varietal': 'Unknown Varietal',
         'region': 'Unknown Region', 'country': 'Unknown Country',
         'vivino_rating': None, 'image_url': None,
         'alcohol_percent': None, 'wine_type': None
     }
 
-    name_tag = soup.find('h1', class_=re.compile(r'wine-page-header__name|VintageTitle_wine')) or soup.find('h1')
-    if name_tag:
-        wine_name = " ".join(name_tag.text.strip().split())
+def _apply_page_name(wine_data: dict, raw_name, final_url_after_scrape: str):
+    """Sets the wine name from the page's h1 text. Returns False if the page is not a wine page."""
+    if raw_name:
+        wine_name = " ".join(raw_name.strip().split())
         if "404" in wine_name or "not found" in wine_name.lower():
             logger.warning(f"Scrape failed for {final_url_after_scrape}: Page content indicates a 404 or error page.")
-            return None, final_url_after_scrape
+            return False
         wine_data['name'] = wine_name
     
     if wine_data['name'] == 'Unknown Wine':
         logger.warning(f"Scrape failed for {final_url_after_scrape}: No h1 tag found on the page.")
-        return None, final_url_after_scrape
+        return False
+    return True
+
+def _apply_preloaded_state(page_info: dict, wine_data: dict):
+    """Fills wine fields from window.__PRELOADED_STATE__.vintagePageInformation."""
+    vintage_info = page_info.get('vintage', {})
+    wine_info = vintage_info.get('wine', {})
+
+    # Try to get region and country from the JSON
+    if wine_info.get('region'):
+        region_data = wine_info.get('region', {})
+        if region_data.get('name'):
+            wine_data['region'] = region_data['name']
+            logger.debug(f"Found Region from __PRELOADED_STATE__: {wine_data['region']}")
+
+        if region_data.get('country'):
+            country_data = region_data.get('country', {})
+            if country_data.get('name'):
+                 wine_data['country'] = country_data['name']
+                 logger.debug(f"Found Country from __PRELOADED_STATE__: {wine_data['country']}")
 
-    all_grape_names_collected = []
-    found_grapes_in_json = False
-    
-    # Primary Method: Parse the __PRELOADED_STATE__ JSON blob.
-    preloaded_state_script = soup.find('script', string=re.compile(r'window\.__PRELOADED_STATE__\.vintagePageInformation'))
-    if preloaded_state_script:
-        logger.debug("Found __PRELOADED_STATE__ script tag. Parsing for detailed wine info.")
-        script_content = preloaded_state_script.string
-        json_str_match = re.search(r'window\.__PRELOADED_STATE__\.vintagePageInformation\s*=\s*(\{.*?\});', script_content, re.DOTALL)
-        if json_str_match:
-            try:
-                page_info = json.loads(json_str_match.group(1))
-                vintage_info = page_info.get('vintage', {})
-                wine_info = vintage_info.get('wine', {})
-                
-                # Try to get region and country from the JSON
-                if wine_info.get('region'):
-                    region_data = wine_info.get('region', {})
-                    if region_data.get('name'):
-                        wine_data['region'] = region_data['name']
-                        logger.debug(f"Found Region from __PRELOADED_STATE__: {wine_data['region']}")
-                    
-                    if region_data.get('country'):
-                        country_data = region_data.get('country', {})
-                        if country_data.get('name'):
-                             wine_data['country'] = country_data['name']
-                             logger.debug(f"Found Country from __PRELOADED_STATE__: {wine_data['country']}")
-
-                if wine_data['image_url'] is None:
-                    image_variations = vintage_info.get('image', {}).get('variations', {})
-                    image_url = image_variations.get('bottle_large') or image_variations.get('bottle_medium')
-                    if image_url:
-                        wine_data['image_url'] = 'https:' + image_url if image_url.startswith('//') else image_url
-                        logger.debug(f"Found Image URL from __PRELOADED_STATE__: {image_url}")
-
-                if wine_data['wine_type'] is None:
-                    wine_type_id = wine_info.get('type_id')
-                    if wine_type_id == 1: wine_data['wine_type'] = 'Red'
-                    elif wine_type_id == 2: wine_data['wine_type'] = 'White'
-                    elif wine_type_id == 3: wine_data['wine_type'] = 'Sparkling'
-                    elif wine_type_id == 4: wine_data['wine_type'] = 'Rosé'
-                    elif wine_type_id == 7: wine_data['wine_type'] = 'Dessert'
-                    elif wine_type_id == 24: wine_data['wine_type'] = 'Fortified'
-                    if wine_data['wine_type']:
-                         logger.debug(f"Found Wine Type from __PRELOADED_STATE__: {wine_data['wine_type']}")
+    if wine_data['image_url'] is None:
+        image_variations = vintage_info.get('image', {}).get('variations', {})
+        image_url = image_variations.get('bottle_large') or image_variations.get('bottle_medium')
+        if image_url:
+            wine_data['image_url'] = 'https:' + image_url if image_url.startswith('//') else image_url
+            logger.debug(f"Found Image URL from __PRELOADED_STATE__: {image_url}")
+
+    if wine_data['wine_type'] is None:
+        wine_type_id = wine_info.get('type_id')
+        if wine_type_id == 1: wine_data['wine_type'] = 'Red'
+        elif wine_type_id == 2: wine_data['wine_type'] = 'White'
+        elif wine_type_id == 3: wine_data['wine_type'] = 'Sparkling'
+        elif wine_type_id == 4: wine_data['wine_type'] = 'Rosé'
+        elif wine_type_id == 7: wine_data['wine_type'] = 'Dessert'
+        elif wine_type_id == 24: wine_data['wine_type'] = 'Fortified'
+        if wine_data['wine_type']:
+             logger.debug(f"Found Wine Type from __PRELOADED_STATE__: {wine_data['wine_type']}")
 
-                if wine_data['alcohol_percent'] is None:
-                    alcohol = vintage_info.get('wine_facts', {}).get('alcohol') or vintage_info.get('alcohol')
-                    if alcohol:
-                        try:
-                            wine_data['alcohol_percent'] = float(alcohol)
-                            logger.debug(f"Found Alcohol Percentage from __PRELOADED_STATE__: {wine_data['alcohol_percent']}%")
-                        except (ValueError, TypeError):
-                            logger.debug("Could not parse alcohol percentage from __PRELOADED_STATE__.")
+    if wine_data['alcohol_percent'] is None:
+        alcohol = vintage_info.get('wine_facts', {}).get('alcohol') or vintage_info.get('alcohol')
+        if alcohol:
+            try:
+                wine_data['alcohol_percent'] = float(alcohol)
+                logger.debug(f"Found Alcohol Percentage from __PRELOADED_STATE__: {wine_data['alcohol_percent']}%")
+            except (ValueError, TypeError):
+                logger.debug("Could not parse alcohol percentage from __PRELOADED_STATE__.")
 
-            except json.JSONDecodeError:
-                logger.warning("Failed to decode __PRELOADED_STATE__ JSON.")
-    
-    script_tags = soup.find_all('script', type='application/ld+json')
-    for script in script_tags:
+def _apply_json_ld(json_ld_blocks: list, wine_data: dict, all_grape_names_collected: list):
+    """
+    Fills rating/vintage from the page's JSON-LD blocks and collects grape names.
+    Returns True if grapes were found in the JSON-LD.
+    """
+    found_grapes_in_json = False
+    for json_ld in json_ld_blocks:
         try:
-            json_ld = json.loads(script.string)
             if isinstance(json_ld, dict):
                 is_product = json_ld.get('@type') == 'Product'
                 is_wine = json_ld.get('@type') == 'Wine'
@@ -247,7 +389,7 @@ def _perform_scrape_attempt_selenium(url: str):
                     if 'aggregateRating' in json_ld and wine_data['vivino_rating'] is None:
                         try: wine_data['vivino_rating'] = float(str(json_ld['aggregateRating'].get('ratingValue')).replace(',', '.'))
                         except (ValueError, TypeError, AttributeError): pass
-                
+
                 grape_source = None
                 if is_product and 'containsWine' in json_ld and isinstance(json_ld['containsWine'], dict) and 'grape' in json_ld['containsWine']:
                     grape_source = json_ld['containsWine']['grape']
@@ -263,9 +405,109 @@ def _perform_scrape_attempt_selenium(url: str):
                     if wine_data['vintage'] is None and 'vintage' in json_ld:
                         try: wine_data['vintage'] = int(json_ld['vintage'])
                         except (ValueError, TypeError): pass
-        except (json.JSONDecodeError, KeyError, TypeError) as json_err:
+        except (KeyError, TypeError) as json_err:
             logger.debug(f"Vivino JSON-LD parsing error (may be benign): {json_err}")
-            pass
+    return found_grapes_in_json
+
+def _apply_vintage_from_name(wine_data: dict):
+    if wine_data['vintage'] is None:
+        match = re.search(r'\b(19\d{2}|20\d{2})\b', wine_data['name'])
+        if match:
+            try:
+                wine_data['vintage'] = int(match.group(0))
+                wine_data['name'] = " ".join(wine_data['name'].replace(match.group(0), '').strip().split())
+            except ValueError: pass
+
+def _collect_raw_grapes(wine_data: dict, all_grape_names_collected: list):
+    # Varietal processing lives in normalize_wine_data() so it can access region.yaml hints.
+    # We will just collect and store the raw grape list here.
+    raw_grapes = []
+    if all_grape_names_collected or 'Unknown Wine' not in wine_data['name']:
+        cleaned_grapes = [g.strip() for g in all_grape_names_collected if g.strip().lower() not in ['wine']]
+        raw_grapes = list(dict.fromkeys(cleaned_grapes))
+    
+    wine_data['raw_grapes'] = raw_grapes
+
+def extract_wine_data_from_js(page_state: dict, final_url_after_scrape: str):
+    """
+    Builds the raw wine fields from the structured data read out of the page's
+    JS context (see _PAGE_STATE_JS). Same output shape as extract_wine_data().
+    """
+    wine_data = _new_wine_data()
+    if not _apply_page_name(wine_data, page_state.get('h1'), final_url_after_scrape):
+        return None
+
+    all_grape_names_collected = []
+    _apply_preloaded_state(page_state.get('state') or {}, wine_data)
+    _apply_json_ld(page_state.get('json_ld') or [], wine_data, all_grape_names_collected)
+
+    if wine_data['image_url'] and wine_data['image_url'].startswith('//'):
+        wine_data['image_url'] = 'https:' + wine_data['image_url']
+    _apply_vintage_from_name(wine_data)
+    _collect_raw_grapes(wine_data, all_grape_names_collected)
+    return wine_data
+
+def _unfilled_fallback_fields(wine_data: dict):
+    """
+    Returns the fields still unknown after the JS extraction that extract_wine_data()'s
+    DOM fallbacks recover from other markup: the label image (preload link / img tag),
+    country/region/grapes (links) and wine type (breadcrumbs).
+    Vintage, alcohol and rating are left out: the vintage span, facts table and rating
+    div render from the same page state, so they are empty whenever it lacks those
+    values (non-vintage wines, unrated vintages, no facts).
+    """
+    unknown = {
+        'image_url': wine_data['image_url'] is None,
+        'country': wine_data['country'] == 'Unknown Country',
+        'region': wine_data['region'] == 'Unknown Region',
+        'raw_grapes': not wine_data.get('raw_grapes'),
+        'wine_type': wine_data['wine_type'] is None,
+    }
+    return [field for field, is_unknown in unknown.items() if is_unknown]
+
+def _js_page_needs_html(page: dict):
+    """True if the serialized HTML is needed: no page state, or it leaves fallback fields unknown."""
+    if not (page['js'] and page['js'].get('state')):
+        return True
+    # Not a wine page (no h1, 404): the HTML parser would reject it the same way.
+    return page['wine_data'] is not None and bool(_unfilled_fallback_fields(page['wine_data']))
+
+def extract_wine_data(page_source: str, final_url_after_scrape: str):
+    """
+    Extracts the raw wine fields from a rendered Vivino page.
+    Returns None if the page is not a usable wine page. Grapes are returned
+    unprocessed under 'raw_grapes'; see normalize_wine_data().
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(page_source, 'lxml')
+    
+    wine_data = _new_wine_data()
+
+    name_tag = soup.find('h1', class_=re.compile(r'wine-page-header__name|VintageTitle_wine')) or soup.find('h1')
+    if not _apply_page_name(wine_data, name_tag.text if name_tag else None, final_url_after_scrape):
+        return None
+
+    all_grape_names_collected = []
+    
+    # Primary Method: Parse the __PRELOADED_STATE__ JSON blob.
+    preloaded_state_script = soup.find('script', string=re.compile(r'window\.__PRELOADED_STATE__\.vintagePageInformation'))
+    if preloaded_state_script:
+        logger.debug("Found __PRELOADED_STATE__ script tag. Parsing for detailed wine info.")
+        script_content = preloaded_state_script.string
+        json_str_match = re.search(r'window\.__PRELOADED_STATE__\.vintagePageInformation\s*=\s*(\{.*?\});', script_content, re.DOTALL)
+        if json_str_match:
+            try:
+                _apply_preloaded_state(json.loads(json_str_match.group(1)), wine_data)
+            except json.JSONDecodeError:
+                logger.warning("Failed to decode __PRELOADED_STATE__ JSON.")
+    
+    json_ld_blocks = []
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            json_ld_blocks.append(json.loads(script.string))
+        except (json.JSONDecodeError, TypeError) as json_err:
+            logger.debug(f"Vivino JSON-LD parsing error (may be benign): {json_err}")
+    found_grapes_in_json = _apply_json_ld(json_ld_blocks, wine_data, all_grape_names_collected)
 
     # Fallback 1: Preload link
     if wine_data['image_url'] is None:
@@ -286,13 +528,7 @@ def _perform_scrape_attempt_selenium(url: str):
     if wine_data['image_url'] and wine_data['image_url'].startswith('//'):
         wine_data['image_url'] = 'https:' + wine_data['image_url']
             
-    if wine_data['vintage'] is None:
-        match = re.search(r'\b(19\d{2}|20\d{2})\b', wine_data['name'])
-        if match:
-            try:
-                wine_data['vintage'] = int(match.group(0))
-                wine_data['name'] = " ".join(wine_data['name'].replace(match.group(0), '').strip().split())
-            except ValueError: pass
+    _apply_vintage_from_name(wine_data)
 
     if wine_data['vintage'] is None:
         vintage_span = soup.find('span', class_='vintage')
@@ -349,17 +585,7 @@ def _perform_scrape_attempt_selenium(url: str):
         except Exception as e:
             logger.debug(f"Could not parse alcohol percentage from facts table (non-critical): {e}")
 
-    # --- START REFACTOR ---
-    # Varietal processing is MOVED to scrape_vivino_url() so it can access region.yaml hints.
-    # We will just collect and store the raw grape list here.
-    
-    raw_grapes = []
-    if all_grape_names_collected or 'Unknown Wine' not in wine_data['name']:
-        cleaned_grapes = [g.strip() for g in all_grape_names_collected if g.strip().lower() not in ['wine']]
-        raw_grapes = list(dict.fromkeys(cleaned_grapes))
-    
-    wine_data['raw_grapes'] = raw_grapes
-    # --- END REFACTOR ---
+    _collect_raw_grapes(wine_data, all_grape_names_collected)
 
     if wine_data['vivino_rating'] is None:
         rating_tag = soup.find('div', class_=re.compile(r'vivinoRating_averageValue|community-score__score'))
@@ -367,7 +593,7 @@ def _perform_scrape_attempt_selenium(url: str):
             try: wine_data['vivino_rating'] = float(rating_tag.text.strip().replace(',', '.'))
             except (ValueError, TypeError): pass
 
-    return wine_data, final_url_after_scrape
+    return wine_data
 
 def _collect_hints(data_dict: dict, collected: dict):
     """Helper to recursively merge hints, with deeper hints overwriting."""
@@ -585,23 +811,18 @@ def strip_pipe_suffix(region_name: str) -> str:
         return region_name.split('|')[0].strip()
     return region_name.strip()
 
-def scrape_vivino_url(vivino_url):
+def normalize_wine_data(wine_data: dict, vivino_url: str):
     """
-    Orchestrates scraping using a headless browser to be resilient to anti-bot measures.
+    Applies region.yaml normalization and the varietal heuristics to freshly
+    extracted wine data (in place). Shared by live scrapes and snapshot reparses.
     """
-    logger.info(f"Starting Selenium-based scrape for: {vivino_url}")
-
     # --- Phase 1: Pre-scrape region hint from URL ---
     region_hint = _region_hint_from_url(vivino_url)
     if region_hint:
         logger.debug(f"URL region hint detected: {region_hint}")
 
-    wine_data, canonical_url = _perform_scrape_attempt_selenium(vivino_url)
-    if not canonical_url:
-        canonical_url = vivino_url
-
     # --- Apply URL hint if scrape has no region/country ---
-    if wine_data and region_hint:
+    if region_hint:
         if not wine_data.get("region"):
             wine_data["region"] = (
                 region_hint.get("subsubregion")
@@ -614,7 +835,7 @@ def scrape_vivino_url(vivino_url):
     # --- Region normalization using region.yaml ---
     region_hints = {} # Initialize hints dict
 
-    if wine_data and wine_data.get("region"):
+    if wine_data.get("region"):
         # NEW: Apply suffix-stripping normalization first
         raw_region = wine_data.get("region")
         wine_data["region"] = normalize_region_name(raw_region)
@@ -784,15 +1005,103 @@ def scrape_vivino_url(vivino_url):
 
     # --- END REFACTOR ---
 
+    return wine_data
+
+def _nearby_vintage_urls(vivino_url: str):
+    """
+    Returns candidate URLs for the same wine: the vintages around the requested
+    `year=` (nearest first, never in the future) followed by the non-vintage page.
+    Returns an empty list if the URL has no vintage to probe around.
+    """
+    parsed_url = urlparse(vivino_url)
+    query_params = parse_qs(parsed_url.query)
+    year_str = query_params.get('year', [None])[0]
+    if not year_str or not year_str.isdigit():
+        return []
+
+    year = int(year_str)
+    current_year = datetime.date.today().year
+    candidate_years = []
+    for offset in range(1, config.SCRAPER_NEARBY_VINTAGE_RANGE + 1):
+        candidate_years.extend(y for y in (year - offset, year + offset) if y <= current_year)
+
+    urls = []
+    for candidate_year in candidate_years:
+        params = dict(query_params, year=[str(candidate_year)])
+        urls.append(urlunparse(parsed_url._replace(query=urlencode(params, doseq=True))))
+    non_vintage_params = {k: v for k, v in query_params.items() if k != 'year'}
+    urls.append(urlunparse(parsed_url._replace(query=urlencode(non_vintage_params, doseq=True))))
+    return urls
+
+def _has_wine_level_fields(wine_data: dict):
+    """True if scraped data carries the fields shared by every vintage of a wine."""
+    if not wine_data or wine_data.get('name') == 'Unknown Wine':
+        return False
+    return bool(
+        wine_data.get('wine_type')
+        or wine_data.get('raw_grapes')
+        or wine_data.get('region') not in (None, 'Unknown Region')
+    )
+
+def _probe_nearby_vintages(vivino_url: str):
+    """
+    Scrapes the nearby-vintage candidates concurrently (bounded by
+    SCRAPER_NEARBY_PROBE_CONCURRENCY) and returns the first result carrying the
+    wine-level fields, with the vintage reset to the requested one and the
+    vintage-specific fields (rating, alcohol, label image) cleared.
+    Returns None if no candidate page could be used.
+    Probe pages are not snapshotted: they are stored under another vintage's URL.
+    """
+    candidates = _nearby_vintage_urls(vivino_url)
+    if not candidates:
+        return None
+
+    requested_vintage = int(parse_qs(urlparse(vivino_url).query)['year'][0])
+    logger.info(f"Probing {len(candidates)} nearby vintage pages for {vivino_url}.")
+    executor = ThreadPoolExecutor(max_workers=config.SCRAPER_NEARBY_PROBE_CONCURRENCY, thread_name_prefix="vintage-probe")
+    stop_event = threading.Event()
+    try:
+        futures = {executor.submit(_perform_scrape_attempt_selenium, url, stop_event, False): url for url in candidates}
+        for future in as_completed(futures):
+            try:
+                wine_data, _final_url = future.result()
+            except Exception as e:
+                logger.debug(f"Nearby vintage probe for {futures[future]} raised: {e}")
+                continue
+            if _has_wine_level_fields(wine_data):
+                logger.info(f"Resolved wine details from nearby page {futures[future]}; keeping requested vintage {requested_vintage}.")
+                # Rating, alcohol and label belong to the other vintage; only wine-level fields carry over.
+                wine_data.update(vintage=requested_vintage, vivino_rating=None, alcohol_percent=None, image_url=None)
+                return wine_data
+    finally:
+        # Slower probes stop at their next page-ready check and close their browsers.
+        stop_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    logger.warning(f"No nearby vintage page for {vivino_url} had usable wine details.")
+    return None
+
+def scrape_vivino_url(vivino_url):
+    """
+    Orchestrates scraping using a headless browser to be resilient to anti-bot measures.
+    """
+    logger.info(f"Starting Selenium-based scrape for: {vivino_url}")
+
+    wine_data, canonical_url = _perform_scrape_attempt_selenium(vivino_url)
+    if not canonical_url:
+        canonical_url = vivino_url
+
     # --- Handle fallback or failure ---
     if wine_data:
+        normalize_wine_data(wine_data, vivino_url)
         logger.info(f"Success on initial Selenium scrape for {canonical_url}")
         return wine_data, canonical_url
 
-    logger.warning(f"Initial Selenium scrape failed for {canonical_url}. Cooling down before checking nearby vintages.")
-    time.sleep(random.uniform(3.0, 5.0))
-
-    # --- (rest of your vintage and fallback logic unchanged) ---
+    logger.warning(f"Initial Selenium scrape failed for {canonical_url}. Checking nearby vintages.")
+    wine_data = _probe_nearby_vintages(vivino_url)
+    if wine_data:
+        normalize_wine_data(wine_data, vivino_url)
+        return wine_data, vivino_url
 
     logger.warning("All scrape attempts failed. Attempting to parse URL for final fallback data.")
     fallback_data = _parse_url_for_fallback_data(vivino_url)
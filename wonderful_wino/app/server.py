@@ -0,0 +1,102 @@
+import logging
+import signal
+import time
+from . import config
+
+# Set up a logger specific to this module
+logger = logging.getLogger(__name__)
+
+# Production WSGI server (waitress) for the add-on.
+#
+# waitress runs requests on a fixed pool of WEB_THREADS worker threads behind one
+# async I/O loop. A slow scan or HA call ties up a single worker while the others
+# keep serving inventory reads, and idle keep-alive connections cost no thread.
+# The app keeps in-process state (MQTT client, outbox worker, sensor refresh), so it
+# runs as one process with threads rather than several worker processes.
+#
+# Open /api/events streams get EVENT_STREAM_MAX_CLIENTS threads of their own on top
+# of WEB_THREADS, so browser tabs left open don't take request capacity.
+#
+# On SIGTERM/SIGINT the server stops accepting connections, lets in-flight
+# requests finish (up to WEB_SHUTDOWN_TIMEOUT seconds), then returns so the
+# caller exits normally and the atexit hooks (MQTT offline message etc.) run.
+
+_stop_requested_at = None
+_on_stop = []
+
+# waitress has no public drain; _run_until_stopped drives its I/O loop directly.
+# These are the server internals it relies on (requirements.txt pins the tested range).
+_WAITRESS_INTERNALS = ("_map", "asyncore", "adj", "active_channels", "task_dispatcher", "trigger")
+
+def _request_stop(signum, frame):
+    global _stop_requested_at
+    if _stop_requested_at is None:
+        logger.info(f"Received signal {signum}; finishing in-flight requests before shutdown.")
+        _stop_requested_at = time.monotonic()
+        for callback in _on_stop:
+            callback()
+
+def _run_until_stopped(server):
+    """Runs the waitress I/O loop until a stop is requested and the open requests have drained."""
+    loop_kwargs = {"timeout": 0.5, "map": server._map, "use_poll": server.adj.asyncore_use_poll, "count": 1}
+    while True:
+        server.asyncore.loop(**loop_kwargs)
+        if _stop_requested_at is None:
+            continue
+        if server.accepting:
+            server.accepting = False
+            server.del_channel()
+            server.socket.close()
+        # Close keep-alive connections between requests; busy ones close once their response is sent.
+        for channel in list(server.active_channels.values()):
+            if not channel.requests:
+                channel.will_close = True
+        if not server.active_channels:
+            break
+        if time.monotonic() - _stop_requested_at >= config.WEB_SHUTDOWN_TIMEOUT:
+            logger.warning(f"{len(server.active_channels)} connection(s) still open after "
+                           f"{config.WEB_SHUTDOWN_TIMEOUT}s; shutting down anyway.")
+            break
+    server.task_dispatcher.shutdown(cancel_pending=True, timeout=1)
+    server.trigger.close()
+
+def serve(app, host: str = "0.0.0.0", port: int = 5000, on_stop=None):
+    """
+    Serves the Flask app until SIGTERM/SIGINT. Falls back to Flask's development server if asked or if waitress is missing.
+    on_stop is called when a stop is requested, e.g. to end long-lived streams before draining.
+    """
+    if on_stop:
+        _on_stop.append(on_stop)
+    if config.WEB_SERVER == "flask":
+        logger.info(f"Starting Flask development server on port {port} (WEB_SERVER=flask).")
+        app.run(host=host, port=port, threaded=True)
+        return
+    try:
+        from waitress.server import create_server
+    except ImportError:
+        logger.warning("waitress is not installed; falling back to Flask's development server.")
+        app.run(host=host, port=port, threaded=True)
+        return
+
+    server = create_server(
+        app,
+        host=host,
+        port=port,
+        threads=config.WEB_THREADS + config.EVENT_STREAM_MAX_CLIENTS,
+        connection_limit=config.WEB_CONNECTION_LIMIT,
+        channel_timeout=config.WEB_CHANNEL_TIMEOUT,
+        ident="wonderful_wino",
+    )
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    logger.info(f"Serving on http://{host}:{port} with waitress ({config.WEB_THREADS} threads + {config.EVENT_STREAM_MAX_CLIENTS} for event streams, "
+                f"connection limit {config.WEB_CONNECTION_LIMIT}, idle timeout {config.WEB_CHANNEL_TIMEOUT}s).")
+    if all(hasattr(server, name) for name in _WAITRESS_INTERNALS):
+        _run_until_stopped(server)
+    else:
+        # Unknown waitress version: serve normally; a signal then stops the process without draining.
+        logger.warning("This waitress version lacks the internals used for a graceful drain; serving without it.")
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        server.run()
+    logger.info("Web server stopped.")
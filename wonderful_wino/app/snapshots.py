@@ -0,0 +1,191 @@
+import sqlite3
+import logging
+import gzip
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from . import config, db
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency; gzip is always available.
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+def _get_snapshot_connection():
+    """Returns a connection to the snapshot store, creating its table on first use."""
+    os.makedirs(os.path.dirname(config.SNAPSHOT_DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(config.SNAPSHOT_DB_PATH)
+    conn.row_factory = sqlite3.Row
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS page_snapshots (
+            vivino_url TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            content BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            captured_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn
+
+def _compress(html: str):
+    """Compresses page HTML with zstd when available, otherwise gzip. Returns (codec, blob)."""
+    raw = html.encode('utf-8')
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=10).compress(raw)
+    return 'gzip', gzip.compress(raw, compresslevel=9)
+
+def _decompress(codec: str, content: bytes) -> str:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Snapshot was stored with zstd but the 'zstandard' package is not installed.")
+        return zstandard.ZstdDecompressor().decompress(content).decode('utf-8')
+    return gzip.decompress(content).decode('utf-8')
+
+def save_snapshot(vivino_url: str, html: str):
+    """
+    Stores the raw page for a canonical URL (replacing any older copy), then
+    evicts the oldest snapshots until the store is back under SNAPSHOT_MAX_MB.
+    Does nothing unless SAVE_PAGE_SNAPSHOTS is enabled. Never raises.
+    """
+    if not config.SAVE_PAGE_SNAPSHOTS or not html:
+        return
+    conn = None
+    try:
+        codec, content = _compress(html)
+        conn = _get_snapshot_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO page_snapshots (vivino_url, codec, content, size, captured_at) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+            (vivino_url, codec, content, len(content))
+        )
+        max_bytes = config.SNAPSHOT_MAX_MB * 1024 * 1024
+        cursor.execute("SELECT COALESCE(SUM(size), 0) FROM page_snapshots")
+        total_bytes = cursor.fetchone()[0]
+        if total_bytes > max_bytes:
+            cursor.execute("SELECT vivino_url, size FROM page_snapshots ORDER BY captured_at ASC")
+            evicted = []
+            for row in cursor.fetchall():
+                if total_bytes <= max_bytes:
+                    break
+                if row['vivino_url'] == vivino_url:
+                    continue
+                evicted.append(row['vivino_url'])
+                total_bytes -= row['size']
+            cursor.executemany("DELETE FROM page_snapshots WHERE vivino_url = ?", [(url,) for url in evicted])
+            logger.info(f"Snapshot store over {config.SNAPSHOT_MAX_MB} MB; evicted {len(evicted)} oldest snapshots.")
+        conn.commit()
+        logger.debug(f"Stored {codec} page snapshot for {vivino_url} ({len(content)} bytes, {len(html)} raw).")
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Failed to store page snapshot for {vivino_url}: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+def get_snapshot_urls():
+    """Returns the canonical URLs that currently have a stored snapshot."""
+    if not os.path.exists(config.SNAPSHOT_DB_PATH):
+        return []
+    conn = None
+    try:
+        conn = _get_snapshot_connection()
+        return [row['vivino_url'] for row in conn.execute("SELECT vivino_url FROM page_snapshots")]
+    except sqlite3.Error as e:
+        logger.error(f"Database error listing page snapshots: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+def _load_snapshots(urls=None):
+    """Yields (vivino_url, codec, content) for all snapshots, or only for `urls`."""
+    conn = None
+    try:
+        conn = _get_snapshot_connection()
+        if urls:
+            placeholders = ", ".join("?" for _ in urls)
+            rows = conn.execute(f"SELECT vivino_url, codec, content FROM page_snapshots WHERE vivino_url IN ({placeholders})", tuple(urls)).fetchall()
+        else:
+            rows = conn.execute("SELECT vivino_url, codec, content FROM page_snapshots").fetchall()
+        return [(row['vivino_url'], row['codec'], row['content']) for row in rows]
+    except sqlite3.Error as e:
+        logger.error(f"Database error loading page snapshots: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+# --- Offline Reparse ---
+
+def _init_reparse_worker(varietals, region_data):
+    """Process-pool initializer: gives each worker the same reference data as the live scraper."""
+    from . import scraper
+    scraper.GLOBAL_GRAPE_VARIETALS = varietals
+    scraper.REGION_DATA = region_data
+
+def _reparse_snapshot(item):
+    """Runs extraction and normalization over one stored page. Executed in a worker process."""
+    from . import scraper
+    vivino_url, codec, content = item
+    try:
+        wine_data = scraper.extract_wine_data(_decompress(codec, content), vivino_url)
+        if wine_data:
+            scraper.normalize_wine_data(wine_data, vivino_url)
+        return vivino_url, wine_data, None
+    except Exception as e:
+        return vivino_url, None, str(e)
+
+def reparse_snapshots(urls=None, processes=None):
+    """
+    Re-runs the scraper's extraction/normalization pipeline over stored snapshots
+    using a process pool. Returns a list of (vivino_url, wine_data, error) tuples.
+    """
+    from . import scraper
+    items = _load_snapshots(urls)
+    if not items:
+        return []
+    processes = processes or min(4, os.cpu_count() or 1)
+    logger.info(f"Reparsing {len(items)} page snapshots with {processes} processes.")
+    # Forking the running server would copy locks held by its threads (logging, sqlite, MQTT);
+    # forkserver workers start from a clean process instead.
+    with ProcessPoolExecutor(
+        max_workers=processes, mp_context=multiprocessing.get_context("forkserver"),
+        initializer=_init_reparse_worker,
+        initargs=(scraper.GLOBAL_GRAPE_VARIETALS, scraper.REGION_DATA)
+    ) as executor:
+        return list(executor.map(_reparse_snapshot, items, chunksize=8))
+
+# Vintage is left out on purpose: it is part of a wine's identity and may have been set by the user.
+REPARSE_FIELDS = tuple(field for field in db.WINE_REFRESH_FIELDS if field != 'vintage')
+
+# What the parser reports when a page lacks a field; never worth writing over a stored value.
+PLACEHOLDER_VALUES = (None, '', 'Unknown Wine', 'Unknown Varietal', 'Unknown Region', 'Unknown Country')
+
+def diff_reparsed_wines(urls=None, processes=None):
+    """
+    Reparses stored snapshots and compares the result with the wines table.
+    Returns one report per snapshot whose wine exists and whose fields would change:
+    {"vivino_url", "name", "changes": {column: (old, new)}}. Nothing is written.
+    Fields the page didn't yield (None or a placeholder) and fields the user edited
+    by hand are left out of the changes.
+    """
+    reports = []
+    for vivino_url, wine_data, error in reparse_snapshots(urls, processes):
+        if error or not wine_data:
+            logger.warning(f"Reparse produced no data for {vivino_url}: {error or 'not a wine page'}")
+            continue
+        wine = db.get_wine_by_url(vivino_url)
+        if not wine:
+            logger.debug(f"Snapshot {vivino_url} has no matching wine in the database. Skipping.")
+            continue
+        edited = db.get_user_edited_fields(wine)
+        reparsed = {
+            field: wine_data.get(field) for field in REPARSE_FIELDS
+            if field not in edited and wine_data.get(field) not in PLACEHOLDER_VALUES
+        }
+        changes = db.diff_wine_fields(wine, reparsed)
+        if changes:
+            reports.append({"vivino_url": vivino_url, "name": wine['name'], "changes": changes})
+    logger.info(f"Reparse found changes for {len(reports)} wines.")
+    return reports
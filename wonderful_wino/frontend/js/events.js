@@ -0,0 +1,39 @@
+// js/events.js
+// Live inventory updates over server-sent events (/api/events), so changes made
+// in another tab or by Home Assistant automations show up without a reload.
+
+import * as state from './state.js';
+import { BASE_URL } from './config.js';
+import { fetchInventory, applyWineUpsert, applyQuantityChange, applyWineDeleted } from './inventory.js';
+
+let eventSource = null;
+
+function onEvent(type, handler) {
+    eventSource.addEventListener(type, (e) => {
+        try {
+            handler(JSON.parse(e.data));
+        } catch (error) {
+            console.error(`Failed to apply '${type}' event:`, error);
+        }
+    });
+}
+
+export function connectEventStream() {
+    if (eventSource || typeof EventSource === 'undefined') return;
+    eventSource = new EventSource(`${BASE_URL}api/events`);
+
+    eventSource.onopen = () => {
+        // Anything committed while we were disconnected is replayed (or a resync is sent).
+        state.setEventStreamConnected(true);
+    };
+    eventSource.onerror = () => {
+        // The browser reconnects by itself; until then actions fall back to refetching.
+        state.setEventStreamConnected(false);
+    };
+
+    onEvent('wine_upserted', (data) => applyWineUpsert(data.wine));
+    onEvent('quantity_changed', applyQuantityChange);
+    onEvent('wine_deleted', applyWineDeleted);
+    onEvent('resync', () => fetchInventory());
+    onEvent('job_finished', (job) => window.dispatchEvent(new CustomEvent('wwino:job-finished', { detail: job })));
+}
@@ -26,6 +26,46 @@ export async function fetchInventory() {
     }
 }
 
+// --- Live updates from /api/events (see events.js) ---
+
+function matchesCurrentFilter(wine) {
+    if (state.currentFilter === 'on_hand') return wine.quantity > 0;
+    if (state.currentFilter === 'history') return wine.quantity === 0;
+    return true;
+}
+
+function replaceInventory(list) {
+    state.setMasterInventoryList(list);
+    updateFilterVisibility();
+    updateDisplayedInventory();
+}
+
+export function applyWineUpsert(wine) {
+    const others = state.masterInventoryList.filter(item => item.vivino_url !== wine.vivino_url);
+    replaceInventory(matchesCurrentFilter(wine) ? [...others, wine] : others);
+}
+
+export function applyQuantityChange({ vivino_url, quantity, personal_rating }) {
+    const existing = state.masterInventoryList.find(item => item.vivino_url === vivino_url);
+    if (!existing) {
+        // A wine moving into the current view (e.g. back on hand); we only have its new quantity.
+        if (matchesCurrentFilter({ quantity })) fetchInventory();
+        return;
+    }
+    const patch = { quantity };
+    if (personal_rating !== undefined) patch.personal_rating = personal_rating;
+    applyWineUpsert({ ...existing, ...patch });
+}
+
+export function applyWineDeleted({ vivino_url }) {
+    replaceInventory(state.masterInventoryList.filter(item => item.vivino_url !== vivino_url));
+}
+
+// After an action, the change event patches the list; only refetch when the stream is down.
+export function refreshInventoryAfterChange() {
+    if (!state.eventStreamConnected) fetchInventory();
+}
+
 export function updateDisplayedInventory() {
     let inventoryToDisplay = [...state.masterInventoryList];
 
@@ -243,7 +283,7 @@ async function setWineQuantity(vivinoUrl, newQuantity) {
             method: 'POST',
             body: JSON.stringify({ vivino_url: vivinoUrl, quantity: quantity })
         }, 'inventoryMessage');
-        fetchInventory();
+        refreshInventoryAfterChange();
     } catch (error) { /* Error already shown by apiCall */ }
 }
 
@@ -254,7 +294,7 @@ async function deleteWine(vivinoUrl) {
             method: 'DELETE',
             body: JSON.stringify({ vivino_url: vivinoUrl })
         }, 'inventoryMessage');
-        fetchInventory();
+        refreshInventoryAfterChange();
     } catch (error) { /* Error already shown by apiCall */ }
 }
 
@@ -4,7 +4,8 @@
 import * as state from './state.js';
 import { BASE_URL, VIVINO_SEARCH_URL } from './config.js';
 import { loadHTML, apiCall, showMessage } from './utils.js';
-import { fetchInventory, updateDisplayedInventory } from './inventory.js';
+import { fetchInventory, updateDisplayedInventory, refreshInventoryAfterChange } from './inventory.js';
+import { connectEventStream } from './events.js';
 import { openModal, closeModal, promptForVintage } from './modals.js';
 import { getEntryFormData, checkFormChanges, fetchAndDisplayConsumptionHistory, getNotesFormData } from './forms.js';
 import { 
@@ -117,7 +118,7 @@ function setupEventListeners() {
         if (e.target.id === 'entrySaveAsNewWineBtn') {
             const payload = getEntryFormData();
             apiCall('add-manual-wine', { method: 'POST', body: JSON.stringify(payload) }, 'entryMessage', e.target)
-                .then(() => { fetchInventory(); setTimeout(closeModal, 1500); })
+                .then(() => { refreshInventoryAfterChange(); setTimeout(closeModal, 1500); })
                 .catch(err => console.error(err));
         }
 
@@ -219,7 +220,7 @@ function setupEventListeners() {
                     showScanMessage("Wine facts obtained and stored/updated", 'success');
                     
                     resetVivinoPanel();
-                    fetchInventory();
+                    refreshInventoryAfterChange();
                     startPanelCollapseTimer();
 
                 } catch (error) {
@@ -234,7 +235,7 @@ function setupEventListeners() {
                 if (isEditMode) entryPayload.vivino_url = document.getElementById('entryVivinoUrl').value;
                 try {
                     await apiCall(isEditMode ? 'edit-wine' : 'add-manual-wine', { method: 'POST', body: JSON.stringify(entryPayload) }, 'entryMessage', e.target.querySelector('button[type="submit"]'));
-                    fetchInventory();
+                    refreshInventoryAfterChange();
                     setTimeout(closeModal, 1500);
                 } catch (error) {}
                 break;
@@ -246,14 +247,14 @@ function setupEventListeners() {
                 try {
                     await apiCall('inventory/wine/consume', { method: 'POST', body: JSON.stringify(tastePayload) }, 'inventoryMessage', e.target.querySelector('button[type="submit"]'));
                     closeModal();
-                    fetchInventory();
+                    refreshInventoryAfterChange();
                 } catch (error) {}
                 break;
             case 'notesForm':
                 const notesPayload = getNotesFormData();
                 try {
                     await apiCall('api/wine/notes', { method: 'POST', body: JSON.stringify(notesPayload) }, 'notesMessage', e.target.querySelector('button[type="submit"]'));
-                    fetchInventory();
+                    refreshInventoryAfterChange();
                     setTimeout(closeModal, 1500);
                 } catch (error) {}
                 break;
@@ -403,18 +404,10 @@ document.addEventListener('keydown', (e) => {
 
 // --- App Initialization ---
 document.addEventListener('DOMContentLoaded', async () => {
-    // Load all HTML components
-    await Promise.all([
-        loadHTML('components/add-wine.html', document.getElementById('addWineSection')),
-        loadHTML('components/inventory.html', document.getElementById('inventorySection')),
-        loadHTML('components/manual-entry-modal.html', document.getElementById('modalContainer'), true),
-        loadHTML('components/notes-modal.html', document.getElementById('modalContainer'), true),
-        loadHTML('components/settings-modal.html', document.getElementById('modalContainer'), true),
-        loadHTML('components/help-modal.html', document.getElementById('modalContainer'), true),
-        loadHTML('components/other-tools-modal.html', document.getElementById('modalContainer'), true),
-        loadHTML('components/taste-modal.html', document.getElementById('modalContainer'), true),
-        loadHTML('components/nv-prompt-modal.html', document.getElementById('modalContainer'), true)
-    ]);
+    // Load the HTML components listed in data-component attributes (the asset build inlines them instead)
+    await Promise.all([...document.querySelectorAll('[data-component]')].flatMap(element =>
+        element.dataset.component.trim().split(/\s+/).map(url => loadHTML(url, element, true))
+    ));
 
     // Initial Setup
     const savedTheme = localStorage.getItem('theme');
@@ -427,6 +420,7 @@ document.addEventListener('DOMContentLoaded', async () => {
 
     await fetchSettings();
     fetchInventory();
+    connectEventStream();
 
     // Wire up UI components and event listeners
     setupEventListeners();
@@ -440,6 +434,7 @@ document.addEventListener('DOMContentLoaded', async () => {
     document.getElementById('addWineContent')?.addEventListener('click', startPanelCollapseTimer);
 
     document.addEventListener('visibilitychange', () => {
-        if (document.visibilityState === 'visible') fetchInventory();
+        // With the event stream open the list is already current.
+        if (document.visibilityState === 'visible' && !state.eventStreamConnected) fetchInventory();
     });
 });
\ No newline at end of file
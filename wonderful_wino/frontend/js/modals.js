@@ -4,8 +4,8 @@
 import * as state from './state.js';
 import { updateStarVisuals, updateFeedbackText, updateCostTierSelector, resetTasteStars, applyFocalPointAndZoom, updateImageTransform } from './ui.js';
 import { fetchAndDisplayConsumptionHistory, getEntryFormData, checkFormChanges, getNotesFormData } from './forms.js';
-import { fetchInventory } from './inventory.js';
-import { apiCall } from './utils.js';
+import { refreshInventoryAfterChange } from './inventory.js';
+import { apiCall, waitForJob } from './utils.js';
 import { DEFAULT_COST_TIERS } from './config.js';
 import { BASE_URL } from './config.js';
 
@@ -298,13 +298,15 @@ window.updateTiers = updateTiers;
 
 async function handleSyncAllWines(messageElementId) {
     if (!confirm('Sync all wines to your Home Assistant To-Do list?')) return;
-    await apiCall('sync-all-wines', { method: 'POST' }, messageElementId, document.getElementById('syncAllBtn'));
+    const button = document.getElementById('syncAllBtn');
+    const result = await apiCall('sync-all-wines', { method: 'POST' }, messageElementId, button);
+    if (result && result.job_id) await waitForJob(result.job_id, messageElementId, button);
 }
 
 async function handleReinitializeDb(messageElementId) {
     if (!confirm('ARE YOU SURE? This will permanently delete ALL wine data!')) return;
     await apiCall('reinitialize-database-action', { method: 'POST' }, messageElementId, document.getElementById('resetDbBtn'));
-    fetchInventory();
+    refreshInventoryAfterChange();
 }
 
 async function handleBackupDb(messageElementId) {
@@ -314,8 +316,10 @@ async function handleBackupDb(messageElementId) {
 
 async function handleRestoreDb(messageElementId) {
     if (!confirm('ARE YOU SURE? This will overwrite your current database with the backup file. Any changes since the last backup will be lost.')) return;
-    await apiCall('restore-database', { method: 'POST' }, messageElementId, document.getElementById('restoreDbBtn'));
-    setTimeout(fetchInventory, 1500);
+    const button = document.getElementById('restoreDbBtn');
+    const result = await apiCall('restore-database', { method: 'POST' }, messageElementId, button);
+    refreshInventoryAfterChange();
+    if (result && result.job_id) await waitForJob(result.job_id, messageElementId, button);
 }
 
 function updateTiers() {
@@ -13,6 +13,7 @@ export let initialEntryFormData = {};
 export let consumptionLogSortOrder = 'desc';
 export let currentWineForLog = null;
 export let panelCollapseTimer = null;
+export let eventStreamConnected = false;
 
 // Functions to safely update state from other modules
 export function setMasterInventoryList(list) { masterInventoryList = list; }
@@ -26,4 +27,5 @@ export function setLastFocusedElement(el) { lastFocusedElement = el; }
 export function setInitialEntryFormData(data) { initialEntryFormData = data; }
 export function setConsumptionLogSortOrder(order) { consumptionLogSortOrder = order; }
 export function setCurrentWineForLog(wine) { currentWineForLog = wine; }
-export function setPanelCollapseTimer(timer) { panelCollapseTimer = timer; }
\ No newline at end of file
+export function setPanelCollapseTimer(timer) { panelCollapseTimer = timer; }
+export function setEventStreamConnected(value) { eventStreamConnected = value; }
\ No newline at end of file
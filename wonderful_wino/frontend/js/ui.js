@@ -3,7 +3,7 @@
 
 import * as state from './state.js';
 import { apiCall } from './utils.js';
-import { fetchInventory } from './inventory.js';
+import { refreshInventoryAfterChange } from './inventory.js';
 
 export function setupVintageControls() {
     const vintageInput = document.getElementById('manualVintageInput');
@@ -177,7 +177,7 @@ export async function saveFocalPoint(vivinoUrl, focalPoint) {
             method: 'POST',
             body: JSON.stringify({ vivino_url: vivinoUrl, focal_point: focalPoint })
         }, 'notesMessage');
-        fetchInventory();
+        refreshInventoryAfterChange();
     } catch (error) {
         console.error("Failed to save focal point:", error);
     }
@@ -34,6 +34,54 @@ export async function apiCall(endpoint, options = {}, messageElementId, button)
 }
 
 
+/**
+ * Resolves after `ms`, or as soon as the event stream reports the job finished.
+ */
+function waitForJobEvent(jobId, ms) {
+    return new Promise(resolve => {
+        const onFinished = (e) => { if (e.detail && e.detail.id === jobId) done(); };
+        const timer = setTimeout(done, ms);
+        function done() {
+            clearTimeout(timer);
+            window.removeEventListener('wwino:job-finished', onFinished);
+            resolve();
+        }
+        window.addEventListener('wwino:job-finished', onFinished);
+    });
+}
+
+/**
+ * Polls a background job (e.g. a full Home Assistant sync) until it finishes,
+ * showing its progress in the given message element. Resolves with the final job.
+ */
+export async function waitForJob(jobId, messageElementId, button) {
+    const originalButtonText = button ? button.textContent : '';
+    if (button) button.disabled = true;
+    try {
+        while (true) {
+            const response = await fetch(`${BASE_URL}api/jobs/${jobId}`);
+            const job = await response.json();
+            if (!response.ok) throw new Error(job.message || 'Job not found');
+            if (job.status !== 'running') {
+                const failedNote = job.failed ? ` (${job.failed} failed)` : '';
+                const type = job.status === 'failed' ? 'error' : 'info';
+                if (messageElementId) showMessage(messageElementId, `${job.message || 'Done.'}${failedNote}`, type, true);
+                return job;
+            }
+            if (button && job.total) button.textContent = `Syncing ${job.done}/${job.total}...`;
+            await waitForJobEvent(jobId, 1000);
+        }
+    } catch (error) {
+        if (messageElementId) showMessage(messageElementId, `Error: ${error.message}`, 'error', true);
+        throw error;
+    } finally {
+        if (button) {
+            button.disabled = false;
+            button.textContent = originalButtonText;
+        }
+    }
+}
+
 export function showMessage(elementId, text, type = 'info', isModal = false) {
     const messageEl = document.getElementById(elementId);
     if (!messageEl) return;
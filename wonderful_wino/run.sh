@@ -8,6 +8,7 @@ export HA_LONG_LIVED_TOKEN=$(bashio::config 'HA_LONG_LIVED_TOKEN')
 export TODO_LIST_ENTITY_ID=$(bashio::config 'TODO_LIST_ENTITY_ID')
 export LOG_LEVEL=$(bashio::config 'LOG_LEVEL')
 export REINITIALIZE_DATABASE=$(bashio::config 'REINITIALIZE_DATABASE')
+export HA_USE_WEBSOCKET="$(bashio::config 'HA_USE_WEBSOCKET')"
 
 # --- MQTT ---
 export USE_MQTT_DISCOVERY="$(bashio::config 'USE_MQTT_DISCOVERY')"
@@ -15,5 +16,22 @@ export MQTT_HOST="$(bashio::config 'MQTT_HOST')"
 export MQTT_PORT="$(bashio::config 'MQTT_PORT')"
 export MQTT_USER="$(bashio::config 'MQTT_USER')"
 export MQTT_PASSWORD="$(bashio::config 'MQTT_PASSWORD')"
+export MQTT_JSON_STATE="$(bashio::config 'MQTT_JSON_STATE')"
+
+# --- Sensors ---
+export SENSOR_PER_COUNTRY="$(bashio::config 'SENSOR_PER_COUNTRY')"
+
+# --- Web Server ---
+export WEB_THREADS="$(bashio::config 'WEB_THREADS')"
+
+# --- Scraper ---
+export SAVE_PAGE_SNAPSHOTS="$(bashio::config 'SAVE_PAGE_SNAPSHOTS')"
+export SNAPSHOT_MAX_MB="$(bashio::config 'SNAPSHOT_MAX_MB')"
+export SCRAPER_BLOCK_RESOURCES="$(bashio::config 'SCRAPER_BLOCK_RESOURCES')"
+export SCRAPER_BLOCKED_URL_PATTERNS="$(bashio::config 'SCRAPER_BLOCKED_URL_PATTERNS')"
+export SCRAPER_ALLOWED_URL_PATTERNS="$(bashio::config 'SCRAPER_ALLOWED_URL_PATTERNS')"
+export SCRAPER_EXTRACTION_MODE="$(bashio::config 'SCRAPER_EXTRACTION_MODE')"
+export SCRAPER_NEARBY_VINTAGE_RANGE="$(bashio::config 'SCRAPER_NEARBY_VINTAGE_RANGE')"
+export SCRAPER_NEARBY_PROBE_CONCURRENCY="$(bashio::config 'SCRAPER_NEARBY_PROBE_CONCURRENCY')"
 
 exec python3 -m app.main
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""
+First-load cost of the web UI, unbuilt vs the startup asset build (app/assets.py).
+
+Loads the page through the Flask app the way a browser would: index.html, its
+stylesheet and module script, every ES module those import and, unbuilt, each
+HTML component fetched from a data-component attribute. Reports the number of
+same-origin requests and the bytes transferred with and without gzip/brotli,
+then the same for a repeat visit (a fresh tab with a warm HTTP cache).
+
+    python -m tools.bench_assets
+"""
+import os
+import re
+import tempfile
+import time
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from app import assets, compression, config, main as app_main
+
+REFERENCE_RE = re.compile(r'<link rel="stylesheet" href="(?!https?:)([^"]+)"|<script type="module" src="(?!https?:)([^"]+)"')
+IMPORT_RE = re.compile(r"""^import\s[\s\S]*?from\s+['"]([^'"]+)['"]""", re.MULTILINE)
+COMPONENT_RE = re.compile(r'data-component="([^"]+)"')
+
+
+def _load_page(client, accept_encoding: str, cache: dict):
+    """Fetches everything the first paint needs. cache maps url -> (etag, cache-control, body) from earlier loads."""
+    requests_made, transferred = 0, 0
+    pending, seen = ["/"], set()
+    while pending:
+        url = pending.pop(0)
+        if url in seen:
+            continue
+        seen.add(url)
+        etag, cache_control, body = cache.get(url, (None, "", ""))
+        # Immutable files come straight from the browser cache; the rest are revalidated.
+        if "immutable" not in cache_control:
+            headers = {"Accept-Encoding": accept_encoding}
+            if etag:
+                headers["If-None-Match"] = etag
+            response = client.get(url, headers=headers)
+            requests_made += 1
+            transferred += len(response.data)
+            if response.status_code != 304:
+                body = client.get(url).get_data(as_text=True)  # identity copy, to find references
+                cache[url] = (response.headers.get("ETag"), response.headers.get("Cache-Control", ""), body)
+        base = url.rsplit("/", 1)[0]
+        if url == "/":
+            pending += ["/" + (css or js) for css, js in REFERENCE_RE.findall(body)]
+            pending += ["/" + component for attribute in COMPONENT_RE.findall(body) for component in attribute.split()]
+        elif url.endswith(".js"):
+            pending += [os.path.normpath(f"{base}/{specifier}") for specifier in IMPORT_RE.findall(body)]
+    return requests_made, transferred
+
+
+def main():
+    app = app_main.app
+    client = app.test_client()
+    encodings = ["identity", "gzip"] + (["br"] if compression.brotli is not None else [])
+    print(f"\n{'mode':<10}{'visit':<8}{'encoding':<10}{'requests':>9}{'bytes':>10}")
+    for mode in ("unbuilt", "built"):
+        config.ASSET_PIPELINE = mode == "built"
+        if config.ASSET_PIPELINE:
+            started = time.perf_counter()
+            assets.build()
+            build_ms = (time.perf_counter() - started) * 1000
+        for encoding in encodings:
+            cache = {}
+            for visit in ("first", "repeat"):
+                requests_made, transferred = _load_page(client, encoding, cache)
+                print(f"{mode:<10}{visit:<8}{encoding:<10}{requests_made:>9}{transferred:>10,}")
+    print(f"\nbuild time: {build_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
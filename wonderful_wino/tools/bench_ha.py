@@ -0,0 +1,225 @@
+"""
+Home Assistant integration benchmark against the local stand-in (tools/ha_standin.py).
+
+Runs the add-on in-process against a fake HA server (REST + WebSocket) and,
+with --mqtt, a stub MQTT broker. It then drives these flows through the Flask
+routes:
+
+  scan        POST /scan-wine for a new wine (the Vivino scrape is replaced
+              by canned data, so only the database and HA side is measured)
+  rescan      the same wine again (+1 bottle)
+  consume     POST /inventory/wine/consume
+  mqtt-consume  consume via wonderful_wino/cmd/consume (with --mqtt); the
+              response column is the time until the ack is published
+  full-sync   POST /sync-all-wines against an empty HA To-Do list
+  resync      the same again with nothing to change
+
+For each flow it reports the HTTP response time, the end-to-end time (from
+the request until HA received the last call it caused), the number of HA
+calls/MQTT publishes, and the bytes the add-on sent.
+
+    python -m tools.bench_ha [--wines 100] [--runs 5] [--latency 0.02] [--mqtt] [--mqtt-json] [--websocket]
+"""
+import argparse
+import collections
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app import config  # noqa: E402
+from tools.ha_standin import FakeHA, start_ha_server, start_mqtt_broker  # noqa: E402
+
+TODO = "todo.my_wine"
+SETTLE_QUIET_SECONDS = 0.3
+
+
+def _configure(args):
+    ha = FakeHA(token="bench-token", latency=args.latency, fail_rate=args.fail_rate)
+    server = start_ha_server(ha)
+    config.HOME_ASSISTANT_URL = server.url
+    config.HA_LONG_LIVED_TOKEN = ha.token
+    config.TODO_LIST_ENTITY_ID = TODO
+    config.HA_USE_WEBSOCKET = args.websocket
+    config.SENSOR_REFRESH_DEBOUNCE = args.debounce
+    config.SENSOR_HEARTBEAT_MINUTES = 0
+    broker = None
+    if args.mqtt:
+        broker = start_mqtt_broker(ha)
+        config.USE_MQTT_DISCOVERY = True
+        config.MQTT_JSON_STATE = args.mqtt_json
+        config.MQTT_HOST, config.MQTT_PORT = broker.server_address
+    return ha, broker
+
+
+def _busy():
+    from app import commands, db, ha_service, jobs
+    return (db.get_outbox_stats().get("pending")
+            or ha_service._sensor_refresh_scheduled
+            or commands._queue.unfinished_tasks
+            or any(job["status"] == "running" for job in jobs.list_jobs()))
+
+
+def _settle(ha, timeout=120):
+    """Waits until no HA work has been pending and no traffic has arrived for SETTLE_QUIET_SECONDS."""
+    deadline = time.monotonic() + timeout
+    idle_since = None
+    while time.monotonic() < deadline:
+        now = time.monotonic()
+        if _busy():
+            idle_since = None
+        elif idle_since is None:
+            idle_since = now
+        last = ha.traffic[-1]["at"] if ha.traffic else 0
+        if idle_since is not None and now - max(idle_since, last) >= SETTLE_QUIET_SECONDS:
+            return
+        time.sleep(0.02)
+    print("  (timed out waiting for HA work to settle)")
+
+
+def _measure(ha, action):
+    """Runs action() -> response seconds, waits for HA to settle and returns the sample."""
+    _settle(ha)
+    started = len(ha.traffic)
+    t0 = time.monotonic()
+    response_s = action(t0)
+    _settle(ha)
+    traffic = [t for t in ha.traffic[started:] if t["endpoint"] != "mqtt PINGREQ"]
+    end = max([t["at"] for t in traffic], default=t0 + response_s)
+    return {
+        "response_ms": response_s * 1000,
+        "e2e_ms": (end - t0) * 1000,
+        "calls": len(traffic),
+        "bytes": sum(t["bytes_sent"] for t in traffic),
+        "endpoints": collections.Counter(t["endpoint"] for t in traffic),
+    }
+
+
+def _canned_scrape(url):
+    wine_id = url.rsplit("/", 1)[-1]
+    return {
+        "name": f"Bench Wine {wine_id}", "vintage": 2019, "varietal": "Cabernet Sauvignon",
+        "region": "Napa Valley", "country": "United States", "wine_type": "Red",
+        "vivino_rating": 4.1, "image_url": None, "alcohol_percent": 14.5,
+    }, url
+
+
+def _wait_for_message(broker, topic, since, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for at, message_topic, _payload, _retain in reversed(broker.messages):
+            if at < since:
+                break
+            if message_topic == topic:
+                return at
+        time.sleep(0.001)
+    raise TimeoutError(f"No message on {topic}")
+
+
+def _wait_for_job(client, job_id, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/jobs/{job_id}").get_json()
+        if job["status"] != "running":
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(f"Job {job_id} did not finish")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wines", type=int, default=100, help="cellar size for the full-sync flows")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the fake HA spends per call")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of HA calls that fail with 503")
+    parser.add_argument("--debounce", type=float, default=config.SENSOR_REFRESH_DEBOUNCE)
+    parser.add_argument("--mqtt", action="store_true", help="publish sensors via the stub MQTT broker")
+    parser.add_argument("--mqtt-json", action="store_true", help="with --mqtt, use the single JSON state topic")
+    parser.add_argument("--websocket", action="store_true", help="send service calls over the HA WebSocket API")
+    args = parser.parse_args()
+
+    ha, broker = _configure(args)
+
+    from app import commands, db, ha_service, ha_ws, main as app_main, outbox, scraper
+    scraper.scrape_vivino_url = _canned_scrape
+    db.init_db()
+    outbox.start()
+    if args.websocket:
+        ws_client = ha_ws.start()
+        if not ws_client or not ws_client.wait_connected(5):
+            print("WebSocket did not connect; falling back to REST.")
+    if args.mqtt:
+        commands.register()
+        ha_service.initialize_mqtt()
+        for _ in range(100):
+            if ha_service.is_mqtt_connected:
+                break
+            time.sleep(0.05)
+    else:
+        ha_service.trigger_sensor_update()
+    client = app_main.app.test_client()
+    _settle(ha)
+
+    samples = collections.defaultdict(list)
+    counter = iter(range(10 ** 6))
+
+    def scan(_t0, url=None):
+        started = time.monotonic()
+        client.post("/scan-wine", json={"vivino_url": url or f"https://www.vivino.com/w/{next(counter)}", "quantity": 2})
+        return time.monotonic() - started
+
+    def consume(_t0):
+        started = time.monotonic()
+        client.post("/inventory/wine/consume", json={"vivino_url": "https://www.vivino.com/w/rescan"})
+        return time.monotonic() - started
+
+    def mqtt_consume(t0):
+        broker.publish("wonderful_wino/cmd/consume", '{"vivino_url": "https://www.vivino.com/w/rescan"}')
+        return _wait_for_message(broker, "wonderful_wino/response/consume", t0) - t0
+
+    def full_sync(_t0):
+        started = time.monotonic()
+        job_id = client.post("/sync-all-wines").get_json()["job_id"]
+        elapsed = time.monotonic() - started
+        _wait_for_job(client, job_id)
+        return elapsed
+
+    for _ in range(args.runs):
+        samples["scan"].append(_measure(ha, scan))
+    scan(None, "https://www.vivino.com/w/rescan")
+    for _ in range(args.runs):
+        samples["rescan"].append(_measure(ha, lambda t0: scan(t0, "https://www.vivino.com/w/rescan")))
+    for _ in range(args.runs):
+        samples["consume"].append(_measure(ha, consume))
+    if args.mqtt:
+        for _ in range(args.runs):
+            samples["mqtt-consume"].append(_measure(ha, mqtt_consume))
+
+    for i in range(args.wines):
+        db.add_or_update_wine(_canned_scrape(f"https://www.vivino.com/w/cellar{i}")[0] | {"vivino_url": f"https://www.vivino.com/w/cellar{i}"}, 1, 1)
+    db.clear_ha_outbox()
+    with ha.lock:
+        ha.todo_lists[TODO] = []
+    samples["full-sync"].append(_measure(ha, full_sync))
+    samples["resync"].append(_measure(ha, full_sync))
+
+    transport = ("WebSocket" if ha_ws.get_connection() else "REST") + (" + MQTT" + (" JSON" if args.mqtt_json else "") if args.mqtt else "")
+    print(f"\nHA latency {args.latency * 1000:.0f} ms, fail rate {args.fail_rate:.0%}, debounce {args.debounce}s, {transport}")
+    print(f"{'flow':<14}{'runs':>5}{'resp ms':>10}{'e2e ms':>10}{'calls':>8}{'KB sent':>10}")
+    for flow, runs in samples.items():
+        print(f"{flow:<14}{len(runs):>5}"
+              f"{statistics.median(r['response_ms'] for r in runs):>10.1f}"
+              f"{statistics.median(r['e2e_ms'] for r in runs):>10.1f}"
+              f"{statistics.mean(r['calls'] for r in runs):>8.1f}"
+              f"{statistics.mean(r['bytes'] for r in runs) / 1024:>10.1f}")
+    print("\nCalls per flow (last run):")
+    for flow, runs in samples.items():
+        breakdown = ", ".join(f"{endpoint} x{count}" for endpoint, count in runs[-1]["endpoints"].most_common())
+        print(f"  {flow}: {breakdown or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
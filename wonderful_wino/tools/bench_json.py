@@ -0,0 +1,125 @@
+"""
+Payload size and serialization benchmark for GET /inventory.
+
+Seeds a temporary database with a synthetic cellar (--wines, default 5000)
+with realistic tasting notes, image URLs and regions, then reports:
+
+  encode      time to serialize the inventory with Flask's default JSON
+              provider and with orjson (if installed)
+  compress    response bytes and compression time for identity, gzip and
+              brotli (if installed)
+  request     full GET /inventory through the Flask app for each
+              encoder/encoding combination, plus the 304 revalidation
+
+    python -m tools.bench_json [--wines 5000] [--runs 10]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import compression, db, formatting, main as app_main
+
+COUNTRIES = {"France": ["Bordeaux", "Burgundy", "Rhône", "Loire"], "Italy": ["Piedmont", "Tuscany", "Veneto"],
+             "Spain": ["Rioja", "Priorat"], "United States": ["Napa Valley", "Sonoma", "Willamette Valley"],
+             "Australia": ["Barossa Valley", "McLaren Vale"]}
+VARIETALS = ["Cabernet Sauvignon", "Merlot", "Pinot Noir", "Syrah", "Nebbiolo", "Sangiovese", "Tempranillo",
+             "Chardonnay", "Sauvignon Blanc", "Riesling"]
+NOTE_WORDS = ("dark cherry plum blackcurrant cedar tobacco leather vanilla oak spice pepper violet earth "
+              "mineral citrus peach apricot honey butter toast firm tannins long finish bright acidity").split()
+
+
+def _seed(count: int):
+    rng = random.Random(42)
+    rows = []
+    for i in range(count):
+        country = rng.choice(list(COUNTRIES))
+        region = rng.choice(COUNTRIES[country])
+        notes = " ".join(rng.choice(NOTE_WORDS) for _ in range(rng.randint(0, 60))) or None
+        rows.append((f"https://www.vivino.com/wines/{1000000 + i}?year={2000 + i % 22}",
+                     f"Domaine {rng.randint(1, 900)} {rng.choice(VARIETALS)} Reserve", 2000 + i % 22,
+                     rng.choice(VARIETALS), region, country, f"{region}, {country}",
+                     round(rng.uniform(3.2, 4.6), 1),
+                     f"https://images.vivino.com/thumbs/{rng.getrandbits(64):016x}_pb_x600.png",
+                     rng.randint(1, 6), rng.randint(1, 4), rng.choice([None, 3.5, 4.0, 4.5]), notes,
+                     round(rng.uniform(11.5, 15.5), 1), rng.choice(["Red", "White", "Rosé", "Sparkling"])))
+    db.init_db()
+    conn = db.get_db_connection()
+    try:
+        conn.executemany("""
+            INSERT INTO wines (vivino_url, name, vintage, varietal, region, country, region_full, vivino_rating,
+                               image_url, quantity, cost_tier, personal_rating, tasting_notes, alcohol_percent, wine_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _timed(func, runs: int):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wines", type=int, default=5000, help="cellar size")
+    parser.add_argument("--runs", type=int, default=10, help="repetitions per measurement (median is reported)")
+    args = parser.parse_args()
+
+    _seed(args.wines)
+    app = app_main.app
+    wines = db.get_all_wines()
+    for wine in wines:
+        wine["b4b_score"] = formatting.calculate_b4b_score(wine)
+
+    providers = [("json", DefaultJSONProvider(app))]
+    if compression.orjson is not None:
+        providers.append(("orjson", compression.OrjsonProvider(app)))
+    encodings = ["identity", "gzip"] + (["br"] if compression.brotli is not None else [])
+
+    print(f"\n{len(wines)} wines, median of {args.runs} runs")
+    print(f"\n{'encoder':<10}{'encode ms':>11}{'bytes':>11}")
+    body = None
+    for name, provider in providers:
+        with app.app_context():
+            ms, response = _timed(lambda: provider.response(wines), args.runs)
+        body = body or response.get_data()
+        print(f"{name:<10}{ms:>11.1f}{len(response.get_data()):>11,}")
+
+    print(f"\n{'encoding':<10}{'compress ms':>13}{'bytes':>11}{'ratio':>8}")
+    for encoding in encodings:
+        if encoding == "identity":
+            ms, data = 0.0, body
+        else:
+            ms, data = _timed(lambda: compression.compress(body, encoding), args.runs)
+        print(f"{encoding:<10}{ms:>13.1f}{len(data):>11,}{len(body) / len(data):>7.1f}x")
+
+    print(f"\n{'GET /inventory':<24}{'ms':>9}{'bytes':>11}")
+    client = app.test_client()
+    original_provider = app.json
+    try:
+        for name, provider in providers:
+            app.json = provider
+            for encoding in encodings:
+                ms, response = _timed(lambda: client.get("/inventory", headers={"Accept-Encoding": encoding}), args.runs)
+                print(f"{name + ' + ' + encoding:<24}{ms:>9.1f}{len(response.data):>11,}")
+        etag = client.get("/inventory").headers["ETag"]
+        ms, response = _timed(lambda: client.get("/inventory", headers={"If-None-Match": etag}), args.runs)
+        print(f"{'304 revalidation':<24}{ms:>9.1f}{len(response.data):>11,}")
+    finally:
+        app.json = original_provider
+
+
+if __name__ == "__main__":
+    main()
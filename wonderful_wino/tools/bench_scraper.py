@@ -0,0 +1,61 @@
+"""
+Scraper page-load benchmark: resource blocking on vs. off.
+
+Loads each Vivino URL through the scraper's headless Chrome session with the
+default block list and again with blocking disabled, then reports wall time,
+DOMContentLoaded, request count and transferred bytes (cross-origin responses
+without Timing-Allow-Origin report 0 bytes, so treat bytes as a lower bound).
+
+Needs Chrome + chromedriver and network access. Run from the add-on directory:
+
+    python -m tools.bench_scraper https://www.vivino.com/US/en/<wine>/w/<id>?year=2019 [--runs 3]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app import config, scraper  # noqa: E402
+
+
+def _run(url, block, runs):
+    config.SCRAPER_BLOCK_RESOURCES = block
+    samples = []
+    for _ in range(runs):
+        page, _final_url = scraper._fetch_page_selenium(url)
+        if page is None:
+            print(f"  load failed (block={block})")
+            continue
+        samples.append(dict(page['metrics'], html_bytes=len(page['html'] or '')))
+    return samples
+
+
+def _summary(samples, key):
+    values = [s.get(key, 0) for s in samples]
+    return statistics.median(values) if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("urls", nargs="+")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'wall ms':>10}{'DCL ms':>10}{'requests':>10}{'KB xfer':>10}{'KB html':>10}")
+    for url in args.urls:
+        print(url)
+        for block in (False, True):
+            samples = _run(url, block, args.runs)
+            print(f"{'blocked' if block else 'full':<10}"
+                  f"{_summary(samples, 'wall_ms'):>10.0f}"
+                  f"{_summary(samples, 'dom_content_loaded_ms'):>10.0f}"
+                  f"{_summary(samples, 'requests'):>10.0f}"
+                  f"{_summary(samples, 'transfer_bytes') / 1024:>10.1f}"
+                  f"{_summary(samples, 'html_bytes') / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Load test comparing Flask's development server with the waitress production server.
+
+Each server runs the add-on in a subprocess against the HA stand-in
+(tools/ha_standin.py), with a seeded cellar. The Vivino scrape is replaced by a
+canned result that takes --scan-delay seconds, to stand in for a slow headless
+Chrome scrape. While --slow clients keep posting /scan-wine, --clients clients
+read GET /inventory over keep-alive connections. The report shows read
+throughput and latency percentiles, the scans completed, and how long the
+server took to exit after SIGTERM.
+
+    python -m tools.bench_server [--servers flask,waitress] [--clients 16] [--slow 4] [--duration 10]
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+
+def _serve(args):
+    """Child process: seeds a cellar and serves the app with the configured WEB_SERVER."""
+    from app import config
+    from tools.ha_standin import FakeHA, start_ha_server
+    ha = FakeHA(token="bench-token")
+    ha_server = start_ha_server(ha)
+    config.HOME_ASSISTANT_URL = ha_server.url
+    config.HA_LONG_LIVED_TOKEN = ha.token
+    config.TODO_LIST_ENTITY_ID = "todo.my_wine"
+    config.SENSOR_HEARTBEAT_MINUTES = 0
+
+    from app import db, events, main as app_main, outbox, scraper, server
+
+    def slow_scrape(url):
+        time.sleep(args.scan_delay)
+        return {"name": f"Bench Wine {url.rsplit('/', 1)[-1]}", "vintage": 2019, "varietal": "Merlot",
+                "region": "Bordeaux", "country": "France", "wine_type": "Red", "vivino_rating": 4.0,
+                "image_url": None, "alcohol_percent": 13.5}, url
+
+    scraper.scrape_vivino_url = slow_scrape
+    db.init_db()
+    for i in range(args.wines):
+        db.add_or_update_wine({"name": f"Cellar Wine {i}", "vintage": 2000 + i % 20, "varietal": "Syrah",
+                               "region": "Rhône", "country": "France", "wine_type": "Red", "vivino_rating": 4.2,
+                               "vivino_url": f"https://www.vivino.com/w/cellar{i}"}, 1 + i % 3, 2)
+    db.clear_ha_outbox()
+    outbox.start()
+    server.serve(app_main.app, host="127.0.0.1", port=args.port, on_stop=events.shutdown)
+
+
+def _start_server(name, args, port):
+    env = dict(os.environ, WEB_SERVER=name, WEB_THREADS=str(args.threads), LOG_LEVEL="ERROR",
+               DB_PATH=os.path.join(tempfile.mkdtemp(), "bench.db"))
+    command = [sys.executable, "-m", "tools.bench_server", "--serve", "--port", str(port),
+               "--wines", str(args.wines), "--scan-delay", str(args.scan_delay)]
+    output = None if args.verbose else subprocess.DEVNULL
+    process = subprocess.Popen(command, env=env, stdout=output, stderr=output)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base}/health", timeout=1).status_code == 200:
+                return process, base
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{name} server did not start")
+
+
+def _run_load(base, args):
+    stop = threading.Event()
+    latencies, errors, scans = [], [0], [0]
+    lock = threading.Lock()
+
+    def reader():
+        session = requests.Session()
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                ok = session.get(f"{base}/inventory", timeout=30).status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            elapsed = time.monotonic() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    def scanner(index):
+        session = requests.Session()
+        counter = 0
+        while not stop.is_set():
+            counter += 1
+            try:
+                response = session.post(f"{base}/scan-wine", json={
+                    "vivino_url": f"https://www.vivino.com/w/scan{index}-{counter}", "quantity": 1}, timeout=60)
+                if response.status_code < 300:
+                    with lock:
+                        scans[0] += 1
+            except requests.exceptions.RequestException:
+                pass
+
+    threads = [threading.Thread(target=reader, daemon=True) for _ in range(args.clients)]
+    threads += [threading.Thread(target=scanner, args=(i,), daemon=True) for i in range(args.slow)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=args.scan_delay + 30)
+    return latencies, errors[0], scans[0]
+
+
+def _stop_server(process):
+    started = time.monotonic()
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    return time.monotonic() - started, process.returncode
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", default="flask,waitress", help="comma-separated: flask, waitress")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent GET /inventory clients")
+    parser.add_argument("--slow", type=int, default=4, help="concurrent clients posting slow scans")
+    parser.add_argument("--scan-delay", type=float, default=3.0, help="seconds each fake scrape takes")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per server")
+    parser.add_argument("--wines", type=int, default=200, help="cellar size")
+    parser.add_argument("--threads", type=int, default=8, help="WEB_THREADS for waitress")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--verbose", action="store_true", help="show the server's output")
+    args = parser.parse_args()
+
+    if args.serve:
+        _serve(args)
+        return
+
+    results = []
+    for offset, name in enumerate(s.strip() for s in args.servers.split(",") if s.strip()):
+        process, base = _start_server(name, args, args.port + offset)
+        try:
+            latencies, errors, scans = _run_load(base, args)
+        finally:
+            shutdown_s, returncode = _stop_server(process)
+        results.append((name, latencies, errors, scans, shutdown_s, returncode))
+
+    print(f"\n{args.clients} readers + {args.slow} slow scanners ({args.scan_delay}s each), "
+          f"{args.duration:.0f}s per server, {args.wines} wines, waitress threads {args.threads}")
+    print(f"{'server':<10}{'reads/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'errors':>8}{'scans':>7}{'stop s':>8}{'exit':>6}")
+    for name, latencies, errors, scans, shutdown_s, returncode in results:
+        if latencies:
+            ms = [value * 1000 for value in latencies]
+            print(f"{name:<10}{len(latencies) / args.duration:>9.1f}{statistics.median(ms):>9.1f}"
+                  f"{_percentile(ms, 0.95):>9.1f}{_percentile(ms, 0.99):>9.1f}{max(ms):>9.1f}"
+                  f"{errors:>8}{scans:>7}{shutdown_s:>8.2f}{returncode:>6}")
+        else:
+            print(f"{name:<10}{'no successful reads':>45}{errors:>8}{scans:>7}{shutdown_s:>8.2f}{returncode:>6}")
+
+
+if __name__ == "__main__":
+    main()
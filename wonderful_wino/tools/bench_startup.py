@@ -0,0 +1,99 @@
+"""
+Startup benchmark: time from process start to the first 200 on /health.
+
+Starts the add-on the way run.sh does (python -m app.main) against the HA
+stand-in (tools/ha_standin.py), with --latency seconds added to every HA call,
+and polls GET /health. It also reports when the first sensor state reached HA,
+to show that the initial sensor sync still happens. Each run uses a fresh
+database; the reference data cache is left in place between runs, so run 1 is
+a cold start and the rest are warm.
+
+    python -m tools.bench_startup [--runs 5] [--latency 0.05] [--mqtt]
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from tools.ha_standin import FakeHA, start_ha_server, start_mqtt_broker
+
+
+def _first_sensor_state(ha, started):
+    with ha.lock:
+        times = [entry["at"] for entry in ha.traffic
+                 if "/api/states/" in entry["endpoint"] or (entry["endpoint"].startswith("mqtt PUBLISH") and entry["endpoint"].endswith("/state"))]
+    return (min(times) - started) if times else None
+
+
+def _run_once(args, ha, ha_url, broker_port, data_dir):
+    env = dict(os.environ, HOME_ASSISTANT_URL=ha_url, HA_LONG_LIVED_TOKEN=ha.token, TODO_LIST_ENTITY_ID="todo.my_wine",
+               DB_PATH=os.path.join(tempfile.mkdtemp(dir=data_dir), "wine_inventory.db"),
+               REFERENCE_CACHE_DIR=os.path.join(data_dir, "reference_cache"),
+               WEB_PORT=str(args.port), LOG_LEVEL="WARNING", SENSOR_HEARTBEAT_MINUTES="0")
+    if broker_port:
+        env.update(USE_MQTT_DISCOVERY="true", MQTT_HOST="127.0.0.1", MQTT_PORT=str(broker_port))
+    ha.reset_traffic()
+    output = None if args.verbose else subprocess.DEVNULL
+    started = time.monotonic()
+    process = subprocess.Popen([sys.executable, "-m", "app.main"], env=env, stdout=output, stderr=output)
+    health_s = None
+    try:
+        deadline = started + 60
+        while time.monotonic() < deadline and process.poll() is None:
+            try:
+                if requests.get(f"http://127.0.0.1:{args.port}/health", timeout=1).status_code == 200:
+                    health_s = time.monotonic() - started
+                    break
+            except requests.exceptions.RequestException:
+                time.sleep(0.005)
+        # Give the background initialization time to publish the sensors.
+        sensor_deadline = time.monotonic() + 10
+        while _first_sensor_state(ha, started) is None and time.monotonic() < sensor_deadline:
+            time.sleep(0.01)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    return health_s, _first_sensor_state(ha, started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every HA call")
+    parser.add_argument("--mqtt", action="store_true", help="publish sensors via the stub MQTT broker instead of REST")
+    parser.add_argument("--port", type=int, default=5098)
+    parser.add_argument("--verbose", action="store_true", help="show the add-on's output")
+    args = parser.parse_args()
+
+    ha = FakeHA(token="bench-token", latency=args.latency)
+    ha_server = start_ha_server(ha)
+    # The add-on is stopped mid keep-alive on purpose; don't print the resulting resets.
+    ha_server.handle_error = lambda request, client_address: None
+    broker_port = start_mqtt_broker(ha).server_address[1] if args.mqtt else None
+    data_dir = tempfile.mkdtemp()
+
+    print(f"\n{'run':<6}{'first /health 200 s':>21}{'first sensor state s':>22}")
+    results = []
+    for run in range(1, args.runs + 1):
+        health_s, sensor_s = _run_once(args, ha, ha_server.url, broker_port, data_dir)
+        results.append(health_s)
+        print(f"{run:<6}{health_s if health_s is not None else float('nan'):>21.3f}"
+              f"{sensor_s if sensor_s is not None else float('nan'):>22.3f}")
+    ok = [value for value in results if value is not None]
+    if ok:
+        print(f"\nmedian time to first /health 200: {statistics.median(ok):.3f} s "
+              f"({'MQTT' if args.mqtt else 'REST'} sensors, HA latency {args.latency * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Exercises the HA WebSocket client (app/ha_ws.py) and its use by ha_client /
+ha_service against the local stand-in in tools/ha_standin.py.
+
+Checks authentication, service calls with response data, event firing,
+pipelined concurrent calls, error mapping and automatic reconnection.
+
+    python -m tools.check_ha_ws
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "check.db"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app import config, db, ha_client, ha_service, ha_ws  # noqa: E402
+from tools.ha_standin import FakeHA, start_ha_server  # noqa: E402
+
+TODO = "todo.my_wine"
+failures = []
+
+
+def check(name, condition, detail=""):
+    print(f"{'PASS' if condition else 'FAIL'}  {name}{'  ' + str(detail) if detail and not condition else ''}")
+    if not condition:
+        failures.append(name)
+
+
+def main():
+    db.init_db()
+    ha = FakeHA(token="secret", latency=0.01)
+    server = start_ha_server(ha)
+    config.HOME_ASSISTANT_URL = server.url
+    config.HA_LONG_LIVED_TOKEN = "secret"
+    config.TODO_LIST_ENTITY_ID = TODO
+    config.HA_USE_WEBSOCKET = True
+
+    client = ha_ws.start()
+    check("connects and authenticates", client is not None and client.wait_connected(5))
+
+    wine = {"vivino_url": "manual:a:2020", "name": "Test Wine", "vintage": 2020, "quantity": 2}
+    check("sync_wine_to_todo over WebSocket", ha_service.sync_wine_to_todo(wine, 2))
+    items = ha_service.get_ha_todo_items()
+    check("get_items returns response data", items and items[0]["summary"] == "Test Wine (2020)", items)
+    check("REST not used for service calls", all(k.startswith("WS ") for k in ha_client.get_stats()), ha_client.get_stats())
+
+    check("fire_consumption_event", ha_service.fire_consumption_event(wine) and ha.events)
+
+    missing = ha_client.get_client().post("/api/services/todo/update_item", {"entity_id": TODO, "item": "nope"})
+    check("HA errors map to 4xx", missing.status_code == 400, missing.status_code)
+
+    ha.calls.clear()
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        results = list(pool.map(lambda i: client.call_service("todo", "add_item", {"entity_id": TODO, "item": f"W{i}"}), range(100)))
+    elapsed = time.monotonic() - started
+    # 100 calls x 10 ms server latency would take >= 1 s if they were serialized.
+    check("pipelined calls overlap", len(results) == 100 and elapsed < 0.8, f"{elapsed:.2f}s")
+
+    server.drop_connections()
+    time.sleep(0.2)
+    check("reconnects after the socket drops", client.wait_connected(5) and client.stats["connects"] >= 2, client.stats)
+    check("calls work after reconnect", client.ping() is None)
+
+    ha_ws.stop()
+    print(f"\n{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
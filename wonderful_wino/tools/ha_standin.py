@@ -0,0 +1,598 @@
+"""
+Local stand-in for Home Assistant and its MQTT broker, for exercising the
+add-on's HA integration without a real HA instance.
+
+The HA server speaks both the REST API and the WebSocket API on one port:
+  - POST /api/services/todo/{get_items,add_item,remove_item,update_item}
+    (with ?return_response for get_items), backed by an in-memory To-Do list
+  - POST/GET/DELETE /api/states/<entity_id>, POST /api/events/<event_type>
+  - GET /api/websocket: auth handshake, call_service, fire_event, ping
+Latency and failures can be injected (FakeHA.latency, fail_rate, fail_next).
+Every request is logged with the bytes sent and received, so benchmarks can
+count what each flow costs.
+
+The MQTT broker is a minimal MQTT 3.1.1 server (QoS 0/1, retained messages,
++/# wildcards) that is enough for paho-mqtt and logs every client packet.
+
+Only the Python standard library is used.
+
+    python -m tools.ha_standin --port 8123 --mqtt-port 1883 --token secret
+
+Then point the add-on at it with HOME_ASSISTANT_URL=http://127.0.0.1:8123,
+HA_LONG_LIVED_TOKEN=secret and, for MQTT, MQTT_HOST=127.0.0.1.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import socketserver
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+WS_MAGIC = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class InjectedFailure(Exception):
+    def __init__(self, status):
+        super().__init__(f"Injected failure ({status})")
+        self.status = status
+
+
+class FakeHA:
+    """In-memory HA state shared by the stand-in servers: To-Do lists, states, fired events and a traffic log."""
+
+    def __init__(self, token="standin-token", latency=0.0, fail_rate=0.0, fail_status=503):
+        self.token = token
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.fail_next = 0
+        self.lock = threading.Lock()
+        self.todo_lists = {}
+        self.states = {}
+        self.events = []
+        self.calls = []
+        self.traffic = []
+
+    def record(self, transport, endpoint, bytes_sent, bytes_received):
+        """Logs one request; bytes are from the add-on's point of view."""
+        with self.lock:
+            self.traffic.append({"at": time.monotonic(), "transport": transport, "endpoint": endpoint,
+                                 "bytes_sent": bytes_sent, "bytes_received": bytes_received})
+
+    def reset_traffic(self):
+        with self.lock:
+            self.traffic = []
+            self.calls = []
+
+    def _maybe_fail(self):
+        with self.lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                raise InjectedFailure(self.fail_status)
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise InjectedFailure(self.fail_status)
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def todo_items(self, entity_id):
+        with self.lock:
+            return [dict(item) for item in self.todo_lists.get(entity_id, [])]
+
+    def _find(self, items, ref):
+        for item in items:
+            if ref in (item["uid"], item["summary"]):
+                return item
+        return None
+
+    def call_service(self, domain, service, data):
+        """Applies a service call. Returns the service response, or raises ValueError (HA's 'not found')."""
+        self._delay()
+        self._maybe_fail()
+        with self.lock:
+            self.calls.append(f"{domain}.{service}")
+            if domain != "todo":
+                return None
+            entity_id = data.get("entity_id")
+            if isinstance(entity_id, list):
+                entity_id = entity_id[0]
+            items = self.todo_lists.setdefault(entity_id, [])
+            if service == "get_items":
+                return {entity_id: {"items": [dict(item) for item in items]}}
+            if service == "add_item":
+                items.append({"summary": data["item"], "uid": uuid.uuid4().hex,
+                              "status": "needs_action", "description": data.get("description")})
+                return None
+            refs = data["item"] if isinstance(data.get("item"), list) else [data.get("item")]
+            if service == "remove_item":
+                found = [self._find(items, ref) for ref in refs]
+                if not all(found):
+                    raise ValueError("Unable to find to-do list item")
+                for item in found:
+                    items.remove(item)
+                return None
+            if service == "update_item":
+                item = self._find(items, refs[0])
+                if not item:
+                    raise ValueError("Unable to find to-do list item")
+                if "rename" in data:
+                    item["summary"] = data["rename"]
+                for key in ("description", "status"):
+                    if key in data:
+                        item[key] = data[key]
+                return None
+            return None
+
+    def fire_event(self, event_type, event_data):
+        self._delay()
+        self._maybe_fail()
+        with self.lock:
+            self.calls.append(f"event.{event_type}")
+            self.events.append({"event_type": event_type, "data": event_data})
+
+    def set_state(self, entity_id, state, attributes):
+        """Stores a state like POST /api/states. Returns (state_object, created)."""
+        self._delay()
+        self._maybe_fail()
+        with self.lock:
+            self.calls.append(f"state.{entity_id}")
+            created = entity_id not in self.states
+            self.states[entity_id] = {"entity_id": entity_id, "state": str(state), "attributes": attributes or {},
+                                      "last_updated": time.time()}
+            return dict(self.states[entity_id]), created
+
+
+def _recv_exact(sock, count):
+    data = b""
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            raise ConnectionError("socket closed")
+        data += chunk
+    return data
+
+
+# --- Minimal RFC 6455 server side ---
+
+def _read_exact(rfile, count):
+    data = rfile.read(count)
+    if len(data) < count:
+        raise ConnectionError("socket closed")
+    return data
+
+
+def _read_frame(rfile):
+    """Returns (opcode, payload) for one client frame (client frames are always masked)."""
+    first, second = _read_exact(rfile, 2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", _read_exact(rfile, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", _read_exact(rfile, 8))[0]
+    mask = _read_exact(rfile, 4) if second & 0x80 else b"\0\0\0\0"
+    payload = bytearray(_read_exact(rfile, length))
+    for i in range(length):
+        payload[i] ^= mask[i % 4]
+    return opcode, bytes(payload)
+
+
+def _send_frame(sock, payload, opcode=0x1):
+    header = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 65536:
+        header += bytes([126]) + struct.pack("!H", len(payload))
+    else:
+        header += bytes([127]) + struct.pack("!Q", len(payload))
+    sock.sendall(header + payload)
+
+
+class _WebSocketSession:
+    """Speaks just enough of the HA WebSocket API for ha_ws.HAWebSocketClient."""
+
+    def __init__(self, sock, rfile, ha):
+        self.sock = sock
+        self.rfile = rfile
+        self.ha = ha
+        self.send_lock = threading.Lock()
+
+    def _send(self, message):
+        data = json.dumps(message).encode()
+        with self.send_lock:
+            _send_frame(self.sock, data)
+        return len(data)
+
+    def _receive(self):
+        while True:
+            opcode, payload = _read_frame(self.rfile)
+            if opcode == 0x8:
+                raise ConnectionError("client closed")
+            if opcode == 0x9:
+                with self.send_lock:
+                    _send_frame(self.sock, payload, opcode=0xA)
+                continue
+            if opcode == 0x1:
+                return payload
+
+    def _error(self, message_id, code, text):
+        return self._send({"id": message_id, "type": "result", "success": False, "error": {"code": code, "message": text}})
+
+    def _handle_command(self, raw):
+        message = json.loads(raw)
+        message_id = message.get("id")
+        kind = message.get("type")
+        endpoint = f"ws {kind}"
+        try:
+            if kind == "ping":
+                sent = self._send({"id": message_id, "type": "pong"})
+            elif kind == "call_service":
+                endpoint = f"ws call_service {message['domain']}.{message['service']}"
+                response = self.ha.call_service(message["domain"], message["service"], message.get("service_data") or {})
+                result = {"context": {"id": uuid.uuid4().hex}}
+                if message.get("return_response"):
+                    result["response"] = response
+                sent = self._send({"id": message_id, "type": "result", "success": True, "result": result})
+            elif kind == "fire_event":
+                endpoint = f"ws fire_event {message['event_type']}"
+                self.ha.fire_event(message["event_type"], message.get("event_data") or {})
+                sent = self._send({"id": message_id, "type": "result", "success": True, "result": {"context": {}}})
+            else:
+                sent = self._error(message_id, "unknown_command", "Unknown command.")
+        except ValueError as e:
+            sent = self._error(message_id, "service_validation_error", str(e))
+        except InjectedFailure as e:
+            sent = self._error(message_id, "home_assistant_error", str(e))
+        except OSError:
+            return
+        self.ha.record("ws", endpoint, len(raw), sent)
+
+    def run(self):
+        self._send({"type": "auth_required", "ha_version": "standin"})
+        auth = json.loads(self._receive())
+        if auth.get("access_token") != self.ha.token:
+            self._send({"type": "auth_invalid", "message": "Invalid access token"})
+            return
+        self._send({"type": "auth_ok", "ha_version": "standin"})
+        while True:
+            raw = self._receive()
+            # Handle each command on its own thread so pipelined requests overlap like in HA.
+            threading.Thread(target=self._handle_command, args=(raw,), daemon=True).start()
+
+
+# --- REST API (and WebSocket upgrade) ---
+
+class HAHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connections.append(self.connection)
+
+    def finish(self):
+        try:
+            super().finish()
+        except OSError:
+            pass
+        if self.connection in self.server.connections:
+            self.server.connections.remove(self.connection)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        return len(data)
+
+    def _upgrade_websocket(self):
+        accept = base64.b64encode(hashlib.sha1((self.headers["Sec-WebSocket-Key"] + WS_MAGIC).encode()).digest()).decode()
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        try:
+            _WebSocketSession(self.connection, self.rfile, self.server.ha).run()
+        except (ConnectionError, OSError, ValueError):
+            pass
+
+    def _route(self, method, path, query, body):
+        ha = self.server.ha
+        parts = path.strip("/").split("/")
+        if method == "GET" and parts == ["api"]:
+            return 200, {"message": "API running."}
+        if method == "POST" and len(parts) == 4 and parts[:2] == ["api", "services"]:
+            try:
+                response = ha.call_service(parts[2], parts[3], body or {})
+            except ValueError as e:
+                return 400, {"message": str(e)}
+            if "return_response" in query:
+                return 200, {"changed_states": [], "service_response": response}
+            return 200, []
+        if len(parts) == 3 and parts[:2] == ["api", "states"]:
+            if method == "GET":
+                state = ha.states.get(parts[2])
+                return (200, state) if state else (404, {"message": "Entity not found."})
+            if method == "POST":
+                state, created = ha.set_state(parts[2], (body or {}).get("state"), (body or {}).get("attributes"))
+                return (201 if created else 200), state
+            if method == "DELETE":
+                with ha.lock:
+                    ha.calls.append(f"delete_state.{parts[2]}")
+                    removed = ha.states.pop(parts[2], None)
+                return (200, {"message": "Entity removed."}) if removed else (404, {"message": "Entity not found."})
+        if method == "POST" and len(parts) == 3 and parts[:2] == ["api", "events"]:
+            ha.fire_event(parts[2], body or {})
+            return 200, {"message": f"Event {parts[2]} fired."}
+        return 404, {"message": "Not found"}
+
+    def _handle(self, method):
+        ha = self.server.ha
+        parsed = urlparse(self.path)
+        if method == "GET" and parsed.path == "/api/websocket" and self.headers.get("Upgrade", "").lower() == "websocket":
+            self._upgrade_websocket()
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        bytes_sent = len(self.requestline) + 2 + len(str(self.headers)) + len(raw)
+        endpoint = f"{method} {parsed.path}"
+        if self.headers.get("Authorization") != f"Bearer {ha.token}":
+            received = self._reply(401, {"message": "Unauthorized"})
+        else:
+            try:
+                status, body = self._route(method, parsed.path, parsed.query, json.loads(raw) if raw else None)
+            except InjectedFailure as e:
+                status, body = e.status, {"message": str(e)}
+            received = self._reply(status, body)
+        ha.record("http", endpoint, bytes_sent, received)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class HAServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, ha):
+        super().__init__(address, HAHandler)
+        self.ha = ha
+        self.connections = []
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def drop_connections(self):
+        """Closes every client socket (HTTP keep-alive and WebSocket), e.g. to test reconnects."""
+        for connection in list(self.connections):
+            try:
+                connection.shutdown(2)
+                connection.close()
+            except OSError:
+                pass
+
+
+def start_ha_server(ha, host="127.0.0.1", port=0):
+    """Starts the REST + WebSocket stand-in on a background thread and returns the server."""
+    server = HAServer((host, port), ha)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- Minimal MQTT 3.1.1 broker ---
+
+def topic_matches(topic_filter, topic):
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts) or (part != "+" and part != topic_parts[index]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _mqtt_string(data, offset):
+    length = struct.unpack("!H", data[offset:offset + 2])[0]
+    return data[offset + 2:offset + 2 + length], offset + 2 + length
+
+
+class MQTTHandler(socketserver.BaseRequestHandler):
+    """One client session: CONNECT, (UN)SUBSCRIBE, PUBLISH QoS 0/1, PINGREQ and DISCONNECT."""
+
+    PACKET_NAMES = {1: "CONNECT", 3: "PUBLISH", 4: "PUBACK", 8: "SUBSCRIBE", 10: "UNSUBSCRIBE", 12: "PINGREQ", 14: "DISCONNECT"}
+
+    def _read_packet(self):
+        header = _recv_exact(self.request, 1)[0]
+        length, multiplier, wire = 0, 1, 1
+        while True:
+            byte = _recv_exact(self.request, 1)[0]
+            wire += 1
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return header, _recv_exact(self.request, length) if length else b"", wire + length
+
+    def send_packet(self, header, body=b""):
+        with self.send_lock:
+            self.request.sendall(bytes([header]) + _encode_length(len(body)) + body)
+
+    def deliver(self, topic, payload, retain=False):
+        body = struct.pack("!H", len(topic.encode())) + topic.encode() + payload
+        try:
+            self.send_packet(0x30 | (0x01 if retain else 0), body)
+        except OSError:
+            pass
+
+    def _handle_publish(self, header, body):
+        qos = (header >> 1) & 0x03
+        topic, offset = _mqtt_string(body, 0)
+        if qos:
+            self.send_packet(0x40, body[offset:offset + 2])
+            offset += 2
+        self.server.route(topic.decode(), body[offset:], bool(header & 0x01))
+        return f"mqtt PUBLISH {topic.decode()}"
+
+    def _handle_subscribe(self, body):
+        packet_id, offset, granted, filters = body[:2], 2, bytearray(), []
+        while offset < len(body):
+            topic_filter, offset = _mqtt_string(body, offset)
+            granted.append(min(body[offset], 1))
+            offset += 1
+            filters.append(topic_filter.decode())
+        self.subscriptions.update(filters)
+        self.send_packet(0x90, packet_id + bytes(granted))
+        for topic, payload in self.server.retained_for(filters):
+            self.deliver(topic, payload, retain=True)
+
+    def _handle_unsubscribe(self, body):
+        offset = 2
+        while offset < len(body):
+            topic_filter, offset = _mqtt_string(body, offset)
+            self.subscriptions.discard(topic_filter.decode())
+        self.send_packet(0xB0, body[:2])
+
+    def handle(self):
+        self.send_lock = threading.Lock()
+        self.subscriptions = set()
+        self.server.add_session(self)
+        try:
+            while True:
+                header, body, wire = self._read_packet()
+                kind = header >> 4
+                endpoint = f"mqtt {self.PACKET_NAMES.get(kind, kind)}"
+                if kind == 1:
+                    self.send_packet(0x20, b"\x00\x00")
+                elif kind == 3:
+                    endpoint = self._handle_publish(header, body)
+                elif kind == 8:
+                    self._handle_subscribe(body)
+                elif kind == 10:
+                    self._handle_unsubscribe(body)
+                elif kind == 12:
+                    self.send_packet(0xD0)
+                if self.server.ha:
+                    self.server.ha.record("mqtt", endpoint, wire, 0)
+                if kind == 14:
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.server.remove_session(self)
+
+
+class MQTTBroker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, ha=None):
+        super().__init__(address, MQTTHandler)
+        self.ha = ha
+        self.lock = threading.Lock()
+        self.sessions = []
+        self.retained = {}
+        self.messages = []
+
+    def add_session(self, session):
+        with self.lock:
+            self.sessions.append(session)
+
+    def remove_session(self, session):
+        with self.lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+
+    def retained_for(self, topic_filters):
+        with self.lock:
+            return [(topic, payload) for topic, payload in self.retained.items()
+                    if any(topic_matches(f, topic) for f in topic_filters)]
+
+    def route(self, topic, payload, retain=False):
+        """Stores (if retained) and forwards a message to every matching subscriber."""
+        with self.lock:
+            self.messages.append((time.monotonic(), topic, payload, retain))
+            if retain:
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+            targets = [s for s in self.sessions if any(topic_matches(f, topic) for f in s.subscriptions)]
+        for session in targets:
+            session.deliver(topic, payload)
+
+    def publish(self, topic, payload, retain=False):
+        """Publishes from 'outside' the add-on, e.g. HA's birth message or an automation's command."""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.route(topic, payload, retain)
+
+    def drop_connections(self):
+        with self.lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            try:
+                session.request.shutdown(2)
+                session.request.close()
+            except OSError:
+                pass
+
+
+def start_mqtt_broker(ha=None, host="127.0.0.1", port=0):
+    """Starts the stub broker on a background thread and returns it. Pass `ha` to log client packets as traffic."""
+    broker = MQTTBroker((host, port), ha)
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+    return broker
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--mqtt-port", type=int, default=1883, help="0 disables the broker")
+    parser.add_argument("--token", default="standin-token")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every HA call")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of HA calls that fail with 503")
+    args = parser.parse_args()
+    ha = FakeHA(args.token, args.latency, args.fail_rate)
+    if args.mqtt_port:
+        start_mqtt_broker(ha, args.host, args.mqtt_port)
+        print(f"MQTT broker on {args.host}:{args.mqtt_port}")
+    server = HAServer((args.host, args.port), ha)
+    print(f"HA stand-in on http://{args.host}:{args.port} (WebSocket at /api/websocket, token {args.token!r})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()